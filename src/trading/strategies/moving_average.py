@@ -1,51 +1,141 @@
+import time
+from collections import deque
+from typing import Optional
 
+import pandas as pd
+import matplotlib.pyplot as plt
+from ib_insync import Stock
+
+from app.src.connection.ibkr_connector import IBKRConnection
+from app.src.trading.strategies.strategy import Strategies
 
 
 class MovingAverageStrategy(Strategies):
-    def __init__(self, conn: IBKRConnection, symbol: str, fast_period: int = 10, slow_period: int = 30):
+    def __init__(self, conn: IBKRConnection, symbol: str, fast_period: int = 10, slow_period: int = 30,
+                 bar_cache=None, position_book=None):
         # Pass the connection object to the parent constructor
-        super().__init__(conn=conn)
+        super().__init__(conn=conn, bar_cache=bar_cache, position_book=position_book)
         self.symbol = symbol
         self.fast_period = fast_period
         self.slow_period = slow_period
         self.contract = Stock(symbol, 'SMART', 'USD')
+        
+        # Rolling state, so analyze_data only has to look at bars it hasn't seen yet.
+        # One close more than the longest window is kept, so the newest bar can be
+        # taken back when IBKR sends it again (a bar still forming on the last call).
+        self._closes = deque(maxlen=max(fast_period, slow_period) + 1)
+        self._count = 0                 # Bars processed so far
+        self._fast_sum = 0.0
+        self._slow_sum = 0.0
+        self._last_mas = (float('nan'), float('nan'))   # (fast, slow) SMA of the newest bar ...
+        self._prev_mas = (float('nan'), float('nan'))   # ... and of the bar before it
+        self._last_date = None
+        self._last_in_output = False    # Whether the newest bar made it into self.df
+        self._last_fetch = None         # time.time() of the last run_strategy download
         print(f"Moving Average Strategy initialized for {symbol} ({fast_period}/{slow_period} periods).")
 
+    @property
+    def df(self):
+        """Analysed bars so far (SMA columns, Signal, signal prices); new rows are concatenated on first access."""
+        if len(self._chunks) > 1:
+            self._chunks = [pd.concat(self._chunks, ignore_index='date' in self._chunks[0].columns)]
+        return self._chunks[0] if self._chunks else None
+
+    @df.setter
+    def df(self, value):
+        self._chunks = [] if value is None else [value]
+
+    def _push(self, close):
+        """Adds one close to the running sums; returns the (fast, slow) SMAs, NaN until their window is full."""
+        closes = self._closes
+        closes.append(close)
+        self._count += 1
+        self._fast_sum += close
+        self._slow_sum += close
+        if self._count > self.fast_period:
+            self._fast_sum -= closes[-self.fast_period - 1]
+        if self._count > self.slow_period:
+            self._slow_sum -= closes[-self.slow_period - 1]
+        fast = self._fast_sum / self.fast_period if self._count >= self.fast_period else float('nan')
+        slow = self._slow_sum / self.slow_period if self._count >= self.slow_period else float('nan')
+        self._prev_mas, self._last_mas = self._last_mas, (fast, slow)
+        return fast, slow
+
+    def _pop(self):
+        """Takes the newest close back out of the running sums (it is about to be replaced)."""
+        closes = self._closes
+        close = closes.pop()
+        self._count -= 1
+        self._fast_sum -= close
+        self._slow_sum -= close
+        # The closes that left the windows when it came in are the ones now at the window edges
+        if self._count >= self.fast_period:
+            self._fast_sum += closes[-self.fast_period]
+        if self._count >= self.slow_period:
+            self._slow_sum += closes[-self.slow_period]
+        self._last_mas = self._prev_mas
+        if self._last_in_output:
+            self._chunks[-1] = self._chunks[-1].iloc[:-1]
+
+    def _new_bars(self, df: pd.DataFrame) -> pd.DataFrame:
+        """The rows of df from the last processed bar on (it may have been revised)."""
+        if self._last_date is None:
+            return df
+        dates = df['date'] if 'date' in df.columns else df.index.to_series()
+        start = dates.searchsorted(self._last_date, side='left')
+        # Positional: df may be a slice of a longer frame, so its labels needn't start at 0
+        if start < len(df) and dates.iloc[start] == self._last_date:
+            self._pop()     # Re-sent: replace our copy of that bar
+        return df.iloc[start:]
+
     def analyze_data(self, df: pd.DataFrame) -> Optional[str]:
-        """Calculates MAs and generates a trade signal."""
-        ib = self._conn.get_ib()
+        """
+        Updates the MAs with the bars that arrived since the last call and generates
+        a trade signal. `df` may hold just the new bars or the whole history again;
+        bars already seen are skipped, so the work is O(new bars). df is not modified.
+        """
         if df is None or df.empty:
             return None
-
-        # 1. Calculate Moving Averages on the closing price
-        df[f'SMA_{self.fast_period}'] = df['close'].rolling(self.fast_period).mean()
-        df[f'SMA_{self.slow_period}'] = df['close'].rolling(self.slow_period).mean()
-        
-        # Drop initial rows where MAs are NaN
-        df.dropna(inplace=True) 
-
-        if df.empty:
+        new = self._new_bars(df)
+        if new.empty:
             return None
 
-        df['Signal'] = 0
+        # 1. Roll the moving averages forward over the new closes
+        fast_sma = []
+        slow_sma = []
+        signals = []
+        for close in new['close'].to_numpy(dtype=float):
+            prev_fast, prev_slow = self._last_mas
+            fast, slow = self._push(close)
+            fast_sma.append(fast)
+            slow_sma.append(slow)
+            # Fast crosses above slow -> 1, below -> -1 (NaN comparisons are False during warm-up)
+            if fast > slow and prev_fast < prev_slow:
+                signals.append(1)
+            elif fast < slow and prev_fast > prev_slow:
+                signals.append(-1)
+            else:
+                signals.append(0)
+        self._last_date = new['date'].iloc[-1] if 'date' in new.columns else new.index[-1]
 
-        # When 20-day SMA crosses above 50-day SMA
-        df.loc[(df[f'SMA_{self.fast_period}'] > df[f'SMA_{self.slow_period}']) & (df[f'SMA_{self.fast_period}'].shift(1) < df[f'SMA_{self.slow_period}'].shift(1)), 'Signal'] = 1
-        # When 20-day SMA crosses below 50-day SMA
-        df.loc[(df[f'SMA_{self.fast_period}'] < df[f'SMA_{self.slow_period}']) & (df[f'SMA_{self.fast_period}'].shift(1) > df[f'SMA_{self.slow_period}'].shift(1)), 'Signal'] = -1
+        # Our own rows for the new bars; the caller's frame is left alone
+        rows = new.assign(**{f'SMA_{self.fast_period}': fast_sma, f'SMA_{self.slow_period}': slow_sma,
+                             'Signal': signals})
+        # Drop initial rows where MAs are NaN
+        rows = rows.dropna()
+        self._last_in_output = len(rows) > 0 and rows.index[-1] == new.index[-1]
+        if len(rows):
+            rows['Buy_Signal_Price'] = rows['close'].where(rows['Signal'] == 1)
+            rows['Sell_Signal_Price'] = rows['close'].where(rows['Signal'] == -1)
+            self._chunks.append(rows)
 
-        # Create columns for plotting buy and sell signals at the close price
-        df['Buy_Signal_Price'] = df.loc[df['Signal'] == 1, 'close']
-        df['Sell_Signal_Price'] = df.loc[df['Signal'] == -1, 'close']
+        last_fast, last_slow = self._last_mas
+        if not last_slow == last_slow or not last_fast == last_fast:
+            return None     # Not enough bars for the MAs yet
 
         # 2. Determine Signal (based on the last complete bar)
-        last_fast = df[f'SMA_{self.fast_period}'].iloc[-1]
-        last_slow = df[f'SMA_{self.slow_period}'].iloc[-1]
-        
-        # Check current position (simplified check)
-        # Note: A real implementation would need to monitor the portfolio continuously.
-        portfolio = ib.portfolio()
-        current_position = next((item.position for item in portfolio if item.contract.symbol == self.symbol), 0)
+        # Check current position: an O(1) lookup when a position book was given
+        current_position = self.current_position(self.symbol)
 
         signal = None
         if last_fast > last_slow and current_position <= 0:
@@ -56,7 +146,6 @@ class MovingAverageStrategy(Strategies):
             signal = 'SELL'
             
         print(f"Analysis: Fast MA: {last_fast:.2f}, Slow MA: {last_slow:.2f}, Signal: {signal}")
-        self.df = df
         return signal
 
     def plot_signals(self, df: pd.DataFrame):
@@ -87,16 +176,22 @@ class MovingAverageStrategy(Strategies):
     def run_strategy(self):
         """Main execution method for the strategy."""
         
-        # 1. Get the necessary historical data
+        # 1. Get the necessary historical data: 60 days the first time, afterwards
+        # only the days since the last run (analyze_data keeps the rest)
+        if self._last_fetch is None:
+            duration = "60 D"
+        else:
+            duration = f"{int((time.time() - self._last_fetch) // 86400) + 2} D"
         data = self.get_data(
             self.contract, 
-            durationStr="60 D", 
+            durationStr=duration, 
             barSizeSetting="1 hour"
         )
         
         if data is None:
             print("Could not retrieve data. Strategy halted.")
             return
+        self._last_fetch = time.time()
 
         # 2. Analyze the data and get a signal
         signal = self.analyze_data(data)
@@ -122,4 +217,64 @@ class MovingAverageStrategy(Strategies):
         plt.plot(df['date'], df['Asset_Return'], label='Asset Return', color='blue')
         plt.plot(df['date'], df['Strategy_Return'], label='Strategy Return', color='orange')
         plt.title('Strategy vs Asset Return')
-        return df
\ No newline at end of file
+        return df
+
+if __name__ == "__main__":
+    # analyze_data fed the whole frame, then slices, then overlapping re-sends must give the
+    # rows the original full-frame computation gives (rolling() means, crossover Signal)
+    import numpy as np
+
+    class _OfflineConnection:
+        """Stands in for IBKRConnection: no gateway, no positions."""
+        class _IB:
+            def portfolio(self):
+                return []
+
+        def get_ib(self):
+            return self._IB()
+
+    def full_frame(df, fast, slow):
+        """The previous analyze_data's columns, computed on a copy of the whole frame."""
+        df = df.copy()
+        df[f'SMA_{fast}'] = df['close'].rolling(fast).mean()
+        df[f'SMA_{slow}'] = df['close'].rolling(slow).mean()
+        df.dropna(inplace=True)
+        fast_sma, slow_sma = df[f'SMA_{fast}'], df[f'SMA_{slow}']
+        df['Signal'] = 0
+        df.loc[(fast_sma > slow_sma) & (fast_sma.shift(1) < slow_sma.shift(1)), 'Signal'] = 1
+        df.loc[(fast_sma < slow_sma) & (fast_sma.shift(1) > slow_sma.shift(1)), 'Signal'] = -1
+        return df
+
+    def check(name, frames, expected_bars, fast=10, slow=30):
+        strategy = MovingAverageStrategy(_OfflineConnection(), 'AAPL', fast, slow)
+        signals = [strategy.analyze_data(frame) for frame in frames]
+        expected = full_frame(expected_bars, fast, slow)
+        ours = strategy.df
+        dates = (lambda df: df['date'].to_numpy() if 'date' in df.columns else df.index.to_numpy())
+        if not np.array_equal(dates(ours), dates(expected)):
+            raise AssertionError(f"{name}: rows differ from the full-frame computation")
+        for column in ('close', f'SMA_{fast}', f'SMA_{slow}', 'Signal'):
+            if not np.allclose(ours[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float), rtol=1e-9):
+                raise AssertionError(f"{name}: {column} differs from the full-frame computation")
+        last = expected.iloc[-1]
+        wanted = 'BUY' if last[f'SMA_{fast}'] > last[f'SMA_{slow}'] else 'SELL' if last[f'SMA_{fast}'] < last[f'SMA_{slow}'] else None
+        if wanted == 'SELL':
+            wanted = None       # Nothing held, so nothing to sell
+        if signals[-1] != wanted:
+            raise AssertionError(f"{name}: signal {signals[-1]}, expected {wanted}")
+        print(f"{name}: {len(ours)} rows match the full-frame computation")
+
+    n = 400
+    rng = np.random.default_rng(0)
+    bars = pd.DataFrame({'date': pd.date_range('2024-01-02 09:30', periods=n, freq='h'),
+                         'close': 150 + np.cumsum(rng.normal(0, 1, n))})
+    revised = bars.copy()
+    revised.loc[79, 'close'] += 0.5     # Bar 79 was still forming on the first call
+
+    check("full frame", [bars], bars)
+    check("sliced", [bars.iloc[:80], bars.iloc[80:200], bars.iloc[200:]], bars)
+    check("overlapping", [bars.iloc[:80], revised.iloc[79:]], revised)
+    check("overlapping, whole history again", [bars.iloc[:80], bars.iloc[:200], bars], bars)
+    check("gap", [bars.iloc[:80], bars.iloc[85:]], pd.concat([bars.iloc[:80], bars.iloc[85:]]))
+    check("index dates", [bars.set_index('date').iloc[:80], bars.set_index('date').iloc[79:]],
+          bars.set_index('date'))
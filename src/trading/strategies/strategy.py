@@ -13,8 +13,14 @@ load_dotenv()
 from ib_insync import Stock, MarketOrder, IB, util, Trade
 
 class Strategies():
-    def __init__(self, conn):
+    def __init__(self, conn, bar_cache=None, position_book=None):
         self._conn = conn
+        # Optional local bar cache (anything with get_data(ib, contract, durationStr, barSizeSetting, whatToShow)),
+        # e.g. BarCache from the trading system, so repeated runs don't re-download history
+        self.bar_cache = bar_cache
+        # Optional position book (anything with position(symbol)), e.g. PositionBook from the
+        # trading system, kept current by IBKR's events instead of scanning ib.portfolio()
+        self.position_book = position_book
         self.df = None
         print(f"Strategy base class initialized. {type(conn.get_ib())}")
         pass
@@ -40,6 +46,8 @@ class Strategies():
             raise ValueError(f"Invalid barSizeSetting option. Choose from {barSizeSetting_options}")
         try:
             ib = self._conn.get_ib()
+            if self.bar_cache is not None:
+                return self.bar_cache.get_data(ib, contract, durationStr, barSizeSetting, whatToShow)
             ib.qualifyContracts(contract)
             bars = ib.reqHistoricalData(
                 contract,
@@ -79,6 +87,13 @@ class Strategies():
             
         return trade
     
+    def current_position(self, symbol: str) -> float:
+        """Shares held in symbol: from the position book when there is one, else by scanning ib.portfolio()."""
+        if self.position_book is not None:
+            return self.position_book.position(symbol)
+        portfolio = self._conn.get_ib().portfolio()
+        return next((item.position for item in portfolio if item.contract.symbol == symbol), 0)
+
     def calculate_pnl(self, action: str, quantity: int, fill_price: float, current_price: float) -> float:
         """
         Calculate profit/loss for a single position.
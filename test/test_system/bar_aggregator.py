@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+from bars import ColumnarBars
+from bar_cache import parse_bar_size
+
+
+def parse_timeframe(timeframe) -> int:
+    """
+    Bar length in nanoseconds. Accepts IB bar sizes ('5 mins', '1 hour', '1 day'),
+    pandas-style strings ('5min', '1h', '1D') or a Timedelta.
+    """
+    if isinstance(timeframe, str) and ' ' in timeframe.strip():
+        return parse_bar_size(timeframe).value
+    return pd.Timedelta(timeframe).value
+
+
+def _wall_clock(timestamps: np.ndarray, tz) -> np.ndarray:
+    """UTC nanoseconds -> local wall-clock nanoseconds, so buckets follow the exchange's clock."""
+    if tz is None:
+        return timestamps
+    local = pd.DatetimeIndex(timestamps.view('datetime64[ns]')).tz_localize('UTC').tz_convert(tz).tz_localize(None)
+    return local.values.astype('datetime64[ns]').view(np.int64)
+
+
+def _from_wall_clock(local: np.ndarray, tz, utc=None, utc_local=None) -> np.ndarray:
+    """
+    Local wall-clock nanoseconds -> UTC. A time that occurs twice (the hour repeated
+    when clocks go back) takes the UTC offset of a bar in its bucket: `utc` and
+    `utc_local` are that bar's UTC and wall-clock times, one per label.
+    """
+    if tz is None:
+        return local
+    index = pd.DatetimeIndex(local.view('datetime64[ns]')).tz_localize(tz, ambiguous='NaT', nonexistent='shift_forward')
+    result = index.tz_convert('UTC').values.astype('datetime64[ns]').view(np.int64).copy()
+    ambiguous = index.isna()
+    if ambiguous.any():
+        result[ambiguous] = utc[ambiguous] - (utc_local[ambiguous] - local[ambiguous])
+    return result
+
+
+def _is_repeated(local: np.ndarray, tz) -> np.ndarray:
+    """Whether each wall-clock time falls in the hour repeated when clocks go back."""
+    return pd.DatetimeIndex(local.view('datetime64[ns]')).tz_localize(
+        tz, ambiguous='NaT', nonexistent='shift_forward').isna()
+
+
+def resample_bars(bars: ColumnarBars, timeframe, offset=None) -> ColumnarBars:
+    """
+    Vectorized batch aggregation of fine bars (e.g. 1 min) into `timeframe` bars.
+    Bars are labelled by the start of their bucket, like IB does. Buckets follow
+    the bars' own timezone, and `offset` shifts the grid (e.g. '30min' for 9:30 opens).
+    Input must be sorted by time.
+    """
+    period = parse_timeframe(timeframe)
+    shift = pd.Timedelta(offset).value if offset is not None else 0
+    if len(bars) == 0:
+        return ColumnarBars(bars.timestamps[:0], *(np.zeros(0),) * 5, tz=bars.tz, is_datetime=bars.is_datetime)
+
+    tz = bars.tz if bars.is_datetime else None
+    local = _wall_clock(bars.timestamps, tz)
+    buckets = (local - shift) // period
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    if tz is not None:
+        # A bucket starting in the repeated hour (e.g. 1:00 hourly bars on the day clocks go
+        # back) happens twice: start a second bar where the wall clock jumps back into it
+        back = np.flatnonzero((buckets[1:] == buckets[:-1]) & (local[1:] < local[:-1])) + 1
+        back = back[_is_repeated(buckets[back] * period + shift, tz)]
+        if len(back):
+            starts = np.union1d(starts, back)
+    ends = np.r_[starts[1:], len(buckets)] - 1
+
+    labels = buckets[starts] * period + shift
+    return ColumnarBars(
+        _from_wall_clock(labels, tz, bars.timestamps[starts], local[starts]),
+        bars.open[starts],
+        np.maximum.reduceat(bars.high, starts),
+        np.minimum.reduceat(bars.low, starts),
+        bars.close[ends],
+        np.add.reduceat(bars.volume, starts),
+        tz=bars.tz,
+        is_datetime=bars.is_datetime,
+    )
+
+
+class BarAggregator:
+    """
+    Incremental version of resample_bars() for live feeds.
+    Feed it fine bars (update) or trades (update_tick); whenever the first update
+    of a new bucket arrives, the finished bar is returned as
+    (timestamp, open, high, low, close, volume), otherwise None.
+    """
+    def __init__(self, timeframe, tz=None, offset=None):
+        self.period = parse_timeframe(timeframe)
+        self.shift = pd.Timedelta(offset).value if offset is not None else 0
+        self.tz = tz
+        self.bucket = None
+        self.current = None     # [timestamp, open, high, low, close, volume] of the forming bar
+        self._last_local = None # Wall-clock time of the last update, to spot clocks going back
+
+    def _local(self, timestamp):
+        if self.tz is None:
+            return timestamp
+        return int(_wall_clock(np.array([timestamp], dtype=np.int64), self.tz)[0])
+
+    def _bucket_of(self, timestamp):
+        return (self._local(timestamp) - self.shift) // self.period
+
+    def _label(self, bucket, timestamp, local):
+        start = np.array([bucket * self.period + self.shift], dtype=np.int64)
+        return int(_from_wall_clock(start, self.tz, np.array([timestamp]), np.array([local]))[0])
+
+    def update(self, timestamp, open, high, low, close, volume=0.0):
+        """Adds one fine bar; returns the completed coarse bar, if this update closed one."""
+        local = self._local(timestamp)
+        bucket = (local - self.shift) // self.period
+        if bucket == self.bucket and not (
+                self.tz is not None and self._last_local is not None and local < self._last_local
+                and _is_repeated(np.array([bucket * self.period + self.shift]), self.tz)[0]):
+            bar = self.current
+            bar[2] = max(bar[2], high)
+            bar[3] = min(bar[3], low)
+            bar[4] = close
+            bar[5] += volume
+            self._last_local = local
+            return None
+
+        finished = self.flush()
+        self.bucket = bucket
+        self._last_local = local
+        self.current = [self._label(bucket, timestamp, local), open, high, low, close, volume]
+        return finished
+
+    def update_tick(self, timestamp, price, size=0.0):
+        """Adds one trade print."""
+        return self.update(timestamp, price, price, price, price, size)
+
+    def flush(self):
+        """Returns the forming bar as if it were complete (e.g. at end of session) and resets."""
+        finished = tuple(self.current) if self.current is not None else None
+        self.current = None
+        self.bucket = None
+        self._last_local = None
+        return finished
+
+
+if __name__ == "__main__":
+    # The day clocks go back, 1:00-2:00 happens twice: each pass must get its own bars, labelled in UTC
+    minutes = pd.date_range('2024-11-03 04:00', '2024-11-03 08:00', freq='1min', inclusive='left', tz='UTC')
+    prices = np.arange(len(minutes), dtype=np.float64)
+    fine = ColumnarBars.from_frame(pd.DataFrame(
+        {'open': prices, 'high': prices, 'low': prices, 'close': prices, 'volume': 1.0},
+        index=minutes.tz_convert('US/Eastern')))
+
+    for timeframe, expected in (('5min', 48), ('1h', 4)):
+        batch = resample_bars(fine, timeframe)
+        aggregator = BarAggregator(timeframe, tz=fine.tz)
+        live = [bar for ts, p in zip(fine.timestamps, prices) if (bar := aggregator.update(ts, p, p, p, p, 1.0))]
+        live.append(aggregator.flush())
+
+        if len(batch) != expected or np.any(np.diff(batch.timestamps) <= 0):
+            raise AssertionError(f"{timeframe}: {len(batch)} bars, labels not strictly increasing")
+        if not np.array_equal(batch.timestamps, fine.timestamps[::len(fine) // expected]):
+            raise AssertionError(f"{timeframe}: labels are not the bucket starts in UTC")
+        if not np.array_equal(batch.volume, np.full(expected, len(fine) // expected)):
+            raise AssertionError(f"{timeframe}: bars don't hold one bucket each")
+        if [bar[0] for bar in live] != batch.timestamps.tolist() or [bar[4] for bar in live] != batch.close.tolist():
+            raise AssertionError(f"{timeframe}: BarAggregator disagrees with resample_bars")
+        print(f"{timeframe}: {len(batch)} bars across the fall-back hour")
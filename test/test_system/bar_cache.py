@@ -0,0 +1,244 @@
+import os
+import math
+import datetime
+
+import numpy as np
+import pandas as pd
+from ib_insync import util
+
+from contract_cache import ContractCache, contract_key
+
+# IB duration units -> length (months/years are approximated, IB does the same for pacing)
+_DURATION_UNITS = {
+    'S': pd.Timedelta(seconds=1),
+    'D': pd.Timedelta(days=1),
+    'W': pd.Timedelta(weeks=1),
+    'M': pd.Timedelta(days=30),
+    'Y': pd.Timedelta(days=365),
+}
+
+_BAR_SIZE_UNITS = {
+    'sec': pd.Timedelta(seconds=1),
+    'min': pd.Timedelta(minutes=1),
+    'hour': pd.Timedelta(hours=1),
+    'day': pd.Timedelta(days=1),
+    'week': pd.Timedelta(weeks=1),
+    'month': pd.Timedelta(days=30),
+}
+
+
+def parse_duration(durationStr: str) -> pd.Timedelta:
+    """'60 D' -> Timedelta(days=60)"""
+    value, unit = durationStr.split()
+    return int(value) * _DURATION_UNITS[unit.upper()]
+
+
+def format_duration(span: pd.Timedelta) -> str:
+    """Smallest IB durationStr that covers `span` (IB wants whole units)."""
+    seconds = max(1, math.ceil(span.total_seconds()))
+    if seconds <= 86400:
+        return f"{seconds} S"
+    days = math.ceil(seconds / 86400)
+    if days <= 365:
+        return f"{days} D"
+    return f"{math.ceil(days / 365)} Y"
+
+
+def parse_bar_size(barSizeSetting: str) -> pd.Timedelta:
+    """'1 hour' -> Timedelta(hours=1), '5 mins' -> Timedelta(minutes=5)"""
+    value, unit = barSizeSetting.split()
+    return int(value) * _BAR_SIZE_UNITS[unit.rstrip('s')]
+
+
+def _utc_ns(dates: pd.Series) -> np.ndarray:
+    """
+    Bar dates as int64 UTC nanoseconds. Naive dates (daily bars are plain dates) are
+    stored by their face value, i.e. as UTC, so the cache never depends on the host's zone.
+    """
+    dates = pd.Series(dates)
+    first = dates.iloc[0] if len(dates) else None
+    if isinstance(first, datetime.datetime) and first.tzinfo is not None:
+        times = pd.DatetimeIndex(pd.to_datetime(dates, utc=True))
+    else:
+        times = pd.DatetimeIndex(pd.to_datetime(dates)).tz_localize('UTC')
+    return times.values.astype('datetime64[ns]').view(np.int64)
+
+
+def _is_daily(dates: pd.Series) -> bool:
+    """IB returns plain dates (no time of day) for daily and coarser bars."""
+    return len(dates) > 0 and not isinstance(dates.iloc[0], (datetime.datetime, pd.Timestamp))
+
+
+def _tz_name(tz) -> str:
+    """IANA name of a timezone, or '' for naive dates (never an abbreviation like 'PDT')."""
+    if tz is None:
+        return ''
+    name = getattr(tz, 'key', None) or getattr(tz, 'zone', None) or str(tz)
+    try:
+        pd.Timestamp(0, tz='UTC').tz_convert(name)
+    except Exception:
+        # A fixed offset or host-local tzinfo: the UTC instants are all the cache needs
+        return 'UTC'
+    return name
+
+
+def _from_utc_ns(values: np.ndarray, tz: str, daily: bool) -> pd.Series:
+    dates = pd.to_datetime(values, utc=True)
+    dates = dates.tz_convert(tz) if tz else dates.tz_localize(None)
+    return pd.Series(dates.date if daily else dates)
+
+
+class BarCache:
+    """
+    Persistent local cache of historical bars in front of reqHistoricalData.
+    One raw NumPy (.npz) file per (contract, barSizeSetting, whatToShow, useRTH).
+    Only the head/tail ranges the cache does not cover yet are requested from IB
+    and merged in, so repeated backtests load straight from disk.
+    """
+    def __init__(self, cache_dir: str = os.getenv("IB_BAR_CACHE_DIR", ".bar_cache")):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, contract, barSizeSetting, whatToShow, useRTH) -> str:
+        name = f"{contract_key(contract)}__{barSizeSetting.replace(' ', '')}__{whatToShow}__rth{int(useRTH)}.npz"
+        return os.path.join(self.cache_dir, name)
+
+    def load(self, path):
+        """Returns (DataFrame, covered_start, covered_end) or None if nothing is cached."""
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as stored:
+            covered_start = pd.Timestamp(int(stored['_covered'][0]), tz='UTC')
+            covered_end = pd.Timestamp(int(stored['_covered'][1]), tz='UTC')
+            # Entries written before IANA names were enforced may hold an abbreviation
+            tz = _tz_name(str(stored['_tz']) or None)
+            daily = bool(stored['_daily'])
+            columns = {name: stored[name] for name in stored.files if not name.startswith('_')}
+
+        df = pd.DataFrame({'date': _from_utc_ns(columns.pop('date'), tz, daily), **columns})
+        return df, covered_start, covered_end
+
+    def save(self, path, df: pd.DataFrame, covered_start, covered_end):
+        dates = df['date']
+        daily = _is_daily(dates)
+        tz = self._tz_of(dates)
+        columns = {name: df[name].to_numpy() for name in df.columns if name != 'date'}
+
+        # Write to a temp file first so a crash never leaves a half-written cache entry
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path,
+                 date=_utc_ns(dates) if len(dates) else np.zeros(0, dtype=np.int64),
+                 _covered=np.array([covered_start.value, covered_end.value], dtype=np.int64),
+                 _tz=np.array(tz), _daily=np.array(daily),
+                 **columns)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _tz_of(dates: pd.Series) -> str:
+        tz = pd.DatetimeIndex(pd.to_datetime(pd.Series(dates))).tz if len(dates) else None
+        return _tz_name(tz)
+
+    def _request(self, ib, contract, endDateTime, span, barSizeSetting, whatToShow, useRTH):
+        bars = ib.reqHistoricalData(
+            contract,
+            endDateTime=endDateTime,
+            durationStr=format_duration(span),
+            barSizeSetting=barSizeSetting,
+            whatToShow=whatToShow,
+            useRTH=useRTH,
+            formatDate=1
+        )
+        return util.df(bars)
+
+    def get_data(self, ib, contract, durationStr="60 D", barSizeSetting="1 hour",
+                 whatToShow="TRADES", useRTH=True):
+        """
+        Same result as reqHistoricalData(endDateTime='', durationStr=...) as a DataFrame,
+        served from disk whenever the cached range already covers the request.
+        """
+        path = self.path_for(contract, barSizeSetting, whatToShow, useRTH)
+        end = pd.Timestamp.now(tz='UTC')
+        start = end - parse_duration(durationStr)
+        cached = self.load(path)
+
+        if cached is None:
+            contract = ContractCache(ib).qualify(contract)
+            df = self._request(ib, contract, '', end - start, barSizeSetting, whatToShow, useRTH)
+            if df is None:
+                return None
+            # Same date representation as a warm load from disk
+            df['date'] = _from_utc_ns(_utc_ns(df['date']), self._tz_of(df['date']), _is_daily(df['date']))
+            covered_start, covered_end = start, end
+        else:
+            df, covered_start, covered_end = cached
+            frames = [df]
+            try:
+                head_missing = start < covered_start
+                # The last cached bar may have been incomplete, so the tail is re-read from it
+                tail_missing = end - covered_end >= parse_bar_size(barSizeSetting)
+                if head_missing or tail_missing:
+                    contract = ContractCache(ib).qualify(contract)
+                if head_missing:
+                    head = self._request(ib, contract, covered_start.to_pydatetime(), covered_start - start,
+                                         barSizeSetting, whatToShow, useRTH)
+                    frames.insert(0, head)
+                    covered_start = start
+                if tail_missing:
+                    last_bar = pd.Timestamp(int(_utc_ns(df['date'])[-1]), tz='UTC') if len(df) else covered_end
+                    tail_start = min(covered_end, last_bar)
+                    tail = self._request(ib, contract, '', end - tail_start,
+                                         barSizeSetting, whatToShow, useRTH)
+                    frames.append(tail)
+                    covered_end = end
+            except Exception as e:
+                # Gateway down or pacing error: serve what we have rather than nothing
+                print(f"Bar cache refresh failed, using cached data only: {e}")
+                frames = [df]
+                covered_start, covered_end = cached[1], cached[2]
+
+            if len(frames) > 1:
+                frames = [f for f in frames if f is not None and not f.empty]
+                df = pd.concat(frames, ignore_index=True)
+                # Merge on the UTC instant; later downloads win, so a refreshed
+                # (now complete) tail bar replaces the cached one
+                cached_dates = cached[0]['date']
+                instants = _utc_ns(df['date'])
+                df['date'] = _from_utc_ns(instants, self._tz_of(cached_dates), _is_daily(cached_dates))
+                df['_instant'] = instants
+                df = df.drop_duplicates(subset='_instant', keep='last').sort_values('_instant', ignore_index=True)
+                df = df.drop(columns='_instant')
+
+        if cached is None or len(frames) > 1:
+            self.save(path, df, covered_start, covered_end)
+
+        # Only hand back the window that was asked for (bars that end after `start`)
+        if len(df):
+            bar_ends = _utc_ns(df['date']) + parse_bar_size(barSizeSetting).value
+            df = df[bar_ends > start.value].reset_index(drop=True)
+        return df
+
+
+if __name__ == "__main__":
+    # The cache must round-trip on hosts outside UTC (daily bars used to store the zone as 'PDT' etc.)
+    import tempfile
+    import time
+
+    os.environ['TZ'] = 'America/Los_Angeles'
+    time.tzset()
+
+    daily = pd.DataFrame({'date': [datetime.date(2024, 3, 8), datetime.date(2024, 3, 11)], 'close': [1.0, 2.0]})
+    intraday = pd.DataFrame({'date': pd.date_range('2024-03-08 09:30', periods=3, freq='h', tz='US/Eastern'),
+                             'close': [1.0, 2.0, 3.0]})
+    local = pd.DataFrame({'date': [datetime.datetime(2024, 3, 8, 9, 30, tzinfo=datetime.datetime.now().astimezone().tzinfo)],
+                          'close': [1.0]})
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = BarCache(cache_dir)
+        for name, df in (('daily', daily), ('intraday', intraday), ('host-local', local)):
+            path = os.path.join(cache_dir, f'{name}.npz')
+            cache.save(path, df, pd.Timestamp(0, tz='UTC'), pd.Timestamp.now(tz='UTC'))
+            loaded, _, _ = cache.load(path)
+            if not np.array_equal(_utc_ns(loaded['date']), _utc_ns(df['date'])):
+                raise AssertionError(f"{name}: dates changed in the cache")
+            if name == 'daily' and loaded['date'].tolist() != df['date'].tolist():
+                raise AssertionError(f"daily: {loaded['date'].tolist()}")
+            print(f"{name}: round-trips under TZ={os.environ['TZ']} (stored zone {cache._tz_of(df['date'])!r})")
@@ -0,0 +1,158 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from bars import ColumnarBars
+from bar_aggregator import resample_bars
+
+# On-disk record layout: 48 bytes per bar, little-endian, timestamps in UTC nanoseconds
+BAR_RECORD = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+# One sparse index entry per INDEX_STRIDE records
+INDEX_STRIDE = 1024
+
+
+class BarStore:
+    """
+    Append-only OHLCV storage engine.
+    Each (symbol, bar size) pair is one flat binary file of BAR_RECORD rows that
+    readers open with numpy.memmap, so many processes share a single copy of the
+    data through the OS page cache. A sidecar .idx file keeps every INDEX_STRIDE-th
+    timestamp for O(log n) range lookups without touching the whole file.
+
+    One writer per file is assumed; readers see appended bars after re-opening.
+    """
+    def __init__(self, root: str = os.getenv("BAR_STORE_DIR", ".bar_store")):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._last_timestamp = {}   # (symbol, bar_size) -> newest stored timestamp
+
+    def _paths(self, symbol, bar_size):
+        name = f"{symbol}__{bar_size.replace(' ', '')}"
+        base = os.path.join(self.root, name)
+        return base + '.bars', base + '.idx'
+
+    def count(self, symbol, bar_size) -> int:
+        """Number of complete records on disk (a torn trailing write is ignored)."""
+        data_path, _ = self._paths(symbol, bar_size)
+        if not os.path.exists(data_path):
+            return 0
+        return os.path.getsize(data_path) // BAR_RECORD.itemsize
+
+    def open(self, symbol, bar_size) -> np.ndarray:
+        """Read-only memmap over every stored record (structured BAR_RECORD array)."""
+        data_path, _ = self._paths(symbol, bar_size)
+        n = self.count(symbol, bar_size)
+        if n == 0:
+            return np.zeros(0, dtype=BAR_RECORD)
+        return np.memmap(data_path, dtype=BAR_RECORD, mode='r', shape=(n,))
+
+    def _load_index(self, symbol, bar_size, n) -> np.ndarray:
+        _, index_path = self._paths(symbol, bar_size)
+        expected = (n + INDEX_STRIDE - 1) // INDEX_STRIDE
+        index = np.fromfile(index_path, dtype='<i8') if os.path.exists(index_path) else np.zeros(0, dtype='<i8')
+        if len(index) != expected:
+            # Index lost or out of sync with the data (e.g. crash between the two writes): rebuild it
+            records = self.open(symbol, bar_size)
+            index = np.ascontiguousarray(records['timestamp'][::INDEX_STRIDE])
+            index.tofile(index_path)
+        return index
+
+    def append(self, symbol, bar_size, timestamps, open, high, low, close, volume=0.0) -> int:
+        """
+        Appends bars (scalars or equal-length arrays). Bars at or before the newest
+        stored timestamp are skipped, so re-sending an overlapping batch is harmless.
+        Returns the number of bars written.
+        """
+        records = np.zeros(np.size(timestamps), dtype=BAR_RECORD)
+        records['timestamp'] = timestamps
+        records['open'] = open
+        records['high'] = high
+        records['low'] = low
+        records['close'] = close
+        records['volume'] = volume
+        if len(records) > 1 and np.any(np.diff(records['timestamp']) <= 0):
+            raise ValueError("Bars must be appended in strictly increasing timestamp order.")
+
+        key = (symbol, bar_size)
+        n = self.count(symbol, bar_size)
+        if key not in self._last_timestamp:
+            self._last_timestamp[key] = int(self.open(symbol, bar_size)['timestamp'][-1]) if n else None
+        last = self._last_timestamp[key]
+        if last is not None:
+            records = records[records['timestamp'] > last]
+        if len(records) == 0:
+            return 0
+
+        data_path, index_path = self._paths(symbol, bar_size)
+        index = self._load_index(symbol, bar_size, n)
+        # (io.open because the `open` argument shadows the builtin here)
+        with io.open(data_path, 'r+b' if os.path.exists(data_path) else 'wb') as f:
+            # Truncate any torn record left by a crash, then append
+            f.truncate(n * BAR_RECORD.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(records.tobytes())
+
+        # Extend the sparse index for every record that lands on a stride boundary
+        positions = np.arange(n, n + len(records))
+        new_entries = records['timestamp'][positions % INDEX_STRIDE == 0]
+        if len(new_entries):
+            with io.open(index_path, 'ab') as f:
+                f.write(new_entries.astype('<i8').tobytes())
+
+        self._last_timestamp[key] = int(records['timestamp'][-1])
+        return len(records)
+
+    def append_frame(self, symbol, bar_size, bars: ColumnarBars) -> int:
+        return self.append(symbol, bar_size, bars.timestamps, bars.open, bars.high,
+                           bars.low, bars.close, bars.volume)
+
+    def locate(self, symbol, bar_size, timestamp, side='left') -> int:
+        """
+        Position of `timestamp` in the file (numpy.searchsorted semantics).
+        The sparse index narrows the search to one INDEX_STRIDE block first.
+        """
+        records = self.open(symbol, bar_size)
+        index = self._load_index(symbol, bar_size, len(records))
+        block = max(int(np.searchsorted(index, timestamp, side=side)) - 1, 0)
+        lo = block * INDEX_STRIDE
+        hi = min(lo + 2 * INDEX_STRIDE, len(records))
+        return lo + int(np.searchsorted(records['timestamp'][lo:hi], timestamp, side=side))
+
+    def read(self, symbol, bar_size, start=None, end=None, tz=None) -> ColumnarBars:
+        """
+        Bars with start <= timestamp < end (UTC nanoseconds or anything pandas can
+        turn into a Timestamp) as ColumnarBars backed directly by the memmap.
+        Nothing is copied until the columns are actually touched.
+        """
+        records = self.open(symbol, bar_size)
+        lo = 0 if start is None else self.locate(symbol, bar_size, _to_ns(start))
+        hi = len(records) if end is None else self.locate(symbol, bar_size, _to_ns(end))
+        window = records[lo:hi]
+        return ColumnarBars(window['timestamp'], window['open'], window['high'],
+                            window['low'], window['close'], window['volume'], tz=tz)
+
+    def read_resampled(self, symbol, bar_size, timeframe, start=None, end=None, tz=None, offset=None) -> ColumnarBars:
+        """
+        Serves any coarser timeframe from the stored fine bars (e.g. '1 hour' from '1 min'),
+        so only the finest granularity has to be downloaded and stored.
+        """
+        return resample_bars(self.read(symbol, bar_size, start, end, tz=tz), timeframe, offset=offset)
+
+
+def _to_ns(value) -> int:
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    timestamp = pd.Timestamp(value)
+    if timestamp.tz is None:
+        timestamp = timestamp.tz_localize('UTC')
+    return timestamp.value
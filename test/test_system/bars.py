@@ -0,0 +1,235 @@
+import numpy as np
+import pandas as pd
+
+# Price/volume columns every bar carries (timestamps are stored separately as int64)
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class Bar:
+    """
+    Lightweight, read-only view of a single bar inside a column store.
+    It behaves like the old bar dict (bar['close'], bar['datetime'],
+    bar.get('volume', 0)) but only holds an index into the arrays.
+    """
+    __slots__ = ('symbol', '_columns', '_index')
+
+    def __init__(self, symbol, columns, index):
+        self.symbol = symbol
+        self._columns = columns
+        self._index = index
+
+    def __getitem__(self, key):
+        if key == 'symbol':
+            return self.symbol
+        if key == 'datetime':
+            return self._columns.datetime_at(self._index)
+        return self._columns[key][self._index]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return ('symbol', 'datetime') + BAR_FIELDS
+
+    def row(self):
+        """(int64 timestamp, open, high, low, close, volume) straight from the arrays, without building a Timestamp."""
+        columns, i = self._columns, self._index
+        return (columns.timestamps[i], columns.open[i], columns.high[i],
+                columns.low[i], columns.close[i], columns.volume[i])
+
+    @property
+    def columns(self):
+        """The column store this bar lives in (for its tz / is_datetime)."""
+        return self._columns
+
+    def to_dict(self):
+        """Materializes the bar as a plain dict (e.g. for logging or pickling)."""
+        return {key: self[key] for key in self.keys()}
+
+    def __repr__(self):
+        return f"Bar({self.to_dict()})"
+
+
+class BarColumns:
+    """
+    Shared accessors for the column stores below. Subclasses hold int64 
+    'timestamps' (nanoseconds since the epoch, UTC) and float64 OHLCV arrays.
+    """
+    tz = None
+    # False when the source had no usable dates (e.g. a plain RangeIndex);
+    # 'datetime' then falls back to the raw index value like the old iterrows() loop.
+    is_datetime = True
+
+    def __getitem__(self, field):
+        if field == 'datetime':
+            return self._datetimes(self.timestamps)
+        if field in BAR_FIELDS:
+            return getattr(self, field)
+        raise KeyError(field)
+
+    def _datetimes(self, timestamps):
+        return timestamps.view('datetime64[ns]') if self.is_datetime else timestamps
+
+    def _window(self, start, end):
+        """Zero-copy views of rows [start, end) as a dict keyed like a bar."""
+        window = {'datetime': self._datetimes(self.timestamps[start:end])}
+        for field in BAR_FIELDS:
+            window[field] = getattr(self, field)[start:end]
+        return window
+
+    def datetime_at(self, i):
+        """Converts the stored int64 timestamp at position i back into a Timestamp."""
+        if self.is_datetime:
+            return pd.Timestamp(int(self.timestamps[i]), tz=self.tz)
+        return int(self.timestamps[i])
+
+    def bar(self, symbol, i):
+        return Bar(symbol, self, i)
+
+
+class ColumnarBars(BarColumns):
+    """
+    Column-oriented OHLCV history for one symbol.
+    Prices and volume are contiguous float64 arrays, so per-bar access 
+    is a plain array index.
+    """
+    def __init__(self, timestamps, open, high, low, close, volume=None, tz=None, is_datetime=True):
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        if volume is None:
+            volume = np.zeros(len(self.timestamps), dtype=np.float64)
+        self.volume = np.asarray(volume, dtype=np.float64)
+        self.tz = tz
+        self.is_datetime = is_datetime
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame):
+        """
+        Converts a DataFrame with 'open', 'high', 'low', 'close' (and optionally 'volume')
+        columns into contiguous arrays. The bar time is taken from a DatetimeIndex,
+        or from the 'date' column that ib_insync's util.df() produces.
+        """
+        index = df.index
+        tz = None
+        is_datetime = True
+        if isinstance(index, pd.DatetimeIndex):
+            times = index
+        elif 'date' in df.columns:
+            times = pd.DatetimeIndex(pd.to_datetime(df['date']))
+        else:
+            times = None
+            is_datetime = False
+
+        if times is not None:
+            tz = times.tz
+            timestamps = times.values.astype('datetime64[ns]').view(np.int64)
+        else:
+            timestamps = np.asarray(index, dtype=np.int64)
+
+        def column(name):
+            return np.ascontiguousarray(df[name].to_numpy(dtype=np.float64))
+
+        volume = column('volume') if 'volume' in df.columns else None
+        return cls(timestamps, column('open'), column('high'), column('low'), column('close'),
+                   volume, tz=tz, is_datetime=is_datetime)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def window(self, end, n):
+        """The n bars before position `end` (exclusive), as zero-copy views."""
+        return self._window(max(0, end - n), end)
+
+    def slice(self, start, end):
+        """Rows [start, end) as a ColumnarBars sharing this one's memory."""
+        return ColumnarBars(self.timestamps[start:end], self.open[start:end], self.high[start:end],
+                            self.low[start:end], self.close[start:end], self.volume[start:end],
+                            tz=self.tz, is_datetime=self.is_datetime)
+
+
+class BarRingBuffer(BarColumns):
+    """
+    Fixed-capacity OHLCV history for one symbol (used by the live handlers,
+    where bars keep arriving and must not accumulate forever).
+    Every value is written twice, at slot i and i + capacity, so the latest
+    n bars always form one contiguous slice and windows never need a copy.
+    """
+    def __init__(self, capacity: int, tz=None, is_datetime=True):
+        self.capacity = capacity
+        self.timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        for field in BAR_FIELDS:
+            setattr(self, field, np.zeros(2 * capacity, dtype=np.float64))
+        self.tz = tz
+        self.is_datetime = is_datetime
+        self._head = 0      # Next slot to write, in [0, capacity)
+        self._count = 0     # Number of valid bars, capped at capacity
+        self.appended = 0   # Bars ever appended (restores included), never capped
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, open, high, low, close, volume=0.0):
+        i = self._head
+        j = i + self.capacity
+        self.timestamps[i] = self.timestamps[j] = timestamp
+        self.open[i] = self.open[j] = open
+        self.high[i] = self.high[j] = high
+        self.low[i] = self.low[j] = low
+        self.close[i] = self.close[j] = close
+        self.volume[i] = self.volume[j] = volume
+        self._head = i + 1 if i + 1 < self.capacity else 0
+        if self._count < self.capacity:
+            self._count += 1
+        self.appended += 1
+
+    def latest_index(self):
+        """Array position of the newest bar (always in the upper copy), or None."""
+        if self._count == 0:
+            return None
+        # (_head - 1) wraps to the last slot right after a full lap
+        return (self._head - 1) % self.capacity + self.capacity
+
+    def snapshot(self) -> dict:
+        """Copies of the stored bars, oldest first (for EngineSnapshotter)."""
+        end = self._head + self.capacity
+        start = end - self._count
+        state = {field: getattr(self, field)[start:end].copy() for field in ('timestamps',) + BAR_FIELDS}
+        state['tz'] = self.tz
+        state['is_datetime'] = self.is_datetime
+        return state
+
+    def restore(self, state: dict):
+        """Replaces the contents with a snapshot() (keeping the newest `capacity` bars)."""
+        self._head = 0
+        self._count = 0
+        self.tz = state['tz']
+        self.is_datetime = state['is_datetime']
+        timestamps = state['timestamps'][-self.capacity:]
+        n = len(timestamps)
+        columns = [state[field][-self.capacity:] for field in BAR_FIELDS]
+        for target, values in zip([self.timestamps] + [getattr(self, f) for f in BAR_FIELDS], [timestamps] + columns):
+            target[:n] = values
+            target[self.capacity:self.capacity + n] = values
+        self._head = n % self.capacity
+        self._count = n
+        self.appended += n
+
+    def clear(self):
+        """Drops every bar (appended keeps counting, so get_new_bars() markers stay valid)."""
+        self._head = 0
+        self._count = 0
+
+    def window(self, n):
+        """
+        The latest n bars as zero-copy views, oldest first.
+        The views are only valid until the next append() wraps over them.
+        """
+        n = min(n, self._count)
+        end = self._head + self.capacity
+        return self._window(end - n, end)
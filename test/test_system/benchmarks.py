@@ -0,0 +1,425 @@
+"""
+Micro-benchmarks for the trading engine's hot paths.
+Run directly: python benchmarks.py
+"""
+import time
+import queue
+
+from events import EventQueue, MarketEvent, SignalEvent, OrderEvent, FillEvent
+from systems import TradingEngine
+
+
+class _NullComponent:
+    """Strategy/portfolio/execution stand-in that does nothing, so only engine overhead is timed."""
+    def calculate_signals(self, event): pass
+    def record_equity(self, event=None): pass
+    def update_signal(self, event): pass
+    def execute_order(self, event): pass
+    def update_fill(self, event): pass
+
+
+def _events(n):
+    signal = SignalEvent('bench', 'AAPL', None, 'LONG')
+    order = OrderEvent('AAPL', 'MKT', 10, 'BUY')
+    fill = FillEvent(None, 'AAPL', 'SIM', 10, 'BUY', 100.0)
+    market = MarketEvent(symbols=('AAPL',))
+    return [market, signal, order, fill] * (n // 4)
+
+
+def bench_engine_dispatch(n=1_000_000, repeats=5):
+    """
+    Per-event cost (enqueue + dequeue + dispatch) of the old if/elif + queue.Queue 
+    loop vs. the handler registry + EventQueue engine. Best of `repeats` runs each:
+    single runs swing by +-20% on a shared machine.
+    """
+    events = _events(n)
+    null = _NullComponent()
+
+    def legacy_loop():
+        # Old engine loop: locked queue.Queue, empty()/get() pairs and string comparisons
+        events_queue = queue.Queue()
+        for event in events:
+            events_queue.put(event)
+        while not events_queue.empty():
+            event = events_queue.get()
+            if event.type == 'MARKET':
+                null.calculate_signals(event)
+                null.record_equity()
+            elif event.type == 'SIGNAL':
+                null.update_signal(event)
+            elif event.type == 'ORDER':
+                null.execute_order(event)
+            elif event.type == 'FILL':
+                null.update_fill(event)
+
+    events_queue = EventQueue()
+    engine = TradingEngine(None, null, null, null, events_queue)
+
+    def registry_loop():
+        for event in events:
+            events_queue.put(event)
+        engine._drain()
+
+    def best(loop):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            loop()
+            timings.append(time.perf_counter() - start)
+        return min(timings) / len(events)
+
+    legacy = best(legacy_loop)
+    registry = best(registry_loop)
+    print(f"engine dispatch: legacy {legacy * 1e9:.0f} ns/event, "
+          f"registry {registry * 1e9:.0f} ns/event ({legacy / registry:.1f}x)")
+    return legacy, registry
+
+
+class _DictMarketEvent:
+    """The old MarketEvent: instance __dict__ and a string tag per event."""
+    def __init__(self, symbols=None):
+        self.type = 'MARKET'
+        self.symbols = symbols
+
+
+def bench_events(n=2_000_000, backlog=100_000):
+    """
+    MarketEvent cost per bar (allocate, queue, dispatch, drop) for the old dict-based
+    event and the slotted event, and the memory a backlog
+    of queued events holds (e.g. a burst on a multi-symbol live feed).
+    """
+    import tracemalloc
+
+    symbols = ('AAPL',)
+    factories = {
+        'dict': lambda: _DictMarketEvent(symbols),
+        'slots': lambda: MarketEvent(symbols),
+    }
+    for name, factory in factories.items():
+        events_queue = EventQueue()
+        start = time.perf_counter()
+        for _ in range(n):
+            events_queue.put(factory())
+            events_queue.popleft()
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        held = [factory() for _ in range(backlog)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del held
+        print(f"MarketEvent ({name}): {elapsed / n * 1e9:.0f} ns/bar, {size / backlog:.0f} bytes per queued event")
+
+
+def bench_vectorized_backtest(n=20_000):
+    """Event-driven vs. vectorized MovingAverageStrategy backtest on n random-walk bars."""
+    import numpy as np
+    import pandas as pd
+    from vectorized import backtest_moving_average, run_event_driven
+
+    prices = 150 + np.cumsum(np.random.default_rng(0).normal(0, 1, n))
+    data = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices},
+                        index=pd.date_range('2023-01-01', periods=n, freq='h'))
+
+    start = time.perf_counter()
+    run_event_driven(data)
+    event_driven = time.perf_counter() - start
+
+    start = time.perf_counter()
+    backtest_moving_average(data)
+    vectorized = time.perf_counter() - start
+
+    print(f"MA backtest ({n} bars): engine {event_driven * 1e3:.0f} ms, "
+          f"vectorized {vectorized * 1e3:.1f} ms ({event_driven / vectorized:.0f}x)")
+    return event_driven, vectorized
+
+
+def bench_universe_crossovers(n_symbols=3_000, n_bars=2_520, fast_period=10, slow_period=30):
+    """
+    Crossover signals for a whole universe (10 years of daily bars) in one
+    (time x symbols) pass, checked against the per-symbol pandas rolling()
+    logic of src/trading/strategies/moving_average.py on a sample of symbols.
+    """
+    import numpy as np
+    import pandas as pd
+    from vectorized import universe_crossovers
+
+    rng = np.random.default_rng(0)
+    close = 100 + np.cumsum(rng.normal(0, 1, (n_bars, n_symbols)), axis=0)
+    # Some symbols only list part way through
+    listed = rng.integers(0, n_bars // 2, n_symbols // 10)
+    for column, start in enumerate(listed):
+        close[:start, column] = np.nan
+
+    start = time.perf_counter()
+    result = universe_crossovers(close, fast_period, slow_period)
+    elapsed = time.perf_counter() - start
+
+    for column in list(range(len(listed)))[:10] + list(rng.integers(0, n_symbols, 10)):
+        series = pd.Series(close[:, column])
+        fast = series.rolling(fast_period).mean()
+        slow = series.rolling(slow_period).mean()
+        signal = np.zeros(n_bars, dtype=np.int8)
+        signal[((fast > slow) & (fast.shift(1) < slow.shift(1))).to_numpy()] = 1
+        signal[((fast < slow) & (fast.shift(1) > slow.shift(1))).to_numpy()] = -1
+        if not np.array_equal(signal, result['signal'][:, column]):
+            raise AssertionError(f"Signals for symbol {column} differ from pandas")
+        if not np.allclose(slow, result['slow_ma'][:, column], rtol=1e-12, equal_nan=True):
+            raise AssertionError(f"Slow MA for symbol {column} differs from pandas")
+
+    print(f"universe crossovers: {n_symbols} symbols x {n_bars} bars in {elapsed * 1e3:.0f} ms, "
+          f"{np.count_nonzero(result['signal'])} signals (matches pandas)")
+    return elapsed
+
+
+def bench_journal(n=20_000):
+    """Engine run with and without an EventJournal attached, then a replay of that journal."""
+    import io
+    import os
+    import tempfile
+    import contextlib
+    import numpy as np
+    import pandas as pd
+    from systems import HistoricPandasDataHandler, ReplayDataHandler
+    from strategy import MovingAverageStrategy
+    from portfolio_manager import PortfolioManager
+    from execution import SimulatedExecutionHandler
+    from journal import EventJournal
+
+    prices = 150 + np.cumsum(np.random.default_rng(0).normal(0, 1, n))
+    data = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices},
+                        index=pd.date_range('2023-01-01', periods=n, freq='min'))
+
+    def run(make_handler, journal_path=None):
+        events_queue = EventQueue()
+        data_handler = make_handler(events_queue)
+        strategy = MovingAverageStrategy(events_queue, data_handler, 'AAPL')
+        portfolio = PortfolioManager(events_queue, data_handler, initial_capital=100000.0)
+        execution = SimulatedExecutionHandler(events_queue, data_handler)
+        engine = TradingEngine(data_handler, strategy, portfolio, execution, events_queue)
+        journal = EventJournal(journal_path, data_handler).attach(engine) if journal_path else None
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            engine.run()
+            elapsed = time.perf_counter() - start
+        if journal is not None:
+            journal.close()
+        return elapsed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.evj')
+        plain = run(lambda q: HistoricPandasDataHandler(q, data, 'AAPL'))
+        journaled = run(lambda q: HistoricPandasDataHandler(q, data, 'AAPL'), path)
+        size = os.path.getsize(path)
+        replay = run(lambda q: ReplayDataHandler(q, path))
+
+    print(f"journal: {(journaled - plain) / n * 1e6:.1f} us/bar overhead ({journaled / plain - 1:.0%}), "
+          f"{size / n:.0f} bytes/bar; replay of {n} 1 min bars in {replay:.2f}s "
+          f"({n * 60 / replay:.0f}x real time)")
+    return plain, journaled, replay
+
+
+def bench_latency_overhead(n=20_000):
+    """Engine run with and without PipelineLatency attached; prints what it measured."""
+    import io
+    import contextlib
+    import numpy as np
+    import pandas as pd
+    from systems import HistoricPandasDataHandler
+    from strategy import MovingAverageStrategy
+    from portfolio_manager import PortfolioManager
+    from execution import SimulatedExecutionHandler
+    from latency import PipelineLatency
+
+    prices = 150 + np.cumsum(np.random.default_rng(0).normal(0, 1, n))
+    data = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices},
+                        index=pd.date_range('2023-01-01', periods=n, freq='min'))
+
+    def run(instrumented):
+        events_queue = EventQueue()
+        data_handler = HistoricPandasDataHandler(events_queue, data, 'AAPL')
+        strategy = MovingAverageStrategy(events_queue, data_handler, 'AAPL')
+        portfolio = PortfolioManager(events_queue, data_handler, initial_capital=100000.0)
+        execution = SimulatedExecutionHandler(events_queue, data_handler)
+        engine = TradingEngine(data_handler, strategy, portfolio, execution, events_queue)
+        latency = PipelineLatency(engine).attach() if instrumented else None
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            engine.run()
+            elapsed = time.perf_counter() - start
+        return elapsed, latency
+
+    plain, _ = run(False)
+    timed, latency = run(True)
+    print(f"latency instrumentation: {(timed - plain) / n * 1e6:.1f} us/bar overhead ({timed / plain - 1:.0%})")
+    latency.report()
+    return plain, timed
+
+
+def bench_shared_indicators(n=5_000, counts=(1, 10, 50)):
+    """
+    One engine running 1, 10 and 50 MovingAverageStrategy instances, each on its own
+    fast period but all on the same slow period: the shared IndicatorRegistry keeps
+    one node per distinct moving average, so the slow MA is computed once per bar.
+    """
+    import io
+    import contextlib
+    import numpy as np
+    import pandas as pd
+    from systems import HistoricPandasDataHandler
+    from strategy import MovingAverageStrategy
+    from portfolio_manager import PortfolioManager
+    from execution import SimulatedExecutionHandler
+
+    prices = 150 + np.cumsum(np.random.default_rng(0).normal(0, 1, n))
+    data = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices},
+                        index=pd.date_range('2023-01-01', periods=n, freq='min'))
+
+    for count in counts:
+        events_queue = EventQueue()
+        data_handler = HistoricPandasDataHandler(events_queue, data, 'AAPL')
+        strategies = [MovingAverageStrategy(events_queue, data_handler, 'AAPL', fast_period=5 + i % 10,
+                                            slow_period=100, strategy_id=f"MA_{i}") for i in range(count)]
+        portfolio = PortfolioManager(events_queue, data_handler, initial_capital=100000.0)
+        execution = SimulatedExecutionHandler(events_queue, data_handler)
+        engine = TradingEngine(data_handler, strategies, portfolio, execution, events_queue)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            engine.run()
+            elapsed = time.perf_counter() - start
+        print(f"shared indicators: {count} strategies, {len(data_handler.indicators.nodes)} indicator nodes, "
+              f"{elapsed / n * 1e6:.0f} us/bar")
+
+
+class _FakeGateway:
+    """
+    Minimal stand-in for ib_insync.IB on the local event loop: streams 1 min bars
+    through a keepUpToDate BarDataList and fills market orders after `fill_delay`
+    seconds. Records how long each order took to be placed after its bar arrived.
+    """
+    def __init__(self, fill_delay=0.001):
+        from ib_insync import BarDataList
+        self.fill_delay = fill_delay
+        self.bars = BarDataList()
+        self.last_tick = None
+        self.latencies = []
+
+    def get_ib(self):
+        return self     # Doubles as the IBKRConnection
+
+    def qualifyContracts(self, *contracts):
+        return list(contracts)
+
+    def reqHistoricalData(self, contract, **kwargs):
+        self.bars.contract = contract
+        return self.bars
+
+    def sleep(self, seconds):
+        from ib_insync import util
+        util.sleep(seconds)
+
+    def placeOrder(self, contract, order):
+        import asyncio
+        from ib_insync import Trade, OrderStatus
+        self.latencies.append(time.perf_counter() - self.last_tick)
+        trade = Trade(contract, order, OrderStatus(status='Submitted'))
+        asyncio.get_event_loop().call_later(self.fill_delay, self._fill, trade)
+        return trade
+
+    def _fill(self, trade):
+        from ib_insync import Fill, Execution, CommissionReport
+        price = self.bars[-1].close
+        trade.fills.append(Fill(trade.contract, Execution(shares=trade.order.totalQuantity, price=price),
+                                CommissionReport(commission=1.0), None))
+        trade.orderStatus.status = 'Filled'
+        trade.orderStatus.avgFillPrice = price
+        trade.statusEvent.emit(trade)
+
+    async def stream(self, n, interval):
+        """Publishes n bars, `interval` seconds apart, alternating prices so every bar flips the MA cross."""
+        import asyncio
+        import pandas as pd
+        from ib_insync import BarData
+        start = pd.Timestamp('2024-01-02 09:30', tz='US/Eastern')
+        for i in range(n):
+            await asyncio.sleep(interval)
+            price = 100.0 if i % 2 else 110.0
+            self.bars.append(BarData(date=start + pd.Timedelta(minutes=i), open=price, high=price,
+                                     low=price, close=price, volume=100))
+            self.last_tick = time.perf_counter()
+            self.bars.updateEvent.emit(self.bars, True)
+
+
+def bench_live_latency(n=20, interval=0.25):
+    """
+    Bar-to-order latency of the polling TradingEngine vs. AsyncTradingEngine
+    against _FakeGateway (no network, so this is pure engine overhead).
+    """
+    import io
+    import os
+    import queue
+    import asyncio
+    import tempfile
+    import contextlib
+    import numpy as np
+    from ib_insync import Stock, util
+    from events import AsyncEventQueue
+    from systems import IBKRLiveDataHandler, AsyncTradingEngine
+    from strategy import MovingAverageStrategy
+    from portfolio_manager import PortfolioManager
+    from execution import IBKRExecutionHandler, AsyncIBKRExecutionHandler
+    from latency import PipelineLatency
+
+    def build(gateway, events_queue, execution_class, engine_class):
+        data_handler = IBKRLiveDataHandler(events_queue, gateway, Stock('AAPL', 'SMART', 'USD'))
+        strategy = MovingAverageStrategy(events_queue, data_handler, 'AAPL', fast_period=1, slow_period=2)
+        portfolio = PortfolioManager(events_queue, data_handler, initial_capital=100000.0)
+        execution = execution_class(events_queue, gateway)
+        data_handler.start_live_feed()
+        return data_handler, engine_class(data_handler, strategy, portfolio, execution, events_queue)
+
+    results = {}
+    cwd = os.getcwd()
+    # Keep the fake contracts out of the real contract cache file
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        os.chdir(tmp)
+        try:
+            gateway = _FakeGateway()
+            data_handler, engine = build(gateway, queue.Queue(), IBKRExecutionHandler, TradingEngine)
+
+            async def feed_then_stop():
+                await gateway.stream(n, interval)
+                data_handler.continue_backtest = False
+            asyncio.ensure_future(feed_then_stop())
+            engine.run()
+            results['polling'] = np.array(gateway.latencies)
+
+            gateway = _FakeGateway()
+            _, engine = build(gateway, AsyncEventQueue(), AsyncIBKRExecutionHandler, AsyncTradingEngine)
+            latency = PipelineLatency(engine).attach()
+
+            async def feed_then_stop_async():
+                await gateway.stream(n, interval)
+                await asyncio.sleep(0.01)   # Let the last fill land
+                engine.stop()
+            util.run(asyncio.gather(engine.run_async(), feed_then_stop_async()))
+            results['async'] = np.array(gateway.latencies)
+        finally:
+            os.chdir(cwd)
+
+    for name, latencies in results.items():
+        print(f"bar-to-order latency ({name}): median {np.median(latencies) * 1e3:.2f} ms, "
+              f"p99 {np.percentile(latencies, 99) * 1e3:.2f} ms over {len(latencies)} orders")
+    latency.report()    # Per-stage breakdown of the async run
+    return results
+
+
+if __name__ == "__main__":
+    bench_engine_dispatch()
+    bench_events()
+    bench_vectorized_backtest()
+    bench_universe_crossovers()
+    bench_journal()
+    bench_latency_overhead()
+    bench_shared_indicators()
+    bench_live_latency()
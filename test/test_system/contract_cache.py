@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import dataclasses
+
+from ib_insync import Contract, Stock
+
+# Process-wide store shared by every ContractCache: key -> (qualified Contract, qualified_at)
+_QUALIFIED = {}
+_LOADED_PATHS = set()
+
+
+def contract_key(contract) -> str:
+    """Stable, filesystem-safe identifier built from the contract's defining fields."""
+    fields = [contract.secType, contract.symbol, contract.exchange, contract.currency,
+              contract.lastTradeDateOrContractMonth, contract.right,
+              str(contract.strike) if contract.strike else '']
+    return '_'.join(f.replace(' ', '-').replace('/', '-') for f in fields if f)
+
+
+class ContractCache:
+    """
+    Process-wide (plus on-disk) cache of qualified contracts, keyed by the fields
+    that define them (symbol, exchange, currency, ...). Entries are re-qualified
+    after `ttl` seconds. Call prewarm() at startup to qualify a universe in one
+    round trip, so order submission and data requests never have to.
+    """
+    def __init__(self, ib, path: str = os.getenv("IB_CONTRACT_CACHE", ".contract_cache.json"),
+                 ttl: float = 24 * 3600):
+        self.ib = ib
+        self.path = path
+        self.ttl = ttl
+        if path and path not in _LOADED_PATHS:
+            self._load()
+            _LOADED_PATHS.add(path)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable contract cache {self.path}: {e}")
+            return
+        for key, entry in stored.items():
+            # Entries already qualified in this process are at least as fresh
+            if key not in _QUALIFIED:
+                _QUALIFIED[key] = (Contract.create(**entry['contract']), entry['qualified_at'])
+
+    def _save(self):
+        if not self.path:
+            return
+        stored = {key: {'contract': dataclasses.asdict(contract), 'qualified_at': qualified_at}
+                  for key, (contract, qualified_at) in _QUALIFIED.items()}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(stored, f)
+        os.replace(tmp_path, self.path)
+
+    def _fresh(self, key):
+        entry = _QUALIFIED.get(key)
+        if entry is not None and time.time() - entry[1] < self.ttl:
+            return entry[0]
+        return None
+
+    def qualify(self, contract):
+        """Returns the qualified version of `contract`, asking IB only on a cache miss."""
+        key = contract_key(contract)
+        cached = self._fresh(key)
+        if cached is not None:
+            return cached
+        qualified = self.ib.qualifyContracts(contract)
+        if not qualified:
+            raise ValueError(f"IB could not qualify contract {contract}")
+        _QUALIFIED[key] = (qualified[0], time.time())
+        self._save()
+        return qualified[0]
+
+    def get(self, symbol: str, exchange: str = 'SMART', currency: str = 'USD'):
+        """Qualified stock contract for a symbol."""
+        return self.qualify(Stock(symbol, exchange, currency))
+
+    def prewarm(self, contracts):
+        """
+        Qualifies every missing/stale contract in ONE qualifyContracts call.
+        Accepts contracts or plain stock symbols (SMART/USD).
+        """
+        contracts = [Stock(c, 'SMART', 'USD') if isinstance(c, str) else c for c in contracts]
+        # Keys are taken before qualifying, since qualifyContracts fills in fields in place
+        keys = [contract_key(c) for c in contracts]
+        missing = [(key, c) for key, c in zip(keys, contracts) if self._fresh(key) is None]
+        if missing:
+            print(f"Qualifying {len(missing)} contracts ({len(contracts) - len(missing)} cached)...")
+            now = time.time()
+            resolved = {id(c) for c in self.ib.qualifyContracts(*(c for _, c in missing))}
+            for key, contract in missing:
+                if id(contract) in resolved:
+                    _QUALIFIED[key] = (contract, now)
+                else:
+                    print(f"Could not qualify {contract.symbol}; it will be retried on first use.")
+            self._save()
+        return [self._fresh(key) or c for key, c in zip(keys, contracts)]
@@ -1,29 +1,86 @@
 import queue
+import asyncio
+from enum import IntEnum
+from collections import deque
 from datetime import datetime
 
+class EventQueue(deque):
+    """
+    Lock-free event queue for single-threaded backtests.
+    A plain deque with the queue.Queue methods the components already call
+    (put/get/empty), minus the lock queue.Queue takes on every call.
+    """
+    put = deque.append
+    put_nowait = deque.append
+    get = deque.popleft
+    get_nowait = deque.popleft
+
+    def empty(self):
+        return not self
+
+    def qsize(self):
+        return len(self)
+
+
+class AsyncEventQueue(asyncio.Queue):
+    """
+    Unbounded asyncio.Queue for the async live engine. put() does NOT need to be
+    awaited, so ib_insync callbacks and the existing synchronous components can
+    keep calling events_queue.put(event); the engine wakes up as soon as it lands.
+    Must be used from the event loop's thread (which is where ib_insync calls back).
+    """
+    def put(self, item):
+        self.put_nowait(item)
+
+
+class EventType(IntEnum):
+    """Integer tags for the event classes (Event.type_id); compare these instead of strings in hot code."""
+    MARKET = 0
+    SIGNAL = 1
+    ORDER = 2
+    FILL = 3
+
+
 class Event:
     """
     Base class providing an interface for all subsequent 
     (inherited) events, that will trigger further events in the 
     trading infrastructure.
+    Events use __slots__ (no per-instance __dict__). The string tag
+    (event.type == 'MARKET') and the integer tag (event.type_id) are
+    class attributes, so they cost nothing per event.
     """
-    pass
+    __slots__ = ()
+    type = None
+    type_id = None
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if not name.startswith('_'))
+        return f"{self.__class__.__name__}({fields})"
 
 class MarketEvent(Event):
     """
     Handles the event of receiving a new market update with 
     corresponding bars or ticks.
+    'symbols' lists the symbols updated by this event (None = unspecified).
     """
-    def __init__(self):
-        self.type = 'MARKET'
+    __slots__ = ('symbols',)
+    type = 'MARKET'
+    type_id = EventType.MARKET
+
+    def __init__(self, symbols: tuple = None):
+        self.symbols = symbols
 
 class SignalEvent(Event):
     """
     Handles the event of sending a Signal from a Strategy object.
     This is received by a Portfolio object and acted upon.
     """
+    __slots__ = ('strategy_id', 'symbol', 'datetime', 'signal_type', 'strength')
+    type = 'SIGNAL'
+    type_id = EventType.SIGNAL
+
     def __init__(self, strategy_id: str, symbol: str, datetime: datetime, signal_type: str, strength: float = 1.0):
-        self.type = 'SIGNAL'
         self.strategy_id = strategy_id
         self.symbol = symbol
         self.datetime = datetime
@@ -34,13 +91,18 @@ class OrderEvent(Event):
     """
     Handles the event of sending an Order to an execution system.
     The portfolio determines the order size and sends this.
+    'strategy_id' names the strategy the order is for (None = unattributed).
     """
-    def __init__(self, symbol: str, order_type: str, quantity: int, direction: str):
-        self.type = 'ORDER'
+    __slots__ = ('symbol', 'order_type', 'quantity', 'direction', 'strategy_id')
+    type = 'ORDER'
+    type_id = EventType.ORDER
+
+    def __init__(self, symbol: str, order_type: str, quantity: int, direction: str, strategy_id: str = None):
         self.symbol = symbol
         self.order_type = order_type    # 'MKT' or 'LMT'
         self.quantity = quantity
         self.direction = direction      # 'BUY' or 'SELL'
+        self.strategy_id = strategy_id
 
     def print_order(self):
         print(f"Order: {self.direction} {self.quantity} {self.symbol} ({self.order_type})")
@@ -49,15 +111,19 @@ class FillEvent(Event):
     """
     Encapsulates the notion of a Filled Order, as returned 
     from a brokerage (like IBKR). Stores the quantity actually filled 
-    and at what price.
+    and at what price. 'strategy_id' is copied from the OrderEvent.
     """
+    __slots__ = ('timeindex', 'symbol', 'exchange', 'quantity', 'direction', 'fill_price', 'commission', 'strategy_id')
+    type = 'FILL'
+    type_id = EventType.FILL
+
     def __init__(self, timeindex: datetime, symbol: str, exchange: str, quantity: int, 
-                 direction: str, fill_price: float, commission: float = 0.0):
-        self.type = 'FILL'
+                 direction: str, fill_price: float, commission: float = 0.0, strategy_id: str = None):
         self.timeindex = timeindex
         self.symbol = symbol
         self.exchange = exchange
         self.quantity = quantity
         self.direction = direction
         self.fill_price = fill_price
-        self.commission = commission
\ No newline at end of file
+        self.commission = commission
+        self.strategy_id = strategy_id
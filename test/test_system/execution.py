@@ -1,18 +1,30 @@
 from abc import ABC, abstractmethod
 from ib_insync import Stock, MarketOrder
+import asyncio
 import datetime
 
 from events import FillEvent
+from contract_cache import ContractCache
+
+# Order states in which IBKR has not acknowledged the order yet
+UNACKNOWLEDGED = ('PendingSubmit', 'ApiPending')
 
 class ExecutionHandler(ABC):
     """
     The abstract base class for handling order execution.
     """
+    latency = None      # PipelineLatency, set when one is attached to the engine
+
     @abstractmethod
     def execute_order(self, event):
         """Takes an OrderEvent and executes it."""
         pass
 
+    def _acknowledged(self, event):
+        """Reports that the broker has accepted the OrderEvent (order->ack latency)."""
+        if self.latency is not None:
+            self.latency.acked(event)
+
 class SimulatedExecutionHandler(ExecutionHandler):
     """
     Instantly fills orders at the current market price for backtesting.
@@ -31,6 +43,9 @@ class SimulatedExecutionHandler(ExecutionHandler):
             # 2. Simulate commission (e.g., $1 minimum or $0.005 per share)
             commission = max(1.0, event.quantity * 0.005)
             
+            # The simulated broker accepts every order on the spot
+            self._acknowledged(event)
+
             # 3. Create a FillEvent and push it back to the queue
             fill_event = FillEvent(
                 timeindex=latest_bar['datetime'],
@@ -39,7 +54,8 @@ class SimulatedExecutionHandler(ExecutionHandler):
                 quantity=event.quantity,
                 direction=event.direction,
                 fill_price=fill_price,
-                commission=commission
+                commission=commission,
+                strategy_id=event.strategy_id
             )
             self.events_queue.put(fill_event)
             print(f"[EXECUTION - SIM] FILLED {event.direction} {event.quantity} {event.symbol} @ ${fill_price:.2f}")
@@ -49,49 +65,104 @@ class IBKRExecutionHandler(ExecutionHandler):
     """
     Live trading execution handler using your original ib_insync logic!
     """
-    def __init__(self, events_queue, ib_conn):
+    def __init__(self, events_queue, ib_conn, symbols=None):
         self.events_queue = events_queue
         self.ib = ib_conn.get_ib()
+        
+        # Qualified contracts are cached, so orders skip the qualifyContracts round trip
+        self.contracts = ContractCache(self.ib)
+        if symbols:
+            self.contracts.prewarm(symbols)
 
     def execute_order(self, event):
         if event.type == 'ORDER':
             print(f"[EXECUTION - IBKR] Sending {event.direction} order for {event.quantity} {event.symbol} to broker...")
             
-            # 1. Prepare the contract (Reusing your original logic)
-            contract = Stock(event.symbol, 'SMART', 'USD')
-            self.ib.qualifyContracts(contract)
+            # 1. Prepare the contract (cached after the first qualification)
+            contract = self.contracts.get(event.symbol, 'SMART', 'USD')
             
             # 2. Prepare the order
+            # orderRef tags the order with its strategy in TWS and in execution reports
             if event.order_type == 'MKT':
-                order = MarketOrder(event.direction, event.quantity)
+                order = MarketOrder(event.direction, event.quantity, orderRef=event.strategy_id or '')
             else:
                 print("Warning: Only Market Orders currently supported. Defaulting to MKT.")
-                order = MarketOrder(event.direction, event.quantity)
+                order = MarketOrder(event.direction, event.quantity, orderRef=event.strategy_id or '')
                 
             # 3. Send the order to IBKR
             trade = self.ib.placeOrder(contract, order)
             
             # 4. Wait for the fill (Using your original blocking loop for simplicity)
             # In a highly advanced system, you would attach an asynchronous callback here instead!
+            acknowledged = False
             while not trade.isDone():
+                if not acknowledged and trade.orderStatus.status not in UNACKNOWLEDGED:
+                    acknowledged = True
+                    self._acknowledged(event)
                 self.ib.sleep(0.1)
+            if not acknowledged:
+                self._acknowledged(event)   # Went straight to a final state
                 
             if trade.orderStatus.status == 'Filled':
-                fill_price = trade.avgFillPrice
-                commission = sum(c.commission for c in trade.commissionReport) if trade.commissionReport else 0.0
-                
-                print(f"[EXECUTION - IBKR] Order FILLED. Qty: {trade.filled()}, Avg Price: ${fill_price}")
+                print(f"[EXECUTION - IBKR] Order FILLED. Qty: {trade.filled()}, Avg Price: ${trade.orderStatus.avgFillPrice}")
                 
                 # 5. Push the FillEvent back to the queue so the Portfolio Manager knows!
-                fill_event = FillEvent(
-                    timeindex=datetime.datetime.now(),
-                    symbol=event.symbol,
-                    exchange='SMART',
-                    quantity=trade.filled(),
-                    direction=event.direction,
-                    fill_price=fill_price,
-                    commission=commission
-                )
-                self.events_queue.put(fill_event)
+                self.events_queue.put(self._fill_event(trade, event))
             else:
-                print(f"[EXECUTION - IBKR] Order failed or cancelled. Status: {trade.orderStatus.status}")      
\ No newline at end of file
+                print(f"[EXECUTION - IBKR] Order failed or cancelled. Status: {trade.orderStatus.status}")
+
+    def _fill_event(self, trade, event):
+        """FillEvent for a completed ib_insync Trade (price and commission come from its fills)."""
+        commission = sum(fill.commissionReport.commission for fill in trade.fills if fill.commissionReport)
+        return FillEvent(
+            timeindex=datetime.datetime.now(),
+            symbol=event.symbol,
+            exchange='SMART',
+            quantity=trade.filled(),
+            direction=event.direction,
+            fill_price=trade.orderStatus.avgFillPrice,
+            commission=commission,
+            strategy_id=event.strategy_id
+        )
+
+
+class AsyncIBKRExecutionHandler(IBKRExecutionHandler):
+    """
+    Live execution for AsyncTradingEngine. execute_order() is a coroutine that
+    places the order and returns straight away; the fill is awaited in a separate
+    task, so the engine keeps handling market data while the order works.
+    """
+    def __init__(self, events_queue, ib_conn, symbols=None):
+        super().__init__(events_queue, ib_conn, symbols)
+        self.pending = set()    # Tasks waiting on fills
+
+    async def execute_order(self, event):
+        if event.type == 'ORDER':
+            contract = self.contracts.get(event.symbol, 'SMART', 'USD')
+            if event.order_type != 'MKT':
+                print("Warning: Only Market Orders currently supported. Defaulting to MKT.")
+            order = MarketOrder(event.direction, event.quantity, orderRef=event.strategy_id or '')
+            trade = self.ib.placeOrder(contract, order)
+            print(f"[EXECUTION - IBKR] Sent {event.direction} order for {event.quantity} {event.symbol}.")
+
+            task = asyncio.ensure_future(self._wait_for_fill(trade, event))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+
+    async def _wait_for_fill(self, trade, event):
+        # statusEvent fires on every order status change; the first one past
+        # PendingSubmit is the broker's acknowledgement
+        acknowledged = False
+        while True:
+            if not acknowledged and trade.orderStatus.status not in UNACKNOWLEDGED:
+                acknowledged = True
+                self._acknowledged(event)
+            if trade.isDone():
+                break
+            await trade.statusEvent
+
+        if trade.orderStatus.status == 'Filled':
+            print(f"[EXECUTION - IBKR] Order FILLED. Qty: {trade.filled()}, Avg Price: ${trade.orderStatus.avgFillPrice}")
+            self.events_queue.put(self._fill_event(trade, event))
+        else:
+            print(f"[EXECUTION - IBKR] Order failed or cancelled. Status: {trade.orderStatus.status}")
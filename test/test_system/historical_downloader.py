@@ -0,0 +1,268 @@
+import os
+import time
+import asyncio
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from ib_insync import util
+
+from bars import ColumnarBars
+from bar_cache import parse_bar_size
+from contract_cache import contract_key
+
+# Longest request IB accepts for each bar size (from IB's historical data limits table)
+_MAX_CHUNK = [
+    (pd.Timedelta(seconds=1), '1800 S'),
+    (pd.Timedelta(seconds=5), '3600 S'),
+    (pd.Timedelta(seconds=10), '14400 S'),
+    (pd.Timedelta(seconds=30), '28800 S'),
+    (pd.Timedelta(minutes=1), '1 D'),
+    (pd.Timedelta(minutes=2), '2 D'),
+    (pd.Timedelta(minutes=3), '1 W'),
+    (pd.Timedelta(minutes=30), '1 M'),
+    (pd.Timedelta(days=1), '1 Y'),
+]
+
+_CHUNK_SPANS = {
+    '1800 S': pd.Timedelta(seconds=1800), '3600 S': pd.Timedelta(seconds=3600),
+    '14400 S': pd.Timedelta(seconds=14400), '28800 S': pd.Timedelta(seconds=28800),
+    '1 D': pd.Timedelta(days=1), '2 D': pd.Timedelta(days=2), '1 W': pd.Timedelta(weeks=1),
+    '1 M': pd.Timedelta(days=30), '1 Y': pd.Timedelta(days=365),
+}
+
+# IB error code for "Historical Market Data Service error message: pacing violation"
+PACING_VIOLATION = 162
+# Codes ib_insync treats as warnings (plus 2100-2199): they don't end a request
+_WARNING_CODES = {110, 165, 202, 399, 404, 434, 492, 10167}
+
+
+def _utc(value) -> pd.Timestamp:
+    """Timestamp in UTC; naive values are taken to be UTC already."""
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize('UTC') if timestamp.tz is None else timestamp.tz_convert('UTC')
+
+
+def chunk_duration(barSizeSetting: str) -> str:
+    """Largest durationStr IB allows in one request for this bar size."""
+    bar = parse_bar_size(barSizeSetting)
+    duration = _MAX_CHUNK[0][1]
+    for min_bar, candidate in _MAX_CHUNK:
+        if bar >= min_bar:
+            duration = candidate
+    return duration
+
+
+class TokenBucket:
+    """
+    Async token bucket holding `capacity` tokens; each spent token flows back 
+    exactly `period` seconds after it was taken. Unlike a continuously refilled
+    bucket this never allows more than `capacity` acquisitions in ANY window of
+    `period` seconds, which is how IB counts pacing.
+    """
+    def __init__(self, capacity: int, period: float, clock=time.monotonic):
+        self.capacity = capacity
+        self.period = period
+        self.clock = clock
+        self.spent = deque()    # When each token currently out of the bucket was taken
+
+    async def acquire(self):
+        while True:
+            now = self.clock()
+            while self.spent and now - self.spent[0] >= self.period:
+                self.spent.popleft()
+            if len(self.spent) < self.capacity:
+                self.spent.append(now)
+                return
+            await asyncio.sleep(self.period - (now - self.spent[0]))
+
+
+class HistoricalDownloader:
+    """
+    Bulk historical backfill on top of reqHistoricalDataAsync.
+    Every contract's date range is split into the largest chunks IB allows for the
+    bar size, and chunks for all contracts are kept in flight concurrently while
+    token buckets enforce IB's pacing rules:
+      - no more than 60 requests in any 10 minute window (global bucket),
+      - at most 5 requests for the same contract within 2 seconds,
+      - no more than 50 requests open at once,
+      - never repeating an identical request within 15 seconds (retry back-off).
+    Each finished chunk is written to its own .npz file as soon as it arrives, so
+    an interrupted backfill resumes with only the missing chunks. An empty answer
+    is only saved as "no data" when IB really answered: ib_insync also returns an
+    empty list when the request timed out or IB rejected it, and those are retried.
+
+    `ib` only needs reqHistoricalDataAsync() (and optionally errorEvent), so a
+    local fake gateway can stand in for IB in tests.
+    """
+    def __init__(self, ib, out_dir: str = os.getenv("IB_DOWNLOAD_DIR", ".downloads"),
+                 barSizeSetting: str = "1 min", whatToShow: str = "TRADES", useRTH: bool = True,
+                 max_concurrent: int = 50, requests_per_period: int = 60, period: float = 600.0,
+                 requests_per_contract: int = 5, contract_period: float = 2.0,
+                 retry_delay: float = 15.0, max_retries: int = 3, timeout: float = 60.0):
+        self.ib = ib
+        self.out_dir = out_dir
+        self.barSizeSetting = barSizeSetting
+        self.whatToShow = whatToShow
+        self.useRTH = useRTH
+        self.durationStr = chunk_duration(barSizeSetting)
+        self.chunk_span = _CHUNK_SPANS[self.durationStr]
+
+        self.max_concurrent = max_concurrent
+        self.requests_per_period = requests_per_period
+        self.period = period
+        self.requests_per_contract = requests_per_contract
+        self.contract_period = contract_period
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self._last_pacing_violation = -np.inf
+        self._request_errors = {}   # reqId -> error code, for requests IB failed
+        if getattr(ib, 'errorEvent', None) is not None:
+            ib.errorEvent += self._on_error
+
+    def _on_error(self, reqId, errorCode, errorString, contract=None, *args):
+        message = errorString.lower()
+        if errorCode == PACING_VIOLATION and 'pacing' in message:
+            self._last_pacing_violation = time.monotonic()
+        if errorCode in _WARNING_CODES or 2100 <= errorCode < 2200 or 'returned no data' in message:
+            return      # "HMDS query returned no data" is a real (empty) answer
+        self._request_errors[reqId] = errorCode
+
+    def _answered(self, bars, started: float) -> bool:
+        """Whether bars is IB's real answer, rather than the empty list of a timed out or failed request."""
+        error = self._request_errors.pop(getattr(bars, 'reqId', None), None)
+        if bars:
+            return True
+        return (error is None
+                and self._last_pacing_violation < started
+                and not (self.timeout and time.monotonic() - started >= self.timeout))
+
+    def _contract_dir(self, contract) -> str:
+        name = f"{contract_key(contract)}__{self.barSizeSetting.replace(' ', '')}__{self.whatToShow}__rth{int(self.useRTH)}"
+        return os.path.join(self.out_dir, name)
+
+    def _chunk_path(self, contract, chunk_end: pd.Timestamp) -> str:
+        return os.path.join(self._contract_dir(contract), f"{chunk_end.value}.npz")
+
+    def plan(self, contracts, start, end) -> list:
+        """
+        All (contract, chunk_end) pairs needed to cover [start, end], newest first.
+        Apart from the newest one, chunk ends sit on a fixed grid, so a rerun with a
+        later `end` still finds the chunks an earlier run already saved.
+        """
+        start, end = _utc(start), _utc(end)
+        span = self.chunk_span.value
+        chunk_ends = [end]
+        grid = (end.value - 1) // span * span
+        while grid > start.value:
+            chunk_ends.append(pd.Timestamp(grid, tz='UTC'))
+            grid -= span
+        return [(contract, chunk_end) for contract in contracts for chunk_end in chunk_ends]
+
+    def pending(self, contracts, start, end) -> list:
+        """Chunks from plan() that are not on disk yet (i.e. what a resumed run still has to fetch)."""
+        return [(c, e) for c, e in self.plan(contracts, start, end) if not os.path.exists(self._chunk_path(c, e))]
+
+    def _save_chunk(self, contract, chunk_end, bars):
+        path = self._chunk_path(contract, chunk_end)
+        df = util.df(bars) if bars else None
+        if df is None or df.empty:
+            columns = {'timestamp': np.zeros(0, dtype=np.int64)}
+        else:
+            columns = ColumnarBars.from_frame(df)
+            columns = {'timestamp': columns.timestamps, 'open': columns.open, 'high': columns.high,
+                       'low': columns.low, 'close': columns.close, 'volume': columns.volume}
+        # Atomic rename: a chunk file either exists complete or not at all
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **columns)
+        os.replace(tmp_path, path)
+
+    async def _fetch_chunk(self, contract, chunk_end, global_bucket, contract_buckets, semaphore):
+        for attempt in range(self.max_retries + 1):
+            await global_bucket.acquire()
+            await contract_buckets[contract_key(contract)].acquire()
+            async with semaphore:
+                started = time.monotonic()
+                try:
+                    bars = await self.ib.reqHistoricalDataAsync(
+                        contract,
+                        endDateTime=chunk_end.to_pydatetime(),
+                        durationStr=self.durationStr,
+                        barSizeSetting=self.barSizeSetting,
+                        whatToShow=self.whatToShow,
+                        useRTH=self.useRTH,
+                        formatDate=2,
+                        timeout=self.timeout
+                    )
+                except Exception as e:
+                    print(f"[DOWNLOADER] {contract.symbol} chunk ending {chunk_end} failed: {e}")
+                    bars = None
+            # An empty answer after a timeout, an error or a pacing violation is not real "no data": retry it
+            if bars is not None and self._answered(bars, started):
+                self._save_chunk(contract, chunk_end, bars)
+                return True
+            if attempt < self.max_retries:
+                # IB rejects identical requests made within 15 seconds
+                await asyncio.sleep(self.retry_delay)
+        print(f"[DOWNLOADER] Giving up on {contract.symbol} chunk ending {chunk_end}; rerun to resume it.")
+        return False
+
+    async def download_async(self, contracts, start, end) -> dict:
+        """Downloads every pending chunk; returns {symbol: ColumnarBars} for all contracts."""
+        chunks = self.pending(contracts, start, end)
+        for contract in contracts:
+            os.makedirs(self._contract_dir(contract), exist_ok=True)
+
+        global_bucket = TokenBucket(self.requests_per_period, self.period)
+        contract_buckets = {contract_key(c): TokenBucket(self.requests_per_contract, self.contract_period)
+                            for c in contracts}
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        total = len(chunks)
+        done = 0
+        print(f"[DOWNLOADER] {total} chunks to fetch ({len(self.plan(contracts, start, end)) - total} already on disk).")
+        tasks = [asyncio.ensure_future(self._fetch_chunk(c, e, global_bucket, contract_buckets, semaphore))
+                 for c, e in chunks]
+        for task in asyncio.as_completed(tasks):
+            if await task:
+                done += 1
+                if done % 10 == 0 or done == total:
+                    print(f"[DOWNLOADER] {done}/{total} chunks done")
+
+        return {contract.symbol: self.load(contract, start, end) for contract in contracts}
+
+    def download(self, contracts, start, end) -> dict:
+        """Blocking wrapper around download_async (runs on ib_insync's event loop)."""
+        return util.run(self.download_async(contracts, start, end))
+
+    def load(self, contract, start=None, end=None) -> ColumnarBars:
+        """Stitches the downloaded chunks of one contract into a single sorted, de-duplicated series."""
+        directory = self._contract_dir(contract)
+        names = sorted(f for f in os.listdir(directory) if f.endswith('.npz') and '.tmp' not in f) \
+            if os.path.isdir(directory) else []
+        parts = []
+        for name in names:
+            with np.load(os.path.join(directory, name)) as chunk:
+                if len(chunk['timestamp']):
+                    parts.append({field: chunk[field] for field in chunk.files})
+        if not parts:
+            return ColumnarBars(np.zeros(0, dtype=np.int64), *(np.zeros(0),) * 5, tz='UTC')
+
+        merged = {field: np.concatenate([p[field] for p in parts]) for field in parts[0]}
+        # Chunks overlap at their edges: keep one copy of each timestamp, in time order
+        timestamps, first = np.unique(merged['timestamp'], return_index=True)
+        keep = first
+        if start is not None:
+            keep = keep[timestamps >= _utc(start).value]
+            timestamps = timestamps[timestamps >= _utc(start).value]
+        if end is not None:
+            keep = keep[timestamps <= _utc(end).value]
+            timestamps = timestamps[timestamps <= _utc(end).value]
+        return ColumnarBars(timestamps, *(merged[f][keep] for f in ('open', 'high', 'low', 'close', 'volume')),
+                            tz='UTC')
+
+    def to_store(self, store, contract) -> int:
+        """Appends a contract's downloaded bars to a BarStore; returns the number of new bars."""
+        return store.append_frame(contract.symbol, self.barSizeSetting, self.load(contract))
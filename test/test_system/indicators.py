@@ -0,0 +1,408 @@
+import sys
+import math
+from abc import ABC, abstractmethod
+from collections import deque
+
+NAN = float('nan')
+
+
+class Indicator(ABC):
+    """
+    Streaming indicator: update() takes the next value and returns the indicator's
+    current value, NaN until enough data has come in (like pandas' min_periods).
+    Every update is O(1), so strategies can run long windows on many symbols.
+    Indicators compose by feeding one's output into another, e.g.
+    ema.update(sma.update(close)); NaN inputs are skipped.
+    """
+    value = NAN
+
+    @property
+    def ready(self) -> bool:
+        return self.value == self.value     # False while NaN
+
+    @abstractmethod
+    def update(self, value: float) -> float:
+        """Takes the next input and returns the indicator's current value."""
+        pass
+
+
+class _Window:
+    """Fixed-size ring of the last `period` values; push() returns the value it evicted (None while filling)."""
+    __slots__ = ('values', 'period', 'count', 'head')
+
+    def __init__(self, period: int):
+        if period < 1:
+            raise ValueError(f"period must be at least 1, got {period}")
+        self.values = [0.0] * period
+        self.period = period
+        self.count = 0
+        self.head = 0       # Slot of the oldest value once full
+
+    def push(self, value):
+        head = self.head
+        if self.count < self.period:
+            self.values[self.count] = value
+            self.count += 1
+            return None
+        oldest = self.values[head]
+        self.values[head] = value
+        self.head = head + 1 if head + 1 < self.period else 0
+        return oldest
+
+
+class SMA(Indicator):
+    """
+    Simple moving average from a running sum: each bar adds the difference
+    between the new value and the one leaving the window (vectorized.rolling_mean
+    does the same sums, so both give identical results).
+    """
+    def __init__(self, period: int):
+        self.period = period
+        self.window = _Window(period)
+        self.total = 0.0
+
+    def update(self, value: float) -> float:
+        if value != value:
+            return self.value
+        oldest = self.window.push(value)
+        if oldest is None:
+            self.total += value
+            if self.window.count < self.period:
+                return self.value
+        else:
+            self.total += value - oldest
+        self.value = self.total / self.period
+        return self.value
+
+
+class EMA(Indicator):
+    """
+    Exponential moving average, seeded with the first value:
+    pandas' ewm(span=period, adjust=False, min_periods=period).mean().
+    Pass alpha instead of a span for other smoothings (e.g. Wilder's 1/period).
+    """
+    def __init__(self, period: int, alpha: float = None):
+        self.period = period
+        self.alpha = alpha if alpha is not None else 2.0 / (period + 1)
+        self.decay = 1.0 - self.alpha
+        self.norm = self.decay + self.alpha     # Not always exactly 1.0; pandas divides by it too
+        self.count = 0
+        self.average = NAN
+
+    def update(self, value: float) -> float:
+        if value != value:
+            return self.value
+        self.count += 1
+        if self.count == 1:
+            self.average = value
+        elif self.average != value:
+            self.average = (self.decay * self.average + self.alpha * value) / self.norm
+        if self.count >= self.period:
+            self.value = self.average
+        return self.value
+
+
+class RSI(Indicator):
+    """
+    Relative Strength Index with Wilder smoothing (EMAs of gains and losses, alpha = 1/period).
+    Ready after `period` price changes, i.e. period + 1 prices.
+    """
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.gains = EMA(period, alpha=1.0 / period)
+        self.losses = EMA(period, alpha=1.0 / period)
+        self.previous = None
+
+    def update(self, value: float) -> float:
+        if value != value:
+            return self.value
+        previous, self.previous = self.previous, value
+        if previous is None:
+            return self.value
+        change = value - previous
+        gain = self.gains.update(change if change > 0 else 0.0)
+        loss = self.losses.update(-change if change < 0 else 0.0)
+        if gain == gain:
+            self.value = 100.0 - 100.0 / (1.0 + gain / loss) if loss else (100.0 if gain else 50.0)
+        return self.value
+
+
+class ATR(Indicator):
+    """Average True Range: Wilder-smoothed true range. update() takes a bar's high, low and close."""
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.average = EMA(period, alpha=1.0 / period)
+        self.previous_close = None
+
+    def update(self, high: float, low: float, close: float) -> float:
+        true_range = high - low
+        previous_close = self.previous_close
+        if previous_close is not None:
+            true_range = max(true_range, abs(high - previous_close), abs(low - previous_close))
+        self.previous_close = close
+        self.value = self.average.update(true_range)
+        return self.value
+
+
+class RollingStd(Indicator):
+    """
+    Rolling sample standard deviation (ddof=1, like pandas) over `period` values,
+    kept with Welford's update: a value entering and one leaving the window
+    adjust the mean and the sum of squared deviations directly.
+    """
+    def __init__(self, period: int):
+        if period < 2:
+            raise ValueError(f"period must be at least 2, got {period}")
+        self.period = period
+        self.window = _Window(period)
+        self.mean = NAN
+        self.m2 = 0.0
+
+    def update(self, value: float) -> float:
+        if value != value:
+            return self.value
+        oldest = self.window.push(value)
+        if oldest is None:
+            n = self.window.count
+            mean = value if n == 1 else self.mean
+            delta = value - mean
+            mean += delta / n
+            self.m2 += delta * (value - mean)
+            self.mean = mean
+            if n < self.period:
+                return self.value
+        elif self.window.head == 0:
+            # Once per trip round the window, recompute exactly so rounding can't pile up:
+            # O(period) every period bars is still O(1) per bar
+            values = self.window.values
+            mean = sum(values) / self.period
+            self.mean = mean
+            self.m2 = sum((v - mean) * (v - mean) for v in values)
+        else:
+            mean = self.mean
+            new_mean = mean + (value - oldest) / self.period
+            self.m2 += (value - oldest) * (value - new_mean + oldest - mean)
+            self.mean = new_mean
+        # Rounding can push m2 a hair below zero on flat prices
+        self.value = math.sqrt(self.m2 / (self.period - 1)) if self.m2 > 0 else 0.0
+        return self.value
+
+
+class Bollinger(Indicator):
+    """Bollinger Bands: value is the middle band (rolling mean); upper/lower are mean +- k standard deviations."""
+    def __init__(self, period: int = 20, k: float = 2.0):
+        self.period = period
+        self.k = k
+        self.std = RollingStd(period)
+        self.upper = NAN
+        self.lower = NAN
+
+    def update(self, value: float) -> float:
+        std = self.std.update(value)
+        if std == std:
+            self.value = self.std.mean
+            self.upper = self.value + self.k * std
+            self.lower = self.value - self.k * std
+        return self.value
+
+
+class RollingMax(Indicator):
+    """
+    Rolling maximum over `period` values with a monotonic deque: it only holds
+    values that can still become the maximum, so each value is pushed and popped once.
+    """
+    def __init__(self, period: int):
+        if period < 1:
+            raise ValueError(f"period must be at least 1, got {period}")
+        self.period = period
+        self.candidates = deque()   # (index, value), values decreasing
+        self.index = -1
+
+    def _better(self, new, old) -> bool:
+        return new >= old
+
+    def update(self, value: float) -> float:
+        if value != value:
+            return self.value
+        self.index += 1
+        candidates = self.candidates
+        while candidates and self._better(value, candidates[-1][1]):
+            candidates.pop()
+        candidates.append((self.index, value))
+        if candidates[0][0] <= self.index - self.period:
+            candidates.popleft()
+        if self.index >= self.period - 1:
+            self.value = candidates[0][1]
+        return self.value
+
+
+class RollingMin(RollingMax):
+    """Rolling minimum over `period` values (see RollingMax)."""
+    def _better(self, new, old) -> bool:
+        return new <= old
+
+
+
+class IndicatorRegistry:
+    """
+    Indicators shared by every strategy reading one data handler. get() returns
+    the existing node for an identical (symbol, inputs, kind, params) request,
+    so two strategies asking for a 30 bar SMA of AAPL hold the same object, and
+    each node is updated once per bar: the cost grows with the number of unique
+    indicators, not of strategies.
+
+    Nodes can feed on bar fields ('close', or ('high', 'low', 'close') for ATR)
+    or on other nodes (source=node), forming a DAG; nodes are created after
+    their sources, so updating them in creation order respects it.
+    TradingEngine subscribes on_market() ahead of the strategies, so they just
+    read node.value in calculate_signals. Strategies also call advance() there,
+    which keeps the nodes fed whatever order things were built in (or with no
+    engine at all); a bar is only applied once however many times it is asked for,
+    and every bar is applied even when one MarketEvent announces several.
+    """
+    def __init__(self, data_handler):
+        self.data_handler = data_handler
+        self.nodes = {}         # key -> indicator
+        self.keys = {}          # id(indicator) -> key
+        self._by_symbol = {}    # symbol -> [(indicator.update, inputs), ...] in creation order
+        self._fields = {}       # symbol -> bar fields its nodes read
+        self._seen = {}         # symbol -> data_handler.get_new_bars() marker of the last bar applied
+
+    @staticmethod
+    def for_handler(data_handler):
+        """The data handler's registry, created on first use."""
+        registry = getattr(data_handler, 'indicators', None)
+        if registry is None:
+            registry = data_handler.indicators = IndicatorRegistry(data_handler)
+        return registry
+
+    def get(self, symbol, kind, *params, source='close'):
+        """
+        The shared `kind(*params)` indicator of `symbol`, fed with `source`: a bar
+        field, a tuple of fields (passed to update() in order) or another node.
+        """
+        if isinstance(source, Indicator):
+            inputs = (source,)
+            source_key = self.keys[id(source)]
+        else:
+            inputs = (source,) if isinstance(source, str) else tuple(source)
+            source_key = inputs
+        key = (symbol, source_key, kind, params)
+        indicator = self.nodes.get(key)
+        if indicator is None:
+            indicator = kind(*params)
+            self.nodes[key] = indicator
+            self.keys[id(indicator)] = key
+            self._by_symbol.setdefault(symbol, []).append((indicator.update, inputs))
+            fields = self._fields.setdefault(symbol, [])
+            fields.extend(f for f in inputs if isinstance(f, str) and f not in fields)
+        return indicator
+
+    def on_market(self, event):
+        symbols = event.symbols if event.symbols is not None else tuple(self._by_symbol)
+        for symbol in symbols:
+            self.advance(symbol)
+
+    def advance(self, symbol):
+        """Updates symbol's nodes with every bar they haven't had yet (normally just the latest)."""
+        nodes = self._by_symbol.get(symbol)
+        if nodes is None:
+            return
+        n, self._seen[symbol] = self.data_handler.get_new_bars(symbol, self._seen.get(symbol))
+        fields = self._fields[symbol]
+        if n == 1:
+            bar = self.data_handler.get_latest_bar(symbol)
+            self._update(nodes, {field: bar[field] for field in fields})
+        elif n:
+            # A coalesced feed announced several bars at once: none may be skipped
+            window = self.data_handler.get_latest_bars(symbol, n)
+            for row in zip(*[window[field] for field in fields]):
+                self._update(nodes, dict(zip(fields, row)))
+
+    @staticmethod
+    def _update(nodes, values):
+        for update, inputs in nodes:
+            if len(inputs) == 1:
+                source = inputs[0]
+                update(values[source] if source.__class__ is str else source.value)
+            else:
+                update(*[values[f] if f.__class__ is str else f.value for f in inputs])
+
+    def warm_up(self, n: int = None):
+        """Rebuilds every node from the handler's stored history (the last n bars; all by default)."""
+        for symbol, nodes in self._by_symbol.items():
+            for key in [key for key in self.nodes if key[0] == symbol]:
+                indicator = self.nodes[key]
+                indicator.__dict__.update(key[2](*key[3]).__dict__)     # Reset in place: strategies hold the object
+            window = self.data_handler.get_latest_bars(symbol, n if n is not None else sys.maxsize)
+            columns = [window[field] for field in self._fields[symbol]]
+            for row in zip(*columns):
+                self._update(nodes, dict(zip(self._fields[symbol], row)))
+            self._seen[symbol] = self.data_handler.get_new_bars(symbol)[1]
+
+    def snapshot_state(self) -> dict:
+        return {'nodes': dict(self.nodes)}
+
+    def restore_state(self, state: dict):
+        # Copied into the existing objects, which the strategies are holding on to
+        for key, saved in state['nodes'].items():
+            indicator = self.nodes.get(key)
+            if indicator is not None:
+                indicator.__dict__.update(saved.__dict__)
+        # The restored values already include the (restored) latest bars
+        for symbol in self._by_symbol:
+            self._seen[symbol] = self.data_handler.get_new_bars(symbol)[1]
+
+if __name__ == "__main__":
+    # Parity with pandas: rolling() as in src/trading/strategies/moving_average.py, ewm() for the smoothed ones
+    import time
+    import numpy as np
+    import pandas as pd
+
+    n = 5000
+    rng = np.random.default_rng(0)
+    close = pd.Series(150 + np.cumsum(rng.normal(0, 1, n)))
+    high = close + rng.uniform(0, 2, n)
+    low = close - rng.uniform(0, 2, n)
+
+    def stream(indicator, *columns):
+        return np.array([indicator.update(*values) for values in zip(*columns)])
+
+    def check(name, ours, expected):
+        expected = np.asarray(expected, dtype=np.float64)
+        if not np.array_equal(np.isnan(ours), np.isnan(expected)):
+            raise AssertionError(f"{name}: warm-up differs from pandas")
+        worst = np.nanmax(np.abs(ours - expected))
+        if not np.allclose(ours, expected, rtol=1e-9, atol=1e-9, equal_nan=True):
+            raise AssertionError(f"{name}: differs from pandas by up to {worst}")
+        print(f"{name}: matches pandas (max abs diff {worst:.2e})")
+
+    for period in (1, 10, 200):
+        check(f"SMA({period})", stream(SMA(period), close), close.rolling(period).mean())
+        check(f"RollingMax({period})", stream(RollingMax(period), close), close.rolling(period).max())
+        check(f"RollingMin({period})", stream(RollingMin(period), close), close.rolling(period).min())
+    for period in (2, 20, 200):
+        check(f"RollingStd({period})", stream(RollingStd(period), close), close.rolling(period).std())
+    for period in (10, 50):
+        check(f"EMA({period})", stream(EMA(period), close), close.ewm(span=period, adjust=False, min_periods=period).mean())
+
+    bands = Bollinger(20, 2.0)
+    upper = np.array([(bands.update(c), bands.upper)[1] for c in close])
+    check("Bollinger(20).upper", upper, close.rolling(20).mean() + 2.0 * close.rolling(20).std())
+
+    delta = close.diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / 14, adjust=False, min_periods=14).mean()
+    loss = (-delta).clip(lower=0).ewm(alpha=1 / 14, adjust=False, min_periods=14).mean()
+    check("RSI(14)", stream(RSI(14), close), 100 - 100 / (1 + gain / loss))
+
+    true_range = pd.concat([high - low, (high - close.shift()).abs(), (low - close.shift()).abs()], axis=1).max(axis=1)
+    check("ATR(14)", stream(ATR(14), high, low, close), true_range.ewm(alpha=1 / 14, adjust=False, min_periods=14).mean())
+
+    # O(1): the cost per update does not grow with the window
+    values = close.tolist()
+    for period in (10, 200, 2000):
+        for indicator in (SMA(period), RollingStd(period), RollingMax(period)):
+            start = time.perf_counter()
+            for value in values:
+                indicator.update(value)
+            print(f"{type(indicator).__name__}({period}): {(time.perf_counter() - start) / n * 1e9:.0f} ns/update")
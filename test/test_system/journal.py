@@ -0,0 +1,279 @@
+import io
+import time
+import struct
+
+import numpy as np
+import pandas as pd
+
+from events import Event, MarketEvent, SignalEvent, OrderEvent, FillEvent
+from bars import Bar
+
+MAGIC = b'EVJ3'     # EVJ2: orders and fills carry their strategy_id; EVJ3: quantities are float64
+
+# Record kinds
+STRING, MARKET, SIGNAL, ORDER, FILL = range(5)
+
+# Every record starts with (kind, recorded_at ns); fixed-size payloads follow
+_HEADER = struct.Struct('<Bq')
+_STRING = struct.Struct('<HH')              # string id, utf-8 length (+ bytes)
+_MARKET = struct.Struct('<H')               # number of bars that follow
+_MAX_BARS = 0xFFFF
+_BAR = struct.Struct('<HqH5d')              # symbol, bar time, tz, open, high, low, close, volume
+_SIGNAL = struct.Struct('<HHqHHd')          # strategy_id, symbol, datetime, tz, signal_type, strength
+_ORDER = struct.Struct('<HHdHH')            # symbol, order_type, quantity, direction, strategy_id
+_FILL = struct.Struct('<HqHHdHddH')         # symbol, timeindex, tz, exchange, quantity, direction, price, commission, strategy_id
+
+NO_TIME = np.iinfo(np.int64).min
+# Reserved string ids: '' (naive datetime) and "not a datetime" (raw integer index)
+NAIVE_TZ = 0
+NOT_DATETIME = 0xFFFF
+
+
+def _to_ns(value):
+    """(nanoseconds since the epoch, tz name) of a bar/event time; NOT_DATETIME for raw integer indexes."""
+    if value is None:
+        return NO_TIME, None
+    if isinstance(value, (int, np.integer)):
+        return int(value), NOT_DATETIME
+    timestamp = value if isinstance(value, pd.Timestamp) else pd.Timestamp(value)
+    return timestamp.value, (str(timestamp.tz) if timestamp.tz is not None else '')
+
+
+class EventJournal:
+    """
+    Compact append-only binary log of every event the engine dispatches.
+    Attach it with journal.attach(engine): it subscribes to the Event base class,
+    so it sees Market, Signal, Order and Fill events in dispatch order.
+    MarketEvents are stored together with the bars they announce (taken from the
+    data handler), which is all ReplayDataHandler needs to feed them back.
+
+    Strings (symbols, strategy ids, tz names, ...) are written once and referred
+    to by id afterwards; records are fixed-size structs, written through a buffer.
+    """
+    def __init__(self, path: str, data_handler, buffer_size: int = 1 << 16):
+        self.path = path
+        self.data_handler = data_handler
+        self.strings = {'': NAIVE_TZ}
+        self._column_tz = {}    # id(column store) -> (column store, tz id), so bars skip the Timestamp round trip
+        self._seen = {}         # symbol -> data_handler.get_new_bars() marker of the last bar journaled
+        if _exists_nonempty(path):
+            # Appending to an existing journal: continue its string table, and cut off
+            # a record torn by a crash so new records don't land behind garbage
+            valid_end = len(MAGIC)
+            for kind, _, payload, valid_end in _records(path):
+                if kind == STRING:
+                    self.strings[payload[1]] = payload[0]
+            with io.open(path, 'r+b') as f:
+                f.truncate(valid_end)
+            self.file = io.open(path, 'ab', buffering=buffer_size)
+        else:
+            self.file = io.open(path, 'ab', buffering=buffer_size)
+            self.file.write(MAGIC)
+        self._writers = {
+            MarketEvent: self._write_market,
+            SignalEvent: self._write_signal,
+            OrderEvent: self._write_order,
+            FillEvent: self._write_fill,
+        }
+
+    def attach(self, engine):
+        engine.subscribe(Event, self.record)
+        return self
+
+    def _id(self, text) -> int:
+        """Id of a string, writing it to the journal the first time it is seen."""
+        string_id = self.strings.get(text)
+        if string_id is None:
+            string_id = len(self.strings)
+            if string_id >= NOT_DATETIME:
+                raise OverflowError("Journal string table is full")
+            self.strings[text] = string_id
+            data = str(text).encode('utf-8')
+            self.file.write(_HEADER.pack(STRING, 0) + _STRING.pack(string_id, len(data)) + data)
+        return string_id
+
+    def _time(self, value):
+        ns, tz = _to_ns(value)
+        return ns, (tz if tz == NOT_DATETIME else self._id(tz) if tz is not None else NAIVE_TZ)
+
+    def _tz_id(self, columns):
+        if not columns.is_datetime:
+            tz = NOT_DATETIME
+        else:
+            tz = self._id(str(columns.tz)) if columns.tz is not None else NAIVE_TZ
+        # Ring buffers learn their tz from the first live bar, so only cache once it is known
+        if columns.tz is not None or len(columns):
+            self._column_tz[id(columns)] = (columns, tz)    # Holding the store keeps its id unique
+        return tz
+
+    def record(self, event):
+        writer = self._writers.get(event.__class__)
+        if writer is not None:
+            writer(event, time.time_ns())
+
+    def _write_market(self, event, now):
+        symbols = event.symbols
+        if symbols is None:
+            symbols = (self.data_handler.symbol,)
+        bars = []
+        for symbol in symbols:
+            n, self._seen[symbol] = self.data_handler.get_new_bars(symbol, self._seen.get(symbol))
+            bar = self.data_handler.get_latest_bar(symbol)
+            if bar is None:
+                continue
+            if isinstance(bar, Bar):
+                cached = self._column_tz.get(id(bar.columns))
+                tz = cached[1] if cached is not None else self._tz_id(bar.columns)
+                if n > 1:
+                    # A coalesced feed announced several bars: journal each, so a replay sees them all
+                    window = self.data_handler.get_latest_bars(symbol, n)
+                    symbol_id = self._id(symbol)
+                    for timestamp, o, h, l, c, v in zip(window['datetime'].view(np.int64), window['open'],
+                                                         window['high'], window['low'], window['close'],
+                                                         window['volume']):
+                        bars.append(_BAR.pack(symbol_id, timestamp, tz, o, h, l, c, v))
+                    continue
+                timestamp, o, h, l, c, v = bar.row()
+                bars.append(_BAR.pack(self._id(symbol), timestamp, tz, o, h, l, c, v))
+                continue
+            ns, tz = self._time(bar['datetime'])
+            bars.append(_BAR.pack(self._id(symbol), ns, tz, bar['open'], bar['high'], bar['low'],
+                                  bar['close'], bar.get('volume', 0.0)))
+        # A record counts its bars in 16 bits: a huge first batch (e.g. restored history) takes several
+        for start in range(0, max(len(bars), 1), _MAX_BARS):
+            chunk = bars[start:start + _MAX_BARS]
+            self.file.write(_HEADER.pack(MARKET, now) + _MARKET.pack(len(chunk)) + b''.join(chunk))
+
+    def _write_signal(self, event, now):
+        ns, tz = self._time(event.datetime)
+        self.file.write(_HEADER.pack(SIGNAL, now) + _SIGNAL.pack(
+            self._id(event.strategy_id), self._id(event.symbol), ns, tz,
+            self._id(event.signal_type), event.strength))
+
+    def _write_order(self, event, now):
+        self.file.write(_HEADER.pack(ORDER, now) + _ORDER.pack(
+            self._id(event.symbol), self._id(event.order_type), event.quantity, self._id(event.direction),
+            self._id(event.strategy_id or '')))
+
+    def _write_fill(self, event, now):
+        ns, tz = self._time(event.timeindex)
+        self.file.write(_HEADER.pack(FILL, now) + _FILL.pack(
+            self._id(event.symbol), ns, tz, self._id(event.exchange), event.quantity,
+            self._id(event.direction), event.fill_price, event.commission, self._id(event.strategy_id or '')))
+        # Fills change real positions: don't leave them sitting in the buffer
+        self.file.flush()
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def _exists_nonempty(path) -> bool:
+    try:
+        with io.open(path, 'rb') as f:
+            return bool(f.read(1))
+    except FileNotFoundError:
+        return False
+
+
+def _records(path, chunk_size: int = 1 << 20):
+    """
+    Yields (kind, recorded_at, payload, end offset) for every complete record;
+    STRING payloads are (id, text). Stops at a torn final record.
+    The file is read `chunk_size` bytes at a time, so replaying a long session
+    holds one chunk in memory, not the whole journal.
+    """
+    with io.open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an event journal")
+        data = b''
+        pos = 0                 # Next record in data
+        offset = len(MAGIC)     # File offset of data[0]
+        while True:
+            record = _parse(data, pos)
+            if record is None:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return      # End of file (possibly after a torn final write)
+                # Keep the incomplete record's bytes and read on
+                offset += pos
+                data = data[pos:] + chunk
+                pos = 0
+                continue
+            kind, recorded_at, payload, pos = record
+            yield kind, recorded_at, payload, offset + pos
+
+
+def _parse(data, pos):
+    """(kind, recorded_at, payload, end) of the record at data[pos:], or None if it is incomplete."""
+    end = len(data)
+    if pos + _HEADER.size > end:
+        return None
+    kind, recorded_at = _HEADER.unpack_from(data, pos)
+    pos += _HEADER.size
+    if kind == STRING:
+        if pos + _STRING.size > end:
+            return None
+        string_id, length = _STRING.unpack_from(data, pos)
+        pos += _STRING.size
+        if pos + length > end:
+            return None
+        payload = (string_id, data[pos:pos + length].decode('utf-8'))
+        pos += length
+    elif kind == MARKET:
+        if pos + _MARKET.size > end:
+            return None
+        count, = _MARKET.unpack_from(data, pos)
+        pos += _MARKET.size
+        if pos + count * _BAR.size > end:
+            return None
+        payload = list(_BAR.iter_unpack(data[pos:pos + count * _BAR.size]))
+        pos += count * _BAR.size
+    else:
+        layout = _LAYOUTS[kind]
+        if pos + layout.size > end:
+            return None
+        payload = layout.unpack_from(data, pos)
+        pos += layout.size
+    return kind, recorded_at, payload, pos
+
+
+_LAYOUTS = {SIGNAL: _SIGNAL, ORDER: _ORDER, FILL: _FILL}
+
+
+def _from_ns(ns, tz, strings):
+    if ns == NO_TIME:
+        return None
+    if tz == NOT_DATETIME:
+        return ns
+    return pd.Timestamp(ns, tz=strings[tz] or None)
+
+
+def read_journal(path):
+    """
+    Yields (recorded_at, event, bars) for every journaled event, in dispatch order.
+    `bars` is the list of (symbol, Timestamp, open, high, low, close, volume) a
+    MarketEvent announced, and None for the other events.
+    """
+    strings = {NAIVE_TZ: ''}
+    for kind, recorded_at, payload, _ in _records(path):
+        if kind == STRING:
+            strings[payload[0]] = payload[1]
+        elif kind == MARKET:
+            bars = [(strings[s], _from_ns(ns, tz, strings), o, h, l, c, v) for s, ns, tz, o, h, l, c, v in payload]
+            yield recorded_at, MarketEvent(symbols=tuple(bar[0] for bar in bars)), bars
+        elif kind == SIGNAL:
+            strategy_id, symbol, ns, tz, signal_type, strength = payload
+            yield recorded_at, SignalEvent(strings[strategy_id], strings[symbol], _from_ns(ns, tz, strings),
+                                           strings[signal_type], strength), None
+        elif kind == ORDER:
+            symbol, order_type, quantity, direction, strategy_id = payload
+            yield recorded_at, OrderEvent(strings[symbol], strings[order_type], quantity, strings[direction],
+                                          strategy_id=strings[strategy_id] or None), None
+        elif kind == FILL:
+            symbol, ns, tz, exchange, quantity, direction, price, commission, strategy_id = payload
+            yield recorded_at, FillEvent(_from_ns(ns, tz, strings), strings[symbol], strings[exchange], quantity,
+                                         strings[direction], price, commission,
+                                         strategy_id=strings[strategy_id] or None), None
@@ -0,0 +1,245 @@
+import os
+import time
+import inspect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from events import EventType
+
+# Pipeline hops, in the order a trade goes through them
+STAGES = ('data_to_signal', 'signal_to_order', 'order_to_ack', 'ack_to_fill')
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+_clock = time.perf_counter_ns
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of durations in nanoseconds. Buckets are linear within
+    each power of two (128 per octave), so any recorded value is kept to within
+    1/128 (< 1%) from nanoseconds up to hours, in a fixed array and without
+    storing samples. record() is a handful of integer ops.
+    """
+    # Values below 256 get a bucket each; above that, bucket = (shift << 7) + (ns >> shift)
+    # with shift = bit_length - 8, i.e. the top 8 bits of the value pick the bucket
+    SIZE = (64 - 8 + 2) << 7
+
+    def __init__(self):
+        self.counts = [0] * self.SIZE
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, ns: int):
+        if ns < 256:
+            index = ns if ns > 0 else 0
+        else:
+            shift = ns.bit_length() - 8
+            index = (shift << 7) + (ns >> shift)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    @staticmethod
+    def _highest_value(index: int) -> int:
+        """Largest value that lands in bucket `index`."""
+        if index < 256:
+            return index
+        shift = (index >> 7) - 1
+        top = index - (shift << 7)
+        return ((top + 1) << shift) - 1
+
+    def value_at_quantile(self, q: float) -> int:
+        """Duration (ns) that a fraction q of the recorded values do not exceed; 0 if empty."""
+        if not self.count:
+            return 0
+        target = max(1, -int(-q * self.count // 1))     # ceil(q * count)
+        seen = 0
+        for index, n in enumerate(self.counts):
+            if n:
+                seen += n
+                if seen >= target:
+                    return min(self._highest_value(index), self.max)
+        return self.max
+
+
+class PipelineLatency:
+    """
+    Times every hop between a bar arriving and its fill landing in the portfolio:
+    data->signal (bar received by the data handler -> SignalEvent dispatched),
+    signal->order, order->ack (OrderEvent dispatched -> broker acknowledged it)
+    and ack->fill (-> FillEvent dispatched), plus the time each engine handler
+    takes per event. Hops are matched by (strategy_id, symbol).
+
+    Attach with PipelineLatency(engine).attach(). Metrics are exposed in the
+    Prometheus text format: write() to a file (e.g. for node_exporter's textfile
+    collector; done automatically every `interval` seconds when `path` is set)
+    and/or serve() on a local port. Nothing is timed unless it is attached.
+    """
+    def __init__(self, engine, path: str = os.getenv("LATENCY_METRICS_PATH"), interval: float = 15.0):
+        self.engine = engine
+        self.path = path
+        self.interval = interval
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        self.handlers = {}      # (event class name, handler name) -> LatencyHistogram
+        self._bar_ns = {}       # symbol -> when its latest bar arrived
+        self._signal_ns = {}    # (strategy_id, symbol) -> when the signal was dispatched
+        self._order_ns = {}     # ... the order was dispatched
+        self._ack_ns = {}       # ... the broker acknowledged the order
+        self._last_write = time.monotonic()
+        self._server = None
+
+    def attach(self):
+        self.engine.latency = self
+        self.engine._routes.clear()     # Rebuild the routes with timed handlers
+        execution = getattr(self.engine, 'execution', None)
+        if execution is not None:
+            execution.latency = self
+        return self
+
+    def detach(self):
+        self.engine.latency = None
+        self.engine._routes.clear()
+        if getattr(self.engine.execution, 'latency', None) is self:
+            self.engine.execution.latency = None
+
+    # --- Engine hooks ---
+
+    def instrument(self, event_class, route: tuple) -> tuple:
+        """Called by TradingEngine when it builds a route: stamps the event, then times each handler."""
+        return (self.on_event,) + tuple(self._timed(event_class, handler) for handler in route)
+
+    def _timed(self, event_class, handler):
+        histogram = self.handlers.setdefault((event_class.__name__, _handler_name(handler)), LatencyHistogram())
+        record = histogram.record
+
+        def timed(event):
+            start = _clock()
+            result = handler(event)
+            if result is not None and inspect.isawaitable(result):
+                return _timed_await(result, start, record)
+            record(_clock() - start)
+            return result
+        return timed
+
+    def on_event(self, event):
+        now = _clock()
+        kind = event.type_id
+        if kind == EventType.MARKET:
+            # Live handlers stamp arrivals in on_bar_update; otherwise the bar "arrives" now
+            arrivals = getattr(self.engine.data_handler, 'arrival_ns', None) or {}
+            for symbol in event.symbols or ():
+                self._bar_ns[symbol] = arrivals.get(symbol, now)
+            if self.path and time.monotonic() - self._last_write >= self.interval:
+                self.write()
+        elif kind == EventType.SIGNAL:
+            start = self._bar_ns.get(event.symbol)
+            if start is not None:
+                self.stages['data_to_signal'].record(now - start)
+            self._signal_ns[(event.strategy_id, event.symbol)] = now
+        elif kind == EventType.ORDER:
+            key = (event.strategy_id, event.symbol)
+            start = self._signal_ns.pop(key, None)
+            if start is not None:
+                self.stages['signal_to_order'].record(now - start)
+            self._order_ns[key] = now
+        elif kind == EventType.FILL:
+            key = (event.strategy_id, event.symbol)
+            start = self._ack_ns.pop(key, None)
+            if start is not None:
+                self.stages['ack_to_fill'].record(now - start)
+            self._order_ns.pop(key, None)
+
+    def acked(self, order):
+        """Execution handlers call this when the broker has acknowledged an OrderEvent."""
+        now = _clock()
+        key = (order.strategy_id, order.symbol)
+        start = self._order_ns.pop(key, None)
+        if start is not None:
+            self.stages['order_to_ack'].record(now - start)
+        self._ack_ns[key] = now
+
+    # --- Output ---
+
+    def prometheus_text(self) -> str:
+        lines = ['# HELP trading_stage_latency_seconds Time between consecutive pipeline stages.',
+                 '# TYPE trading_stage_latency_seconds summary']
+        for stage, histogram in self.stages.items():
+            lines += _summary('trading_stage_latency_seconds', f'stage="{stage}"', histogram)
+        lines += ['# HELP trading_handler_seconds Time spent in each engine handler per event.',
+                  '# TYPE trading_handler_seconds summary']
+        for (event_name, handler_name), histogram in self.handlers.items():
+            lines += _summary('trading_handler_seconds', f'event="{event_name}",handler="{handler_name}"', histogram)
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str = None):
+        """Writes the metrics file atomically (so a scraper never reads half of it)."""
+        path = path or self.path
+        self._last_write = time.monotonic()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int = 9108, host: str = '127.0.0.1'):
+        """Serves the metrics at http://host:port/metrics from a background thread."""
+        latency = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = latency.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass    # Don't print a line per scrape
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"[LATENCY] Serving metrics on http://{host}:{self._server.server_port}/metrics")
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self.path:
+            self.write()
+
+    def report(self):
+        """Prints p50/p99/max per stage and handler, in microseconds."""
+        rows = [(stage, h) for stage, h in self.stages.items()]
+        rows += [(f"{event_name} -> {handler_name}", h) for (event_name, handler_name), h in self.handlers.items()]
+        for name, h in rows:
+            if h.count:
+                print(f"[LATENCY] {name}: n={h.count}, p50 {h.value_at_quantile(0.5) / 1e3:.1f} us, "
+                      f"p99 {h.value_at_quantile(0.99) / 1e3:.1f} us, max {h.max / 1e3:.1f} us")
+
+
+async def _timed_await(awaitable, start, record):
+    try:
+        return await awaitable
+    finally:
+        record(_clock() - start)
+
+
+def _handler_name(handler) -> str:
+    owner = getattr(handler, '__self__', None)
+    if owner is None or inspect.isclass(owner):
+        return getattr(handler, '__qualname__', repr(handler))
+    name = f"{owner.__class__.__name__}.{handler.__name__}"
+    strategy_id = getattr(owner, 'strategy_id', None)
+    return f"{name}[{strategy_id}]" if strategy_id else name
+
+
+def _summary(metric: str, labels: str, histogram: LatencyHistogram) -> list:
+    lines = [f'{metric}{{{labels},quantile="{q}"}} {histogram.value_at_quantile(q) / 1e9:.9f}' for q in QUANTILES]
+    lines.append(f'{metric}_sum{{{labels}}} {histogram.total / 1e9:.9f}')
+    lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+    return lines
@@ -1,12 +1,17 @@
+import os
 import queue
 
 from ib_insync import Stock, MarketOrder, IB, util
 
-from systems import IBKRConnection, HistoricPandasDataHandler, IBKRLiveDataHandler, TradingEngine
-from events import MarketEvent, SignalEvent, OrderEvent, FillEvent
+from systems import IBKRConnection, HistoricPandasDataHandler, IBKRLiveDataHandler, TradingEngine, AsyncTradingEngine
+from events import MarketEvent, SignalEvent, OrderEvent, FillEvent, EventQueue, AsyncEventQueue
 from strategy import MovingAverageStrategy, MachineLearningStrategy
 from portfolio_manager import PortfolioManager
-from execution import ExecutionHandler, SimulatedExecutionHandler
+from execution import ExecutionHandler, SimulatedExecutionHandler, AsyncIBKRExecutionHandler
+from journal import EventJournal
+from snapshot import EngineSnapshotter
+from latency import PipelineLatency
+from position_book import PositionBook
 
 import nest_asyncio
 nest_asyncio.apply()
@@ -16,8 +21,11 @@ if __name__ == "__main__":
     
     # --- CHOOSE YOUR MODE ---
     MODE = "BACKTEST" # Change to "LIVE" when ready
+    VECTORIZED = False  # Whole-array backtest (MovingAverageStrategy only), checked against the engine
     symbol = 'AAPL'
-    events_queue = queue.Queue()
+    # Backtests run single-threaded, so the lock-free EventQueue is enough;
+    # live mode runs on ib_insync's event loop and awaits an AsyncEventQueue
+    events_queue = EventQueue() if MODE == "BACKTEST" else AsyncEventQueue()
 
     # 1. Connect to IBKR
     ib_conn = IBKRConnection(live_trading=False) # live_trading=False uses paper port 7497
@@ -35,6 +43,12 @@ if __name__ == "__main__":
             prices = 150 + 20 * np.sin(np.linspace(0, 4 * np.pi, 200))
             dummy_df = pd.DataFrame({'open': prices, 'high': prices+1, 'low': prices-1, 'close': prices}, index=dates)
         
+        if VECTORIZED:
+            from vectorized import verify_against_engine
+            result = verify_against_engine(dummy_df, symbol, fast_period=10, slow_period=30, initial_capital=100000.0)
+            print(f"Vectorized backtest matches the engine. Final equity: {result['equity'].iloc[-1]:.2f}")
+            raise SystemExit
+
         data_handler = HistoricPandasDataHandler(events_queue, dummy_df, symbol)
         strategy = MovingAverageStrategy(events_queue, data_handler, symbol, fast_period=10, slow_period=30)
         portfolio = PortfolioManager(events_queue, data_handler, initial_capital=100000.0)
@@ -42,4 +56,35 @@ if __name__ == "__main__":
 
         # 3. Run Engine
         engine = TradingEngine(data_handler, strategy, portfolio, execution, events_queue)
+        # Simulated fills are all the position book gets here (no IBKR events)
+        positions = PositionBook().attach_engine(engine)
+        engine.run()
+        print(f"Position book: {symbol} {positions.position(symbol)}")
+
+    elif MODE == "LIVE":
+        data_handler = IBKRLiveDataHandler(events_queue, ib_conn, contract)
+        strategy = MovingAverageStrategy(events_queue, data_handler, symbol, fast_period=10, slow_period=30)
+        portfolio = PortfolioManager(events_queue, data_handler, initial_capital=100000.0)
+        execution = AsyncIBKRExecutionHandler(events_queue, ib_conn, symbols=[symbol])
+        data_handler.start_live_feed()
+
+        # Runs until Ctrl+C; bars are handled as soon as ib_insync delivers them
+        engine = AsyncTradingEngine(data_handler, strategy, portfolio, execution, events_queue)
+        # Broker positions and account values, kept current by IBKR's events and our fills
+        positions = PositionBook(ib_conn.get_ib()).attach_engine(engine)
+        # Everything the engine sees is journaled; replay it later with ReplayDataHandler
+        journal = EventJournal(f"{symbol}_live.evj", data_handler).attach(engine)
+        # Warm restart: pick up where the last session stopped, then trust the broker's positions
+        snapshotter = EngineSnapshotter(engine).attach()
+        snapshotter.restore()
+        snapshotter.reconcile(ib_conn.get_ib())
+        snapshotter.watch_reconnects(ib_conn.get_ib())
+        # Per-stage latency histograms, for Prometheus: LATENCY_METRICS_PATH (textfile) and/or METRICS_PORT
+        latency = PipelineLatency(engine).attach()
+        if os.getenv("METRICS_PORT"):
+            latency.serve(int(os.getenv("METRICS_PORT")))
         engine.run()
+        latency.close()
+        snapshotter.snapshot()
+        journal.close()
+        ib_conn.disconnect()
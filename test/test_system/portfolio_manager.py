@@ -15,6 +15,10 @@ class PortfolioManager:
         
         # Tracks how many shares of each symbol we currently own
         self.holdings = {} 
+        # ... and how many of them each strategy is responsible for: (strategy_id, symbol) -> qty.
+        # Several strategies can share this portfolio; each one's orders are sized
+        # from its own position, so one strategy's exit never closes another's trade.
+        self.strategy_holdings = {}
         self.equity_curve = [] 
         
     def update_signal(self, event):
@@ -31,21 +35,21 @@ class PortfolioManager:
             # In a pro system, you'd calculate: (Risk_per_trade / Stop_Loss_Distance)
             order_quantity = 10 
             
-            # Check current holdings
-            current_qty = self.holdings.get(symbol, 0)
+            # Check what this strategy currently holds
+            current_qty = self.strategy_holdings.get((event.strategy_id, symbol), 0)
             order_type = 'MKT' # Market order
             
             # 2. Translate Strategy Signals into specific Broker Orders
             if direction == 'LONG' and current_qty == 0:
                 # We have no position, strategy says go LONG. We buy.
-                order = OrderEvent(symbol, order_type, order_quantity, 'BUY')
+                order = OrderEvent(symbol, order_type, order_quantity, 'BUY', strategy_id=event.strategy_id)
                 self.events_queue.put(order)
                 print(f"[PORTFOLIO] Approved LONG signal. Generated BUY order for {order_quantity} {symbol}.")
                 
             elif direction == 'SHORT' and current_qty > 0:
                 # We are long, strategy says go SHORT/EXIT. We sell our current position to close.
                 # Note: We sell 'current_qty' to flatten the position.
-                order = OrderEvent(symbol, order_type, current_qty, 'SELL')
+                order = OrderEvent(symbol, order_type, current_qty, 'SELL', strategy_id=event.strategy_id)
                 self.events_queue.put(order)
                 print(f"[PORTFOLIO] Approved SHORT/EXIT signal. Generated SELL order to close {current_qty} {symbol}.")
             
@@ -59,23 +63,40 @@ class PortfolioManager:
         """
         if event.type == 'FILL':
             fill_cost = event.quantity * event.fill_price
+            key = (event.strategy_id, event.symbol)
             
             if event.direction == 'BUY':
                 self.holdings[event.symbol] = self.holdings.get(event.symbol, 0) + event.quantity
+                self.strategy_holdings[key] = self.strategy_holdings.get(key, 0) + event.quantity
                 self.current_cash -= (fill_cost + event.commission)
             elif event.direction == 'SELL':
                 self.holdings[event.symbol] = self.holdings.get(event.symbol, 0) - event.quantity
+                self.strategy_holdings[key] = self.strategy_holdings.get(key, 0) - event.quantity
                 self.current_cash += (fill_cost - event.commission)
                 
             print(f"[PORTFOLIO] Fill received. New Cash Balance: ${self.current_cash:.2f} | Holdings: {self.holdings}")
 
             
-    def record_equity(self):
+    def record_equity(self, event=None):
         total_holdings_value = 0.0
         for symbol, qty in self.holdings.items():
             latest = self.data_handler.get_latest_bar(symbol)
             if latest: total_holdings_value += (qty * latest['close'])
         
         total_equity = self.current_cash + total_holdings_value
-        latest_date = self.data_handler.get_latest_bar(list(self.holdings.keys())[0] if self.holdings else 'AAPL')['datetime']
-        self.equity_curve.append({'datetime': latest_date, 'equity': total_equity})
\ No newline at end of file
+        latest_date = self.data_handler.get_latest_datetime()
+        self.equity_curve.append({'datetime': latest_date, 'equity': total_equity})
+
+    def snapshot_state(self) -> dict:
+        return {
+            'current_cash': self.current_cash,
+            'holdings': dict(self.holdings),
+            'strategy_holdings': dict(self.strategy_holdings),
+            'equity_curve': list(self.equity_curve),
+        }
+
+    def restore_state(self, state: dict):
+        self.current_cash = state['current_cash']
+        self.holdings = dict(state['holdings'])
+        self.strategy_holdings = dict(state.get('strategy_holdings', {}))
+        self.equity_curve = list(state['equity_curve'])
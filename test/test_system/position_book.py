@@ -0,0 +1,206 @@
+import time
+
+from events import FillEvent
+
+
+class PositionBook:
+    """
+    Local copy of the account's positions and account values, seeded once from
+    ib.positions() / ib.accountValues() and then kept current by events, so
+    "what do we hold in AAPL?" is a dict lookup instead of a scan of ib.portfolio().
+
+    - positionEvent is authoritative: it sets the position outright (IBKR's own figure wins),
+    - execDetailsEvent applies each execution as it happens (once per execId), as a
+      provisional change on top of the last positionEvent until one reflects it,
+    - our own FillEvents (attach_engine) apply whatever the executions have not
+      already covered, which is everything in a simulated run and normally
+      nothing live, where the executions arrive before the order reports Filled.
+
+    TWS doesn't order execDetails and position updates: a position update can
+    already include an execution we haven't received. The change it reports
+    beyond our provisional executions is held as "ahead" and absorbs those
+    executions when they arrive (for up to `match_window` seconds), so either
+    order books the fill once.
+    """
+    def __init__(self, ib=None, match_window: float = 10.0):
+        self.positions = {}         # symbol -> quantity, summed over accounts
+        self.avg_cost = {}          # symbol -> average cost (as IBKR reports it)
+        self.account_values = {}    # (tag, currency) -> value, e.g. ('NetLiquidation', 'USD')
+        self.match_window = match_window
+        self._by_account = {}       # (account, symbol) -> quantity (reported + provisional)
+        self._reported = {}         # (account, symbol) -> quantity in the last positionEvent
+        self._provisional = {}      # (account, symbol) -> net executions that positionEvent doesn't include yet
+        self._ahead = {}            # (account, symbol) -> (net change it included before the executions came, when)
+        self._exec_ids = set()
+        self._unfilled = {}         # symbol -> signed quantity executed but not yet seen as a FillEvent
+        self.account = ''           # Account our own fills are booked to
+        if ib is not None:
+            self.connect(ib)
+
+    def connect(self, ib):
+        """Seeds the book from ib_insync's (already synced) state and subscribes to its updates."""
+        for position in ib.positions():
+            self._report(position, match=False)
+        for value in ib.accountValues():
+            self.on_account_value(value)
+        ib.positionEvent += self.on_position
+        ib.execDetailsEvent += self.on_exec_details
+        ib.accountValueEvent += self.on_account_value
+        return self
+
+    def attach_engine(self, engine):
+        engine.subscribe(FillEvent, self.on_fill)
+        return self
+
+    def position(self, symbol) -> float:
+        return self.positions.get(symbol, 0)
+
+    def account_value(self, tag: str, currency: str = 'USD'):
+        return self.account_values.get((tag, currency))
+
+    def _set(self, key):
+        quantity = self._reported.get(key, 0) + self._provisional.get(key, 0)
+        symbol = key[1]
+        self.positions[symbol] = self.positions.get(symbol, 0) + quantity - self._by_account.get(key, 0)
+        self._by_account[key] = quantity
+
+    def _report(self, position, match=True):
+        account, symbol = position.account, position.contract.symbol
+        self.account = self.account or account
+        key = (account, symbol)
+        if match:
+            # The executions this update already includes are no longer provisional;
+            # whatever else it includes is ahead of executions still on their way
+            change = position.position - self._reported.get(key, 0)
+            provisional = self._provisional.get(key, 0)
+            covered = _overlap(change, provisional)
+            self._provisional[key] = provisional - covered
+            if change != covered:
+                ahead = self._ahead_of(key)
+                self._ahead[key] = (ahead + change - covered, time.monotonic())
+        self._reported[key] = position.position
+        self._set(key)
+        self.avg_cost[symbol] = position.avgCost
+
+    def _ahead_of(self, key) -> float:
+        ahead, since = self._ahead.get(key, (0, 0.0))
+        if ahead and time.monotonic() - since > self.match_window:
+            # No execution came for it (e.g. a trade by another API client): stop waiting
+            del self._ahead[key]
+            return 0
+        return ahead
+
+    def _execute(self, account, symbol, quantity):
+        """Applies an execution unless the last positionEvent already included it."""
+        self.account = self.account or account
+        key = (account, symbol)
+        ahead = self._ahead_of(key)
+        covered = _overlap(quantity, ahead)
+        if covered:
+            self._ahead[key] = (ahead - covered, time.monotonic())
+            quantity -= covered
+        if quantity:
+            self._provisional[key] = self._provisional.get(key, 0) + quantity
+            self._set(key)
+
+    def on_position(self, position):
+        self._report(position)
+
+    def on_exec_details(self, trade, fill):
+        execution = fill.execution
+        if execution.execId in self._exec_ids:
+            return
+        self._exec_ids.add(execution.execId)
+        symbol = fill.contract.symbol
+        quantity = execution.shares if execution.side == 'BOT' else -execution.shares
+        self._execute(execution.acctNumber or self.account, symbol, quantity)
+        self._unfilled[symbol] = self._unfilled.get(symbol, 0) + quantity
+
+    def on_account_value(self, value):
+        self.account_values[(value.tag, value.currency)] = value.value
+
+    def on_fill(self, event):
+        quantity = event.quantity if event.direction == 'BUY' else -event.quantity
+        unfilled = self._unfilled.get(event.symbol, 0)
+        # The part of the fill the executions already booked
+        covered = _overlap(quantity, unfilled)
+        if covered:
+            self._unfilled[event.symbol] = unfilled - covered
+            quantity -= covered
+        if quantity:
+            self._execute(self.account, event.symbol, quantity)
+
+
+def _overlap(quantity, other):
+    """The part of signed quantity that other (signed) accounts for: same direction, at most either size."""
+    if quantity * other <= 0:
+        return 0
+    return min(abs(quantity), abs(other)) * (1 if quantity > 0 else -1)
+
+
+if __name__ == "__main__":
+    # Executions and position updates in either order must book each fill once
+    from ib_insync import Stock, Position, Fill, Execution, CommissionReport
+
+    contract = Stock('AAPL', 'SMART', 'USD')
+
+    def position(quantity):
+        return Position('DU123', contract, quantity, 150.0)
+
+    def execution(exec_id, side, shares):
+        return None, Fill(contract, Execution(execId=exec_id, acctNumber='DU123', side=side, shares=shares),
+                          CommissionReport(), None)
+
+    def check(name, events, expected):
+        book = PositionBook()
+        book.on_position(position(0))
+        for event in events:
+            if isinstance(event, Position):
+                book.on_position(event)
+            elif isinstance(event, FillEvent):
+                book.on_fill(event)
+            else:
+                book.on_exec_details(*event)
+        if book.position('AAPL') != expected:
+            raise AssertionError(f"{name}: position {book.position('AAPL')}, expected {expected}")
+        print(f"{name}: {expected}")
+
+    buy = FillEvent(None, 'AAPL', 'SMART', 10, 'BUY', 150.0)
+    check("execution, then position update", [execution('1', 'BOT', 10), position(10)], 10)
+    check("position update, then execution", [position(10), execution('1', 'BOT', 10)], 10)
+    check("position update, execution, our fill", [position(10), execution('1', 'BOT', 10), buy], 10)
+    check("execution, our fill, position update", [execution('1', 'BOT', 10), buy, position(10)], 10)
+    check("partial fills around one update",
+          [execution('1', 'BOT', 4), position(10), execution('2', 'BOT', 6)], 10)
+    check("two updates ahead of both executions",
+          [position(4), position(10), execution('1', 'BOT', 4), execution('2', 'BOT', 6)], 10)
+    check("buy then sell, updates first",
+          [position(10), execution('1', 'BOT', 10), position(0), execution('2', 'SLD', 10)], 0)
+    check("duplicate execution", [execution('1', 'BOT', 10), execution('1', 'BOT', 10), position(10)], 10)
+    check("simulated fill", [buy], 10)
+    check("execution not yet reported", [execution('1', 'BOT', 10)], 10)
+
+    # Through the engine: its FillEvents (simulated here) keep the book level with the portfolio
+    import numpy as np
+    import pandas as pd
+    from events import EventQueue
+    from systems import HistoricPandasDataHandler, TradingEngine
+    from strategy import MovingAverageStrategy
+    from portfolio_manager import PortfolioManager
+    from execution import SimulatedExecutionHandler
+
+    prices = 150 + 20 * np.sin(np.linspace(0, 4 * np.pi, 200))
+    data = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices},
+                        index=pd.date_range('2023-01-01', periods=200, freq='D'))
+    events_queue = EventQueue()
+    data_handler = HistoricPandasDataHandler(events_queue, data, 'AAPL')
+    portfolio = PortfolioManager(events_queue, data_handler, initial_capital=100000.0)
+    engine = TradingEngine(data_handler, MovingAverageStrategy(events_queue, data_handler, 'AAPL', 10, 30),
+                           portfolio, SimulatedExecutionHandler(events_queue, data_handler), events_queue)
+    book = PositionBook().attach_engine(engine)
+    fills = []
+    engine.subscribe(FillEvent, lambda event: fills.append(book.position('AAPL') == portfolio.holdings['AAPL']))
+    engine.run()
+    if not fills or not all(fills):
+        raise AssertionError(f"book and portfolio disagree after {fills.count(False)} of {len(fills)} fills")
+    print(f"engine run: book matches the portfolio after all {len(fills)} fills")
@@ -0,0 +1,151 @@
+import os
+import time
+import pickle
+
+from events import MarketEvent, FillEvent
+
+# Engine attributes whose state is saved (when the component implements snapshot_state);
+# strategies are saved one by one, keyed by strategy_id
+COMPONENTS = ('data_handler', 'portfolio', 'execution')
+
+
+class EngineSnapshotter:
+    """
+    Periodically saves the live engine's state (bar history, strategy stance,
+    cash, holdings, equity curve) to local disk so a restarted process can carry
+    on mid-session instead of waiting slow_period fresh bars.
+
+    Components opt in by implementing snapshot_state() -> dict and
+    restore_state(state). Snapshots are taken after a MarketEvent has been
+    handled, at most once every `interval` seconds, plus right after every fill
+    (so a position change is never lost), and written atomically.
+    """
+    def __init__(self, engine, path: str = os.getenv("ENGINE_SNAPSHOT_PATH", "engine_state.pkl"),
+                 interval: float = 30.0):
+        self.engine = engine
+        self.path = path
+        self.interval = interval
+        self._last_snapshot = time.monotonic()
+
+    def attach(self):
+        # Subscribed last, so it sees the state after strategy and portfolio handled the bar
+        self.engine.subscribe(MarketEvent, self.on_market)
+        self.engine.subscribe(FillEvent, self.on_fill)
+        return self
+
+    def _components(self):
+        for name in COMPONENTS:
+            component = getattr(self.engine, name, None)
+            if hasattr(component, 'snapshot_state'):
+                yield name, component
+        # Shared indicators, restored after the bar history they were built from
+        indicators = getattr(self.engine.data_handler, 'indicators', None)
+        if indicators is not None:
+            yield 'indicators', indicators
+        for strategy in self.engine.strategies:
+            if hasattr(strategy, 'snapshot_state'):
+                yield f"strategy:{getattr(strategy, 'strategy_id', '')}", strategy
+
+    def on_market(self, event):
+        now = time.monotonic()
+        if now - self._last_snapshot >= self.interval:
+            self._last_snapshot = now
+            self.snapshot()
+
+    def on_fill(self, event):
+        self._last_snapshot = time.monotonic()
+        self.snapshot()
+
+    def snapshot(self):
+        """Writes the current state now."""
+        state = {'saved_at': time.time(),
+                 'components': {name: component.snapshot_state() for name, component in self._components()}}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def restore(self) -> bool:
+        """
+        Loads the last snapshot into the components; returns False if there is none.
+        Call it after the live feed has started: bars newer than the snapshot are then
+        taken from the feed (data_handler.backfill()) and the indicators rebuilt.
+        """
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print(f"[SNAPSHOT] Ignoring unreadable snapshot {self.path}: {e}")
+            return False
+        saved = state['components']
+        for name, component in self._components():
+            if name in saved:
+                component.restore_state(saved[name])
+            elif hasattr(component, 'warm_up'):
+                component.warm_up()     # Not in this snapshot: rebuild from the restored history
+        age = time.time() - state['saved_at']
+        print(f"[SNAPSHOT] Restored state from {self.path} (saved {age:.0f}s ago).")
+
+        # Bars that came in while we were down: append them to the restored history and
+        # rebuild the indicators from it, so no moving average spans the gap
+        data_handler = self.engine.data_handler
+        backfill = getattr(data_handler, 'backfill', None)
+        added = backfill() if backfill is not None else 0
+        if added:
+            indicators = getattr(data_handler, 'indicators', None)
+            if indicators is not None:
+                indicators.warm_up()
+            print(f"[SNAPSHOT] Backfilled {added} bars from the live feed.")
+        return True
+
+    def reconcile(self, ib):
+        """
+        Makes the portfolio's holdings match the broker's positions (the broker is
+        the source of truth: fills may have happened while we were down), and lets
+        the strategy know about any difference.
+        """
+        broker = {}
+        for position in ib.positions():
+            symbol = position.contract.symbol
+            broker[symbol] = broker.get(symbol, 0) + position.position
+        portfolio = self.engine.portfolio
+        for symbol in set(portfolio.holdings) | set(broker):
+            ours = portfolio.holdings.get(symbol, 0)
+            theirs = broker.get(symbol, 0)
+            theirs = int(theirs) if float(theirs).is_integer() else theirs
+            if ours == theirs:
+                continue
+            print(f"[RECONCILE] {symbol}: portfolio had {ours}, broker has {theirs}. Using the broker's position.")
+            portfolio.holdings[symbol] = theirs
+            self._reattribute(symbol, theirs)
+
+    def _reattribute(self, symbol, quantity):
+        """
+        Splits a corrected position back over the strategies. The broker only knows
+        the total: if it is flat every strategy is flat, if exactly one strategy
+        trades the symbol it owns all of it; anything else is left for a human.
+        """
+        portfolio = self.engine.portfolio
+        if not hasattr(portfolio, 'strategy_holdings'):
+            return
+        traders = [s for s in self.engine.strategies if getattr(s, 'symbol', symbol) == symbol]
+        if not traders:
+            return      # e.g. a position opened by hand
+        if quantity != 0 and len(traders) != 1:
+            print(f"[RECONCILE] Can't tell which of {len(traders)} strategies owns the {symbol} difference; "
+                  f"per-strategy positions left as they were.")
+            return
+        for key in [key for key in portfolio.strategy_holdings if key[1] == symbol]:
+            portfolio.strategy_holdings[key] = 0
+        for strategy in traders:
+            if quantity != 0:
+                portfolio.strategy_holdings[(getattr(strategy, 'strategy_id', None), symbol)] = quantity
+            if hasattr(strategy, 'sync_position'):
+                strategy.sync_position(symbol, quantity)
+
+    def watch_reconnects(self, ib):
+        """Reconciles every time the IB connection is (re)established."""
+        ib.connectedEvent += lambda: self.reconcile(ib)
+        return self
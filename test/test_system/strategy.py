@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
-from collections import deque
 import numpy as np
 
+from indicators import SMA, IndicatorRegistry
 from events import SignalEvent, MarketEvent, Event, OrderEvent, FillEvent
 from systems import HistoricPandasDataHandler, IBKRLiveDataHandler
 
@@ -25,17 +25,23 @@ class Strategy(ABC):
 class MovingAverageStrategy(Strategy):
     """
     Event-driven Moving Average Crossover Strategy.
+    Give each instance its own strategy_id when several run in one engine.
     """
-    def __init__(self, events_queue, data_handler, symbol, fast_period=10, slow_period=30):
+    def __init__(self, events_queue, data_handler, symbol, fast_period=10, slow_period=30, strategy_id="MA_Cross_1"):
         self.events_queue = events_queue
         self.data_handler = data_handler
         self.symbol = symbol
         self.fast_period = fast_period
         self.slow_period = slow_period
+        self.strategy_id = strategy_id
         
-        # Internal memory (Stateful processing)
-        # deque automatically pushes old prices out when it reaches maxlen
-        self.prices = deque(maxlen=slow_period) 
+        # Streaming moving averages: O(1) per bar whatever the window, no price copies.
+        # They come from the data handler's shared registry, so strategies asking for
+        # the same MA share one (each bar is applied once, by whoever asks first).
+        # The fast MA is taken from the slow window, so it can never span more bars.
+        self.indicators = IndicatorRegistry.for_handler(data_handler)
+        self.fast_ma = self.indicators.get(symbol, SMA, min(fast_period, slow_period))
+        self.slow_ma = self.indicators.get(symbol, SMA, slow_period)
         
         # Track what the strategy currently thinks our position is
         # (1 = Long, -1 = Short, 0 = Flat)
@@ -46,26 +52,27 @@ class MovingAverageStrategy(Strategy):
         Triggered every time a new MarketEvent is pulled from the queue.
         """
         if event.type == 'MARKET':
+            # Skip updates that don't touch our symbol (multi-symbol feeds)
+            if event.symbols is not None and self.symbol not in event.symbols:
+                return
+            
             latest_bar = self.data_handler.get_latest_bar(self.symbol)
             
             if latest_bar is not None:
-                # Add the newest price to our rolling window
-                self.prices.append(latest_bar['close'])
+                # A no-op when the engine already fed this bar to the registry
+                self.indicators.advance(self.symbol)
+                fast_ma = self.fast_ma.value
+                slow_ma = self.slow_ma.value
                 
                 # Do not generate signals until we have enough data to calculate the slow MA
-                if len(self.prices) == self.slow_period:
-                    # Convert deque to list for calculation
-                    price_list = list(self.prices)
-                    
-                    fast_ma = np.mean(price_list[-self.fast_period:])
-                    slow_ma = np.mean(price_list[-self.slow_period:])
+                if self.slow_ma.ready:
                     
                     # LOGIC: Fast crosses ABOVE Slow -> BUY
                     if fast_ma > slow_ma and self.current_position <= 0:
                         print(f"[{latest_bar['datetime']}] SIGNAL: Fast MA ({fast_ma:.2f}) > Slow MA ({slow_ma:.2f}). Going LONG.")
                         
                         signal = SignalEvent(
-                            strategy_id="MA_Cross_1", 
+                            strategy_id=self.strategy_id, 
                             symbol=self.symbol, 
                             datetime=latest_bar['datetime'], 
                             signal_type='LONG', 
@@ -79,7 +86,7 @@ class MovingAverageStrategy(Strategy):
                         print(f"[{latest_bar['datetime']}] SIGNAL: Fast MA ({fast_ma:.2f}) < Slow MA ({slow_ma:.2f}). Going SHORT/FLAT.")
                         
                         signal = SignalEvent(
-                            strategy_id="MA_Cross_1", 
+                            strategy_id=self.strategy_id, 
                             symbol=self.symbol, 
                             datetime=latest_bar['datetime'], 
                             signal_type='SHORT', 
@@ -88,6 +95,23 @@ class MovingAverageStrategy(Strategy):
                         self.events_queue.put(signal)
                         self.current_position = -1 # Update state   
 
+    def snapshot_state(self) -> dict:
+        # The moving averages belong to the registry, which is saved on its own
+        return {'current_position': self.current_position}
+
+    def restore_state(self, state: dict):
+        self.current_position = state['current_position']
+
+    def sync_position(self, symbol, quantity):
+        """Aligns the strategy's view with the broker's actual position (see EngineSnapshotter.reconcile)."""
+        if symbol != self.symbol:
+            return
+        if quantity > 0:
+            self.current_position = 1
+        elif self.current_position == 1:
+            # We thought we were long but are not: forget the stance so the next cross decides
+            self.current_position = 0
+
 class MachineLearningStrategy(Strategy):
     """ No space left on current device, will implement later """
     def __init__(self, events_queue, data_handler, model_path):
@@ -142,6 +166,7 @@ class MachineLearningStrategy(Strategy):
 #             print(f"Market Tick -> Date: {latest['datetime'].date()} | Price: ${latest['close']:.2f}")
             
 #             # The Engine passes the MarketEvent to the strategy
+#             # (which also feeds the bar to the data handler's shared moving averages)
 #             mac_strategy.calculate_signals(event)
             
 #         elif event.type == 'SIGNAL':
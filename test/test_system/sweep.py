@@ -0,0 +1,150 @@
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from bars import ColumnarBars, BAR_FIELDS
+from evaluation import QuantitativeEvaluator
+from vectorized import backtest_moving_average, run_event_driven
+
+# Row layout of the shared price block: timestamps (as int64) then OHLCV
+_ROWS = ('timestamp',) + BAR_FIELDS
+
+# Set once per worker process by _attach()
+_WORKER_SHM = None
+_WORKER_BARS = None
+
+
+def parameter_grid(grid: dict) -> list:
+    """{'fast_period': [5, 10], 'slow_period': [30, 50]} -> list of every combination as a dict."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+class SharedArray:
+    """
+    A NumPy array copied into a shared memory block, so worker processes can map
+    it (attach()) instead of receiving a pickled copy with every task.
+    Use as a context manager; the block is unlinked on exit.
+    """
+    def __init__(self, array: np.ndarray):
+        array = np.ascontiguousarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)[...] = array
+
+    @property
+    def spec(self) -> tuple:
+        """What a worker needs to attach(): (name, shape, dtype)."""
+        return self.shm.name, self.shape, self.dtype
+
+    @staticmethod
+    def attach(name, shape, dtype):
+        """Maps an existing block; returns (SharedMemory, ndarray). Keep the first alive while using the array."""
+        shm = shared_memory.SharedMemory(name=name)
+        return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedBars(SharedArray):
+    """ColumnarBars laid out as one shared (6, n) block: timestamps (as int64 bits) then OHLCV."""
+    def __init__(self, bars: ColumnarBars):
+        block = np.empty((len(_ROWS), len(bars)), dtype=np.float64)
+        block[0] = bars.timestamps.view(np.float64)
+        for row, field in enumerate(BAR_FIELDS, start=1):
+            block[row] = bars[field]
+        super().__init__(block)
+        self.tz = bars.tz
+        self.is_datetime = bars.is_datetime
+
+    @property
+    def spec(self) -> tuple:
+        return super().spec + (self.tz, self.is_datetime)
+
+    @staticmethod
+    def attach(name, shape, dtype, tz=None, is_datetime=True):
+        """Returns (SharedMemory, ColumnarBars) whose columns are views into the block."""
+        shm, block = SharedArray.attach(name, shape, dtype)
+        return shm, ColumnarBars(block[0].view(np.int64), *block[1:], tz=tz, is_datetime=is_datetime)
+
+
+def _attach(bars_spec):
+    """Worker initializer: maps the shared prices once per process."""
+    global _WORKER_SHM, _WORKER_BARS
+    _WORKER_SHM, _WORKER_BARS = SharedBars.attach(*bars_spec)
+
+
+def equity_metrics(equity: np.ndarray, initial_capital: float, index=None, evaluator=None) -> dict:
+    """Runs an equity curve through QuantitativeEvaluator.calculate_metrics."""
+    evaluator = evaluator or QuantitativeEvaluator()
+    df = pd.DataFrame({'Strategy_Return': np.asarray(equity) / initial_capital}, index=index)
+    return evaluator.calculate_metrics(df)
+
+
+def _run_combination(params: dict, mode: str, initial_capital: float) -> dict:
+    bars = _WORKER_BARS
+    if mode == 'vectorized':
+        equity = backtest_moving_average(bars, initial_capital=initial_capital, **params)['equity'].to_numpy()
+    else:
+        portfolio = run_event_driven(bars, initial_capital=initial_capital, **params)
+        equity = np.array([point['equity'] for point in portfolio.equity_curve], dtype=np.float64)
+
+    row = dict(params)
+    row.update(equity_metrics(equity, initial_capital))
+    row['Ending Equity'] = equity[-1] if len(equity) else initial_capital
+    return row
+
+
+def sweep(data, grid: dict, mode: str = 'vectorized', initial_capital: float = 100000.0,
+          max_workers: int = None, chunksize: int = None) -> pd.DataFrame:
+    """
+    Backtests MovingAverageStrategy for every combination in `grid` (e.g.
+    {'fast_period': range(5, 50), 'slow_period': range(20, 200, 5)}) on a process pool.
+    `data` is a DataFrame or ColumnarBars (e.g. from BarStore.read()).
+    `mode` is 'vectorized' (fast) or 'engine' (full TradingEngine run per combination).
+
+    Prices are shared with the workers through shared memory, and combinations are
+    handed out in chunks, so throughput grows with the number of cores.
+    Returns one row of QuantitativeEvaluator metrics per combination.
+    """
+    if mode not in ('vectorized', 'engine'):
+        raise ValueError(f"Unknown sweep mode {mode!r}; use 'vectorized' or 'engine'")
+    bars = data if isinstance(data, ColumnarBars) else ColumnarBars.from_frame(data)
+    combinations = parameter_grid(grid)
+    max_workers = max_workers or os.cpu_count()
+    if chunksize is None:
+        # A few chunks per worker: small enough to balance load, big enough to keep IPC negligible
+        chunksize = max(1, len(combinations) // (max_workers * 4))
+
+    print(f"[SWEEP] {len(combinations)} combinations ({mode}) on {max_workers} workers...")
+    with SharedBars(bars) as shared:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach,
+                                 initargs=(shared.spec,)) as pool:
+            rows = list(pool.map(_run_combination, combinations,
+                                 itertools.repeat(mode), itertools.repeat(initial_capital),
+                                 chunksize=chunksize))
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    import time
+
+    n = 2520
+    prices = 150 + np.cumsum(np.random.default_rng(0).normal(0, 1, n))
+    data = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices},
+                        index=pd.date_range('2013-01-01', periods=n, freq='B'))
+
+    start = time.perf_counter()
+    results = sweep(data, {'fast_period': range(5, 50, 5), 'slow_period': range(50, 250, 10)})
+    print(f"{len(results)} backtests in {time.perf_counter() - start:.2f}s")
+    print(results.sort_values('Sharpe Ratio', ascending=False).head(10).to_string(index=False))
@@ -1,8 +1,13 @@
 import os
 import time
+import inspect
+import asyncio
+import threading
 from typing import Optional
 import queue
+from collections import deque
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 from abc import ABC, abstractmethod 
 # 1. Load the variables from the .env file
@@ -16,7 +21,12 @@ import nest_asyncio
 nest_asyncio.apply()
 
 # from test.test_system.events import MarketEvent
-from events import MarketEvent
+from events import MarketEvent, SignalEvent, OrderEvent, FillEvent, AsyncEventQueue
+from bars import ColumnarBars, BarRingBuffer
+from bar_cache import BarCache, format_duration, parse_bar_size
+from bar_aggregator import BarAggregator
+from contract_cache import ContractCache
+from journal import read_journal
 
 # Utility Functions
 def print_loading_message(message, loop_count = 3, delay=0.3):
@@ -33,10 +43,12 @@ class IBKRConnection():
     def __init__(self, 
                  host = os.getenv("IB_HOST"),   # Local host: "127.0.0.1"
                  client_id = None, 
-                 live_trading=False 
+                 live_trading=False,
+                 bar_cache_dir = os.getenv("IB_BAR_CACHE_DIR", ".bar_cache")    # None disables the local bar cache
                  ):
         self.ib = None            # Pending for get Stock ib instance as dict ['aapl': Stock(...), 'tsla': Stock(...)]
         self.host = host
+        self.bar_cache = BarCache(bar_cache_dir) if bar_cache_dir else None
         # self.client_id = client_id
         if live_trading:
             self.client_id = int(os.getenv("IB_CLIENT_ID"))
@@ -77,7 +89,7 @@ class IBKRConnection():
             print("Not connected to IBKR.")
             return None
         
-    def get_data(self, contract, durationStr="60 D", barSizeSetting="1 hour", whatToShow="TRADES"):
+    def get_data(self, contract, durationStr="60 D", barSizeSetting="1 hour", whatToShow="TRADES", use_cache=True):
         """
         Get historical data for a given contract.
         
@@ -86,6 +98,7 @@ class IBKRConnection():
             - durationStr: time window
             - barSizeSetting: 
             - whatToShow_options:
+            - use_cache: serve from the local bar cache, only downloading missing bars
 
         returns: historical data as a DataFrame
         """
@@ -104,7 +117,9 @@ class IBKRConnection():
             raise ValueError(f"Invalid barSizeSetting option. Choose from {barSizeSetting_options}")
         try:
             ib = self.ib
-            ib.qualifyContracts(contract)
+            if use_cache and self.bar_cache is not None:
+                return self.bar_cache.get_data(ib, contract, durationStr, barSizeSetting, whatToShow)
+            contract = ContractCache(ib).qualify(contract)
             bars = ib.reqHistoricalData(
                 contract,
                 endDateTime='',
@@ -130,75 +145,436 @@ class DataHandler(ABC):
         """Returns the last updated bar for a symbol."""
         pass
 
+    @abstractmethod
+    def get_latest_bars(self, symbol, n):
+        """
+        Returns the last n bars for a symbol as a dict of zero-copy 
+        column views ('datetime', 'open', 'high', 'low', 'close', 'volume').
+        Fewer than n bars are returned until enough history has arrived.
+        """
+        pass
+
+    @abstractmethod
+    def get_latest_datetime(self):
+        """Returns the timestamp of the most recent market update."""
+        pass
+
     @abstractmethod
     def update_bars(self):
         """Pushes the next bar(s) down the queue."""
         pass
 
+    def get_new_bars(self, symbol, seen=None):
+        """
+        (n, marker): how many bars symbol has received since `seen`, the marker an
+        earlier call returned (None: nothing seen yet), and the marker to pass next
+        time. Consumers that must see every bar (IndicatorRegistry, EventJournal)
+        read them with get_latest_bars(symbol, n). This default suits handlers that
+        announce each bar in its own MarketEvent: the marker is the latest bar.
+        """
+        bar = self.get_latest_bar(symbol)
+        if bar is None or bar is seen:
+            return 0, seen
+        return 1, bar
+
     
 
 class HistoricPandasDataHandler(DataHandler):
     """
-    Data handler designed for backtesting. It takes a Pandas DataFrame, 
-    iterates through it row by row, and mimics a live market feed.
+    Data handler designed for backtesting. It converts the Pandas DataFrame 
+    into contiguous NumPy columns once, then replays it by advancing a cursor,
+    mimicking a live market feed without building a dict per bar.
     """
     def __init__(self, events_queue: queue.Queue, data: pd.DataFrame, symbol: str):
         self.events_queue = events_queue
         self.symbol = symbol
-        self.data = data.copy()
-        
-        # We need an iterator to go row by row
-        self.data_generator = self.data.iterrows()
+        self.bars = data if isinstance(data, ColumnarBars) else ColumnarBars.from_frame(data)
         
-        # This will hold the "current" view of the market 
-        # (growing bar by bar, just like in real life)
-        self.latest_data = []
+        # Cursor into self.bars: everything up to and including current_index 
+        # is the "current" view of the market (-1 = nothing replayed yet)
+        self.current_index = -1
+        self.latest_bar = None
         self.continue_backtest = True
 
+    @classmethod
+    def from_store(cls, events_queue: queue.Queue, store, symbol: str, bar_size: str, start=None, end=None, tz=None):
+        """
+        Replays bars straight out of a BarStore memmap, without ever 
+        loading the whole history into a DataFrame.
+        """
+        return cls(events_queue, store.read(symbol, bar_size, start, end, tz=tz), symbol)
+
     def get_latest_bar(self, symbol):
         """Returns the most recent bar from our simulated feed."""
-        if self.latest_data:
-            return self.latest_data[-1]
-        return None
+        return self.latest_bar
+
+    def get_latest_bars(self, symbol, n):
+        """The last n replayed bars, sliced straight out of the column arrays."""
+        return self.bars.window(self.current_index + 1, n)
+
+    def get_latest_datetime(self):
+        return self.latest_bar['datetime'] if self.latest_bar is not None else None
 
     def update_bars(self):
         """
-        Gets the next row from the DataFrame. 
+        Advances the cursor to the next bar. 
         If successful, pushes a MarketEvent to the queue.
         """
-        try:
-            index, row = next(self.data_generator)
-            # Format the incoming row into a dictionary
-            bar = {
-                'symbol': self.symbol,
-                'datetime': index,
-                'open': row['open'],
-                'high': row['high'],
-                'low': row['low'],
-                'close': row['close'],
-                'volume': row.get('volume', 0)
-            }
-            self.latest_data.append(bar)
+        next_index = self.current_index + 1
+        if next_index < len(self.bars):
+            self.current_index = next_index
+            self.latest_bar = self.bars.bar(self.symbol, next_index)
             
             # Announce to the system that new data has arrived!
-            self.events_queue.put(MarketEvent())
-            
-        except StopIteration:
-            # We reached the end of the historical DataFrame
+            self.events_queue.put(MarketEvent(symbols=(self.symbol,)))
+        else:
+            # We reached the end of the historical data
+            self.continue_backtest = False
+
+class StreamingFileDataHandler(DataHandler):
+    """
+    Backtest data handler for histories too big to hold in memory (multi-GB CSV/Parquet).
+    The file is read lazily, chunk by chunk, through a generator pipeline, and a 
+    background thread prefetches the next chunk while the current one is replayed.
+    Peak memory is one chunk being replayed + `prefetch` chunks waiting + a bounded
+    bar history, whatever the size of the file.
+    """
+    _END = object()     # Marks the end of the file in the prefetch queue
+
+    def __init__(self, events_queue: queue.Queue, path: str, symbol: str, chunksize: int = 100000,
+                 history_size: int = 10000, prefetch: int = 1):
+        self.events_queue = events_queue
+        self.path = path
+        self.symbol = symbol
+        self.chunksize = chunksize
+        self.history = BarRingBuffer(history_size)
+        self.latest_bar = None
+        self.continue_backtest = True
+
+        self.chunk = None       # ColumnarBars currently being replayed
+        self.chunk_index = 0    # Next bar to replay within self.chunk
+
+        # Reader thread -> replay loop; maxsize bounds how far ahead we read
+        self._prefetched = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._reader = threading.Thread(target=self._prefetch, daemon=True)
+        self._reader.start()
+
+    def _read_frames(self):
+        """Yields the file as DataFrames of at most `chunksize` rows."""
+        if self.path.endswith(('.parquet', '.pq')):
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("Streaming Parquet files requires pyarrow: pip install pyarrow")
+            for batch in pq.ParquetFile(self.path).iter_batches(batch_size=self.chunksize):
+                yield batch.to_pandas()
+        else:
+            # First column is the bar time (df.to_csv() index, or util.df()'s 'date' column)
+            yield from pd.read_csv(self.path, chunksize=self.chunksize, index_col=0, parse_dates=True)
+
+    def _read_chunks(self):
+        """Yields the file as ColumnarBars, one per chunk."""
+        for frame in self._read_frames():
+            if not frame.empty:
+                yield ColumnarBars.from_frame(frame)
+
+    def _hand_over(self, item) -> bool:
+        """Queues item for the replay loop, giving up (False) if close() is called while the queue is full."""
+        while not self._stop.is_set():
+            try:
+                self._prefetched.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _prefetch(self):
+        """Background thread: keeps the next chunk(s) decoded and ready."""
+        try:
+            for chunk in self._read_chunks():
+                if not self._hand_over(chunk):
+                    return
+            self._hand_over(self._END)
+        except Exception as e:
+            # Hand the failure over to the replay loop instead of dying silently
+            self._hand_over(e)
+
+    def _next_chunk(self):
+        chunk = self._prefetched.get()
+        if isinstance(chunk, Exception):
+            raise chunk
+        return None if chunk is self._END else chunk
+
+    def close(self):
+        """Stops the reader thread early (e.g. when the backtest is interrupted)."""
+        self._stop.set()
+        self.continue_backtest = False
+
+    def get_latest_bar(self, symbol):
+        return self.latest_bar
+
+    def get_latest_bars(self, symbol, n):
+        return self.history.window(n)
+
+    def get_latest_datetime(self):
+        return self.latest_bar['datetime'] if self.latest_bar is not None else None
+
+    def update_bars(self):
+        """Replays the next bar, pulling in the next prefetched chunk when needed."""
+        while self.chunk is None or self.chunk_index >= len(self.chunk):
+            self.chunk = self._next_chunk()
+            self.chunk_index = 0
+            if self.chunk is None:
+                self.continue_backtest = False
+                return
+            self.history.tz = self.chunk.tz
+            self.history.is_datetime = self.chunk.is_datetime
+
+        chunk, i = self.chunk, self.chunk_index
+        self.history.append(chunk.timestamps[i], chunk.open[i], chunk.high[i],
+                            chunk.low[i], chunk.close[i], chunk.volume[i])
+        self.chunk_index = i + 1
+        self.latest_bar = self.history.bar(self.symbol, self.history.latest_index())
+        self.events_queue.put(MarketEvent(symbols=(self.symbol,)))
+
+class HistoricMultiSymbolDataHandler(DataHandler):
+    """
+    Backtest data handler for a whole universe of symbols.
+    Every symbol is converted to columnar arrays, and a merge index over all
+    timestamps is precomputed once. Replay then emits one MarketEvent per 
+    timestamp, listing every symbol that has a bar at that time.
+    """
+    def __init__(self, events_queue: queue.Queue, data: dict):
+        """
+        Args:
+            - events_queue: the engine's event queue
+            - data: {symbol: DataFrame or ColumnarBars}, each sorted by time
+        """
+        self.events_queue = events_queue
+        self.symbols = list(data.keys())
+        self.bars = {
+            symbol: frame if isinstance(frame, ColumnarBars) else ColumnarBars.from_frame(frame)
+            for symbol, frame in data.items()
+        }
+
+        # Precomputed merge index: a stable sort keeps each symbol's own bar order,
+        # then consecutive equal timestamps are grouped into a single update.
+        columns = [self.bars[symbol] for symbol in self.symbols]
+        timestamps = np.concatenate([bars.timestamps for bars in columns])
+        symbol_ids = np.concatenate([np.full(len(bars), k, dtype=np.int32) for k, bars in enumerate(columns)])
+        order = np.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+        self._merge_symbol_ids = symbol_ids[order]
+        self._group_starts = np.flatnonzero(np.r_[True, timestamps[1:] != timestamps[:-1]])
+        self._group_ends = np.r_[self._group_starts[1:], len(timestamps)]
+        self.timestamps = timestamps[self._group_starts]
+
+        self.current_group = -1
+        self.current_index = {symbol: -1 for symbol in self.symbols}
+        self.latest_bars = {symbol: None for symbol in self.symbols}
+        self.continue_backtest = len(self.timestamps) > 0
+
+    def get_latest_bar(self, symbol):
+        return self.latest_bars.get(symbol)
+
+    def get_latest_bars(self, symbol, n):
+        return self.bars[symbol].window(self.current_index[symbol] + 1, n)
+
+    def get_latest_datetime(self):
+        if self.current_group < 0:
+            return None
+        reference = self.bars[self.symbols[0]]
+        return pd.Timestamp(int(self.timestamps[self.current_group]), tz=reference.tz) \
+            if reference.is_datetime else int(self.timestamps[self.current_group])
+
+    def update_bars(self):
+        """
+        Advances every symbol that printed at the next timestamp and pushes 
+        a single MarketEvent covering all of them.
+        """
+        group = self.current_group + 1
+        if group >= len(self.timestamps):
             self.continue_backtest = False
+            return
+
+        self.current_group = group
+        updated = []
+        for k in self._merge_symbol_ids[self._group_starts[group]:self._group_ends[group]].tolist():
+            symbol = self.symbols[k]
+            index = self.current_index[symbol] + 1
+            self.current_index[symbol] = index
+            self.latest_bars[symbol] = self.bars[symbol].bar(symbol, index)
+            updated.append(symbol)
+
+        self.events_queue.put(MarketEvent(symbols=tuple(updated)))
+
+class ReplayDataHandler(DataHandler):
+    """
+    Feeds an EventJournal back into the engine: every journaled MarketEvent is
+    re-emitted, in order, with exactly the bars it announced live, as fast as the
+    engine can take them. The journal's own Signal/Order/Fill events are kept in
+    `recorded` so a replay's decisions can be compared with what happened live.
+    """
+    def __init__(self, events_queue: queue.Queue, path: str):
+        self.events_queue = events_queue
+        self.recorded = []
+        steps = []      # [(symbol, row), ...] per MarketEvent
+        columns = {}    # symbol -> ([timestamps], [open], ..., [volume], tz, is_datetime)
+        for _, event, bars in read_journal(path):
+            if bars is None:
+                self.recorded.append(event)
+                continue
+            step = []
+            for symbol, dt, o, h, l, c, v in bars:
+                if symbol not in columns:
+                    is_datetime = isinstance(dt, pd.Timestamp)
+                    columns[symbol] = ([], [], [], [], [], [], dt.tz if is_datetime else None, is_datetime)
+                column = columns[symbol]
+                step.append((symbol, len(column[0])))
+                column[0].append(dt.value if column[7] else dt)
+                for values, value in zip(column[1:6], (o, h, l, c, v)):
+                    values.append(value)
+            steps.append(tuple(step))
+
+        self.symbols = list(columns)
+        self.bars = {symbol: ColumnarBars(*column[:6], tz=column[6], is_datetime=column[7])
+                     for symbol, column in columns.items()}
+        self.steps = steps
+        self.current_step = -1
+        self.current_index = {symbol: -1 for symbol in self.symbols}
+        self.latest_bars = {symbol: None for symbol in self.symbols}
+        self.latest_datetime = None
+        self.continue_backtest = len(steps) > 0
+        # Single-symbol journals also work with components that read `.symbol`
+        self.symbol = self.symbols[0] if len(self.symbols) == 1 else None
+
+    def get_latest_bar(self, symbol):
+        return self.latest_bars.get(symbol)
+
+    def get_latest_bars(self, symbol, n):
+        return self.bars[symbol].window(self.current_index[symbol] + 1, n)
+
+    def get_latest_datetime(self):
+        return self.latest_datetime
+
+    def update_bars(self):
+        step = self.current_step + 1
+        if step >= len(self.steps):
+            self.continue_backtest = False
+            return
+        self.current_step = step
+        updated = self.steps[step]
+        for symbol, row in updated:
+            self.current_index[symbol] = row
+            self.latest_bars[symbol] = self.bars[symbol].bar(symbol, row)
+        if updated:
+            self.latest_datetime = self.latest_bars[updated[-1][0]]['datetime']
+        self.events_queue.put(MarketEvent(symbols=tuple(dict.fromkeys(symbol for symbol, _ in updated))))
+
+    def get_new_bars(self, symbol, seen=None):
+        # A journaled MarketEvent can hold several bars of one symbol (coalesced live feeds)
+        index = self.current_index[symbol]
+        return index - (seen if seen is not None else -1), index
+
+def _backfill_history(history, aggregator, rows) -> int:
+    """
+    Appends the rows ((timestamp, open, high, low, close, volume), oldest first) that
+    are newer than the newest bar in history, through aggregator when there is one;
+    returns the number of bars added. Used after a warm restart for the bars that
+    came in while the process was down.
+    """
+    last = history.timestamps[history.latest_index()] if len(history) else None
+    added = 0
+    if aggregator is None:
+        for row in rows:
+            if last is None or row[0] > last:
+                history.append(*row)
+                added += 1
+        return added
+
+    if last is not None:
+        last_bucket = aggregator._bucket_of(last)
+        rows = [row for row in rows if aggregator._bucket_of(row[0]) > last_bucket]
+    if rows:
+        aggregator.flush()      # The snapshot stopped mid-bar: rebuild the forming bar from the rows
+    for row in rows:
+        finished = aggregator.update(*row)
+        if finished is not None:
+            history.append(*finished)
+            added += 1
+    return added
+
+def _request_since(ib, contract, bar_size, start) -> list:
+    """Rows (timestamp, open, high, low, close, volume) of contract's bars from `start` (UTC Timestamp) up to now."""
+    bars = ib.reqHistoricalData(
+        contract,
+        endDateTime='',
+        durationStr=format_duration(pd.Timestamp.now(tz='UTC') - start),
+        barSizeSetting=bar_size,
+        whatToShow='TRADES',
+        useRTH=True,
+        formatDate=1
+    )
+    return [(pd.Timestamp(bar.date).value, bar.open, bar.high, bar.low, bar.close, bar.volume) for bar in bars]
+
+def _cover_gap(history, aggregator, rows, bar_length, fetch, symbol) -> list:
+    """
+    The live subscription only reaches back '1 D': if its rows (oldest first) start
+    after the bar that should follow the newest one in history, the span since that
+    bar is requested with fetch(start) and put in front of them. If even that doesn't
+    reach back, the history is dropped, with a warning, and re-seeded from the bars
+    we have instead of resuming across a silent hole. Returns the rows to backfill.
+    """
+    if len(history) == 0:
+        return rows
+    last = int(history.timestamps[history.latest_index()])
+    # The first bar the history still needs: the one after its last (completed) bar
+    needed = last + (aggregator.period if aggregator is not None else bar_length)
+    if rows and rows[0][0] <= needed:
+        return rows
+    since = pd.Timestamp(last, tz='UTC')
+    try:
+        fetched = fetch(since)
+    except Exception as e:
+        print(f"Error fetching {symbol} bars since {since}: {e}")
+        fetched = []
+    earlier = [row for row in fetched if not rows or row[0] < rows[0][0]]
+    if earlier and earlier[0][0] <= needed:
+        return earlier + rows
+    print(f"[BACKFILL] WARNING: no {symbol} bars cover the gap since {since}; re-seeding its history.")
+    history.clear()
+    if aggregator is not None:
+        aggregator.flush()
+    return earlier + rows
 
 class IBKRLiveDataHandler(DataHandler):
     """
     Data handler for LIVE trading. Reuses your ib_insync connection!
     """
-    def __init__(self, events_queue: queue.Queue, ib_conn, contract):
+    def __init__(self, events_queue: queue.Queue, ib_conn, contract, history_size: int = 10000, bar_store=None,
+                 timeframe: str = None):
         self.events_queue = events_queue
         self.ib = ib_conn.get_ib()
         self.contract = contract
         self.latest_bar = None
+        self.bar_size = '1 min'
+        self.continue_backtest = True   # Live feeds never run out of data
+        
+        # Optional BarStore: completed live bars are appended to the same files backtests read
+        self.bar_store = bar_store
+        
+        # Optional coarser timeframe (e.g. '5 mins', '1 hour'): 1 min bars are aggregated
+        # locally and strategies only see (and get MarketEvents for) completed bars
+        self.aggregator = BarAggregator(timeframe) if timeframe else None
         
-        # Qualify the contract (using your exact logic!)
-        self.ib.qualifyContracts(self.contract)
+        # Bounded bar history: old bars are overwritten instead of piling up
+        self.history = BarRingBuffer(history_size)
+        # symbol -> time.perf_counter_ns() the latest bar came in (read by PipelineLatency)
+        self.arrival_ns = {}
+        
+        # Qualify the contract (served from the contract cache when possible)
+        self.contract = ContractCache(self.ib).qualify(self.contract)
 
     def start_live_feed(self):
         """Subscribes to live bar updates from IBKR."""
@@ -209,7 +585,7 @@ class IBKRLiveDataHandler(DataHandler):
             self.contract,
             endDateTime='',
             durationStr='1 D',
-            barSizeSetting='1 min',
+            barSizeSetting=self.bar_size,
             whatToShow='TRADES',
             useRTH=True,
             formatDate=1,
@@ -219,56 +595,443 @@ class IBKRLiveDataHandler(DataHandler):
         # Attach a callback: every time IBKR sends a new bar, run self.on_bar_update
         self.bars.updateEvent += self.on_bar_update
 
+    def _publish(self, timestamp, open, high, low, close, volume):
+        """Adds a bar to the history and announces it to the rest of the system."""
+        self.history.append(timestamp, open, high, low, close, volume)
+        self.latest_bar = self.history.bar(self.contract.symbol, self.history.latest_index())
+        self.events_queue.put(MarketEvent(symbols=(self.contract.symbol,)))
+
     def on_bar_update(self, bars, hasNewBar):
         """Callback triggered automatically by ib_insync."""
         if hasNewBar:
+            self.arrival_ns[self.contract.symbol] = time.perf_counter_ns()
             new_bar = bars[-1]
-            self.latest_bar = {
-                'symbol': self.contract.symbol,
-                'datetime': new_bar.date,
-                'close': new_bar.close
-            }
-            # Announce to the rest of the system!
-            self.events_queue.put(MarketEvent())
+            timestamp = pd.Timestamp(new_bar.date)
+            if len(self.history) == 0:
+                self.history.tz = timestamp.tz
+            
+            # bars[-1] is still forming; bars[-2] has just closed, so that one is final
+            done = bars[-2] if len(bars) > 1 else None
+            if done is not None and self.bar_store is not None:
+                self.bar_store.append(self.contract.symbol, self.bar_size, pd.Timestamp(done.date).value,
+                                      done.open, done.high, done.low, done.close, done.volume)
+            
+            if self.aggregator is None:
+                self._publish(timestamp.value, new_bar.open, new_bar.high, 
+                              new_bar.low, new_bar.close, new_bar.volume)
+            elif done is not None:
+                self.aggregator.tz = timestamp.tz
+                finished = self.aggregator.update(pd.Timestamp(done.date).value, done.open, done.high,
+                                                  done.low, done.close, done.volume)
+                if finished is not None:
+                    self._publish(*finished)
 
     def get_latest_bar(self, symbol):
         return self.latest_bar
+
+    def get_latest_bars(self, symbol, n):
+        return self.history.window(n)
+
+    def snapshot_state(self) -> dict:
+        state = {'history': self.history.snapshot()}
+        if self.aggregator is not None:
+            aggregator = self.aggregator
+            state['aggregator'] = (aggregator.bucket, list(aggregator.current or ()) or None, aggregator.tz)
+        return state
+
+    def restore_state(self, state: dict):
+        self.history.restore(state['history'])
+        if len(self.history):
+            self.latest_bar = self.history.bar(self.contract.symbol, self.history.latest_index())
+        if self.aggregator is not None and 'aggregator' in state:
+            self.aggregator.bucket, self.aggregator.current, self.aggregator.tz = state['aggregator']
+
+    def backfill(self) -> int:
+        """
+        Adds the bars the live subscription holds that are newer than the history
+        (after restore_state: the ones that came in while we were down), requesting
+        whatever the subscription doesn't reach back to; returns how many.
+        Nothing is announced: strategies catch up through the indicators.
+        """
+        bars = getattr(self, 'bars', None)
+        if not bars:
+            return 0
+        tz = pd.Timestamp(bars[0].date).tz
+        if len(self.history) == 0:
+            self.history.tz = tz
+        # Like on_bar_update: bars[-1] goes straight into the history, the aggregator only gets closed bars
+        if self.aggregator is not None:
+            self.aggregator.tz = tz
+            bars = bars[:-1]
+        rows = [(pd.Timestamp(bar.date).value, bar.open, bar.high, bar.low, bar.close, bar.volume) for bar in bars]
+        rows = _cover_gap(self.history, self.aggregator, rows, parse_bar_size(self.bar_size).value,
+                          lambda start: _request_since(self.ib, self.contract, self.bar_size, start),
+                          self.contract.symbol)
+        added = _backfill_history(self.history, self.aggregator, rows)
+        if len(self.history):
+            self.latest_bar = self.history.bar(self.contract.symbol, self.history.latest_index())
+        else:
+            self.latest_bar = None
+        return added
+
+    def get_latest_datetime(self):
+        return self.latest_bar['datetime'] if self.latest_bar is not None else None
     
     def update_bars(self):
         # In live trading with ib_insync, the callback (on_bar_update) 
         # handles the updates asynchronously. We just let it run.
+        # (AsyncTradingEngine never calls this: the callback wakes it directly.)
         self.ib.sleep(0.1)
 
+class IBKRMultiLiveDataHandler(DataHandler):
+    """
+    LIVE data handler for a whole universe of contracts on one IB connection.
+    Each contract is subscribed either with reqHistoricalData(keepUpToDate=True)
+    (completed 1 min bars) or with the lighter reqRealTimeBars (5 sec bars).
+    Updates are coalesced: every symbol updated within `coalesce_interval` seconds
+    is announced in ONE MarketEvent, so a busy open doesn't flood the engine queue.
+    Every bar still goes into the history; get_new_bars() tells how many a symbol
+    got, as there can be more than one behind an announcement.
+    """
+    def __init__(self, events_queue: queue.Queue, ib_conn, contracts: list, use_realtime_bars: bool = False,
+                 coalesce_interval: float = 0.25, history_size: int = 10000, bar_store=None, timeframe: str = None):
+        self.events_queue = events_queue
+        self.ib = ib_conn.get_ib()
+        # One bulk qualification round trip for whatever the contract cache doesn't know yet
+        contracts = ContractCache(self.ib).prewarm(contracts)
+        self.contracts = {contract.symbol: contract for contract in contracts}
+        self.use_realtime_bars = use_realtime_bars
+        self.bar_size = '5 secs' if use_realtime_bars else '1 min'
+        self.coalesce_interval = coalesce_interval
+        self.bar_store = bar_store
+        self.continue_backtest = True   # Live feeds never run out of data
+
+        self.history = {symbol: BarRingBuffer(history_size) for symbol in self.contracts}
+        self.aggregators = {symbol: BarAggregator(timeframe) for symbol in self.contracts} if timeframe else None
+        self.latest_bars = {symbol: None for symbol in self.contracts}
+        self.latest_datetime = None
+        self.subscriptions = {}
+
+        # Symbols updated since the last MarketEvent (dict keeps arrival order)
+        self._pending = {}
+        # symbol -> time.perf_counter_ns() its oldest unannounced bar came in (read by PipelineLatency)
+        self.arrival_ns = {}
+        self._last_flush = time.monotonic()
+        self._flush_timer = None
+
+    def start_live_feed(self):
+        """Subscribes every contract and routes all updates through one callback."""
+        print(f"Subscribing to live data for {len(self.contracts)} contracts...")
+        for symbol, contract in self.contracts.items():
+            if self.use_realtime_bars:
+                bars = self.ib.reqRealTimeBars(contract, 5, 'TRADES', useRTH=True)
+            else:
+                bars = self.ib.reqHistoricalData(
+                    contract,
+                    endDateTime='',
+                    durationStr='1 D',
+                    barSizeSetting=self.bar_size,
+                    whatToShow='TRADES',
+                    useRTH=True,
+                    formatDate=1,
+                    keepUpToDate=True
+                )
+            bars.updateEvent += self.on_bar_update
+            self.subscriptions[symbol] = bars
+
+    def stop_live_feed(self):
+        for bars in self.subscriptions.values():
+            if self.use_realtime_bars:
+                self.ib.cancelRealTimeBars(bars)
+            else:
+                self.ib.cancelHistoricalData(bars)
+        self.subscriptions = {}
+
+    def on_bar_update(self, bars, hasNewBar):
+        """Shared ib_insync callback: records the bar, defers the announcement."""
+        if not hasNewBar:
+            return
+        arrived = time.perf_counter_ns()
+        symbol = bars.contract.symbol
+        if self.use_realtime_bars:
+            # Real-time bars arrive complete; the bar's fields differ slightly from BarData
+            bar = bars[-1]
+            timestamp = pd.Timestamp(bar.time)
+            values = (bar.open_, bar.high, bar.low, bar.close, bar.volume)
+        else:
+            # bars[-1] is still forming; bars[-2] has just closed
+            if len(bars) < 2:
+                return
+            bar = bars[-2]
+            timestamp = pd.Timestamp(bar.date)
+            values = (bar.open, bar.high, bar.low, bar.close, bar.volume)
+
+        if self.bar_store is not None:
+            self.bar_store.append(symbol, self.bar_size, timestamp.value, *values)
+
+        history = self.history[symbol]
+        if len(history) == 0:
+            history.tz = timestamp.tz
+        if self.aggregators is not None:
+            aggregator = self.aggregators[symbol]
+            aggregator.tz = timestamp.tz
+            finished = aggregator.update(timestamp.value, *values)
+            if finished is None:
+                return
+            history.append(*finished)
+        else:
+            history.append(timestamp.value, *values)
+
+        self.latest_bars[symbol] = history.bar(symbol, history.latest_index())
+        if symbol not in self._pending:
+            self.arrival_ns[symbol] = arrived   # Time spent waiting for the batch counts too
+        self._pending[symbol] = None
+        waited = time.monotonic() - self._last_flush
+        if waited >= self.coalesce_interval:
+            self.flush()
+        elif self._flush_timer is None:
+            # Callbacks run on ib_insync's event loop: make sure the batch goes out on time
+            # even if nothing else arrives (AsyncTradingEngine never calls update_bars)
+            self._flush_timer = asyncio.get_event_loop().call_later(self.coalesce_interval - waited, self.flush)
+
+    def flush(self):
+        """Announces every symbol updated since the last flush in a single MarketEvent."""
+        self._last_flush = time.monotonic()
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._pending:
+            symbols = tuple(self._pending)
+            self._pending = {}
+            self.latest_datetime = self.latest_bars[symbols[-1]]['datetime']
+            self.events_queue.put(MarketEvent(symbols=symbols))
+
+    def get_latest_bar(self, symbol):
+        return self.latest_bars.get(symbol)
+
+    def get_latest_bars(self, symbol, n):
+        return self.history[symbol].window(n)
+
+    def get_new_bars(self, symbol, seen=None):
+        # Coalescing only batches the wake-ups: a symbol can get several bars per MarketEvent
+        history = self.history[symbol]
+        return min(history.appended - (seen or 0), len(history)), history.appended
+
+    def snapshot_state(self) -> dict:
+        state = {'history': {symbol: history.snapshot() for symbol, history in self.history.items()}}
+        if self.aggregators is not None:
+            state['aggregators'] = {symbol: (a.bucket, list(a.current or ()) or None, a.tz)
+                                    for symbol, a in self.aggregators.items()}
+        return state
+
+    def restore_state(self, state: dict):
+        for symbol, snapshot in state['history'].items():
+            history = self.history.get(symbol)
+            if history is None:
+                continue    # No longer in the universe
+            history.restore(snapshot)
+            if len(history):
+                self.latest_bars[symbol] = history.bar(symbol, history.latest_index())
+        if self.aggregators is not None:
+            for symbol, (bucket, current, tz) in state.get('aggregators', {}).items():
+                if symbol in self.aggregators:
+                    aggregator = self.aggregators[symbol]
+                    aggregator.bucket, aggregator.current, aggregator.tz = bucket, current, tz
+
+    def backfill(self) -> int:
+        """
+        Adds the bars each subscription holds that are newer than the symbol's history
+        (after restore_state: the ones that came in while we were down), requesting
+        whatever a subscription doesn't reach back to; returns how many in total.
+        Nothing is announced: strategies catch up through the indicators.
+        """
+        total = 0
+        for symbol, bars in self.subscriptions.items():
+            if self.use_realtime_bars:
+                rows = [(pd.Timestamp(bar.time), bar.open_, bar.high, bar.low, bar.close, bar.volume) for bar in bars]
+            else:
+                # bars[-1] is still forming
+                rows = [(pd.Timestamp(bar.date), bar.open, bar.high, bar.low, bar.close, bar.volume)
+                        for bar in bars[:-1]]
+            if not rows:
+                continue
+            history = self.history[symbol]
+            tz = rows[0][0].tz
+            if len(history) == 0:
+                history.tz = tz
+            aggregator = self.aggregators[symbol] if self.aggregators is not None else None
+            if aggregator is not None:
+                aggregator.tz = tz
+            rows = _cover_gap(history, aggregator, [(row[0].value,) + row[1:] for row in rows],
+                              parse_bar_size(self.bar_size).value,
+                              lambda start: _request_since(self.ib, self.contracts[symbol], self.bar_size, start),
+                              symbol)
+            added = _backfill_history(history, aggregator, rows)
+            if len(history) == 0:
+                self.latest_bars[symbol] = None
+            elif added:
+                self.latest_bars[symbol] = history.bar(symbol, history.latest_index())
+                self.latest_datetime = self.latest_bars[symbol]['datetime']
+                total += added
+        return total
+
+    def get_latest_datetime(self):
+        return self.latest_datetime
+
+    def update_bars(self):
+        # Let ib_insync deliver callbacks, then release anything that has waited long enough
+        self.ib.sleep(0.1)
+        if time.monotonic() - self._last_flush >= self.coalesce_interval:
+            self.flush()
+
 class TradingEngine:
+    """
+    Routes events to the handlers subscribed to their class.
+    Several components can listen to the same event type, and handlers run in
+    subscription order. Pass an EventQueue (lock-free deque) for backtests; a 
+    thread-safe queue.Queue still works for live feeds filled from other threads.
+
+    `strategy` may also be a list of strategies: they all read the same data
+    handler, each MarketEvent is fanned out to every one of them (in list order),
+    and their signals go to the shared portfolio, attributed by strategy_id.
+    """
     def __init__(self, data_handler, strategy, portfolio, execution, events_queue):
         self.data_handler = data_handler
-        self.strategy = strategy
+        self.strategies = list(strategy) if isinstance(strategy, (list, tuple)) else [strategy]
+        ids = [getattr(s, 'strategy_id', None) for s in self.strategies]
+        if len(self.strategies) > 1 and len(set(ids)) != len(ids):
+            raise ValueError(f"Strategies sharing an engine need distinct strategy_ids, got {ids}")
+        self.strategy = self.strategies[0]
         self.portfolio = portfolio
         self.execution = execution
         self.events_queue = events_queue
+        
+        self.handlers = {}      # event class -> [handler, ...]
+        self._routes = {}       # event class -> tuple of handlers, including base-class subscribers
+        self.latency = None     # PipelineLatency.attach() sets this to time every handler
+
+        # Shared indicators (IndicatorRegistry) are updated once per bar, before any strategy reads them
+        # (strategies built after the engine feed the registry themselves, see IndicatorRegistry.advance)
+        indicators = getattr(data_handler, 'indicators', None)
+        if indicators is not None:
+            self.subscribe(MarketEvent, indicators.on_market)
+        for strategy in self.strategies:
+            self.subscribe(MarketEvent, strategy.calculate_signals)
+        self.subscribe(MarketEvent, self.portfolio.record_equity)
+        self.subscribe(SignalEvent, self.portfolio.update_signal)
+        self.subscribe(OrderEvent, self.execution.execute_order)
+        self.subscribe(FillEvent, self.portfolio.update_fill)
+
+    def subscribe(self, event_class, handler):
+        """Calls handler(event) for every event of event_class (or a subclass of it)."""
+        self.handlers.setdefault(event_class, []).append(handler)
+        self._routes.clear()
+
+    def unsubscribe(self, event_class, handler):
+        self.handlers[event_class].remove(handler)
+        self._routes.clear()
+
+    def _resolve(self, event_class):
+        """Handlers for a concrete event class: its own first, then its base classes'."""
+        route = tuple(handler for klass in event_class.__mro__ for handler in self.handlers.get(klass, ()))
+        if self.latency is not None:
+            route = self.latency.instrument(event_class, route)
+        self._routes[event_class] = route
+        return route
+
+    def dispatch(self, event):
+        route = self._routes.get(event.__class__)
+        if route is None:
+            route = self._resolve(event.__class__)
+        for handler in route:
+            handler(event)
+
+    def _drain(self):
+        """Processes events until the queue is empty (including events queued meanwhile)."""
+        events_queue = self.events_queue
+        # Bound once per drain; an event class with no handlers caches an empty route (not None)
+        route_of = self._routes.get
+        if isinstance(events_queue, deque):
+            # Lock-free fast path
+            pop = events_queue.popleft
+            while events_queue:
+                event = pop()
+                route = route_of(event.__class__)
+                if route is None:
+                    route = self._resolve(event.__class__)
+                for handler in route:
+                    handler(event)
+        else:
+            while True:
+                try:
+                    event = events_queue.get_nowait()
+                except queue.Empty:
+                    return
+                route = route_of(event.__class__)
+                if route is None:
+                    route = self._resolve(event.__class__)
+                for handler in route:
+                    handler(event)
 
     def run(self):
         print("Starting Trading Engine Loop...")
         try:
             while self.data_handler.continue_backtest:
                 self.data_handler.update_bars()
-                
-                while not self.events_queue.empty():
-                    event = self.events_queue.get()
-                    
-                    if event.type == 'MARKET':
-                        self.strategy.calculate_signals(event)
-                        self.portfolio.record_equity()
-                    elif event.type == 'SIGNAL':
-                        self.portfolio.update_signal(event)
-                    elif event.type == 'ORDER':
-                        self.execution.execute_order(event)
-                    elif event.type == 'FILL':
-                        self.portfolio.update_fill(event)
+                self._drain()
         except KeyboardInterrupt:
             print("\nTrading Engine interrupted by user.")
         print("Trading Engine Stopped.")
         
+class AsyncTradingEngine(TradingEngine):
+    """
+    Event-driven engine for LIVE trading on ib_insync's asyncio loop.
+    Instead of polling (update_bars() -> ib.sleep(0.1) -> drain the queue), it awaits
+    an AsyncEventQueue that the data handler's ib_insync callbacks feed directly, so
+    a bar is handled as soon as it arrives. Handlers may be plain functions or
+    coroutine functions (e.g. AsyncIBKRExecutionHandler.execute_order); coroutines
+    are awaited in subscription order.
+    """
+    def __init__(self, data_handler, strategy, portfolio, execution, events_queue: AsyncEventQueue = None):
+        events_queue = events_queue if events_queue is not None else AsyncEventQueue()
+        super().__init__(data_handler, strategy, portfolio, execution, events_queue)
+        self.running = False
+
+    async def dispatch_async(self, event):
+        route = self._routes.get(event.__class__)
+        if route is None:
+            route = self._resolve(event.__class__)
+        for handler in route:
+            result = handler(event)
+            if result is not None and inspect.isawaitable(result):
+                await result
+
+    async def run_async(self):
+        """Processes events as they arrive until stop() is called. Start the data handler's live feed first."""
+        print("Starting Async Trading Engine...")
+        events_queue = self.events_queue
+        self.running = True
+        try:
+            while self.running:
+                event = await events_queue.get()
+                if event is None:     # stop() sentinel
+                    continue
+                await self.dispatch_async(event)
+        finally:
+            self.running = False
+            print("Async Trading Engine Stopped.")
+
+    def stop(self):
+        self.running = False
+        self.events_queue.put(None)     # Wake run_async() if it is waiting
+
+    def run(self):
+        """Blocking entry point: runs run_async() on ib_insync's event loop."""
+        try:
+            util.run(self.run_async())
+        except KeyboardInterrupt:
+            print("\nTrading Engine interrupted by user.")
+
 # Example usage
 # ib_conn = IBKRConnection(live_trading=False)
 # ib_conn.connect()
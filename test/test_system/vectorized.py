@@ -0,0 +1,214 @@
+import io
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+from bars import ColumnarBars
+from events import EventQueue
+
+# Same trading rules as the event-driven components
+ORDER_QUANTITY = 10             # PortfolioManager: fixed 10 share orders
+MIN_COMMISSION = 1.0            # SimulatedExecutionHandler: $1 minimum ...
+COMMISSION_PER_SHARE = 0.005    # ... or $0.005 per share
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Trailing mean over `window` values along the first axis, NaN until the window
+    is full. `values` is one price series or a (time x symbols) array for a whole
+    universe, which is handled in one pass without a per-symbol loop.
+
+    Uses the same running sum as indicators.SMA (fill the window, then add
+    new - oldest each bar), so results match MovingAverageStrategy bit for bit.
+    Windows holding a NaN (e.g. before a listing) are NaN, like pandas' rolling().mean().
+    """
+    return _rolling_mean(*_prepare(values), window)
+
+
+def _prepare(values):
+    """(values with NaNs zeroed, running count of NaNs or None) for _rolling_mean()."""
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    if not missing.any():
+        return values, None
+    # A NaN would poison every later sum: add zeros instead and mask those windows afterwards.
+    # uint16 counts wrap, but differences over a window stay exact for windows < 65536
+    return np.where(missing, 0.0, values), np.cumsum(missing, axis=0, dtype=np.uint16)
+
+
+def _rolling_mean(values, missing_counts, window):
+    out = np.empty(values.shape)
+    if len(values) < window:
+        out[:] = np.nan
+        return out
+    out[:window - 1] = np.nan
+    # Built in place: a universe is tens of MB per array, so temporaries cost more than the maths
+    steps = np.empty(values.shape)
+    steps[:window] = values[:window]
+    np.subtract(values[window:], values[:-window], out=steps[window:])
+    np.cumsum(steps, axis=0, out=steps)
+    np.divide(steps[window - 1:], window, out=out[window - 1:])
+    if missing_counts is not None:
+        in_window = missing_counts[window - 1:].copy()
+        in_window[1:] -= missing_counts[:-window]
+        out[window - 1:][in_window != 0] = np.nan
+    return out
+
+
+def crossover_state(fast_ma: np.ndarray, slow_ma: np.ndarray) -> np.ndarray:
+    """
+    The position MovingAverageStrategy believes it holds after every bar
+    (1 = long, -1 = short/flat, 0 = no signal yet) given both moving averages.
+    Bars where either MA is NaN are treated as "not enough data yet".
+    """
+    # +1 / -1 where the MAs disagree; equal or not-yet-defined MAs keep the previous state
+    raw = (fast_ma > slow_ma).astype(np.int8) - (fast_ma < slow_ma)
+    # Forward-fill the last non-zero decision (per column for a time x symbols array)
+    rows = np.arange(len(raw)).reshape((-1,) + (1,) * (raw.ndim - 1))
+    last = np.maximum.accumulate(np.where(raw != 0, rows, -1), axis=0)
+    return np.where(last >= 0, np.take_along_axis(raw, np.maximum(last, 0), axis=0), 0)
+
+
+def crossover_signals(fast_ma: np.ndarray, slow_ma: np.ndarray) -> np.ndarray:
+    """
+    The 'Signal' column of src/trading/strategies/moving_average.py for whole arrays:
+    1 on the bar the fast MA crosses above the slow one, -1 when it crosses below,
+    0 otherwise. Works along the first axis, so a (time x symbols) pair of MAs
+    gives every symbol's signals at once.
+    """
+    above = fast_ma > slow_ma
+    below = fast_ma < slow_ma
+    signal = np.zeros(above.shape, dtype=np.int8)
+    signal[1:][above[1:] & below[:-1]] = 1
+    signal[1:][below[1:] & above[:-1]] = -1
+    return signal
+
+
+def universe_crossovers(close, fast_period: int = 10, slow_period: int = 30) -> dict:
+    """
+    Moving averages and crossover signals for a whole universe at once. `close` is
+    a (time x symbols) array or a DataFrame with one column per symbol; returns
+    {'fast_ma', 'slow_ma', 'signal'} of the same shape (DataFrames for a DataFrame).
+    """
+    frame = close if isinstance(close, pd.DataFrame) else None
+    values = close.to_numpy(dtype=np.float64) if frame is not None else np.asarray(close, dtype=np.float64)
+    prepared = _prepare(values)     # Shared by both MAs
+    fast_ma = _rolling_mean(*prepared, fast_period)
+    slow_ma = _rolling_mean(*prepared, slow_period)
+    result = {'fast_ma': fast_ma, 'slow_ma': slow_ma, 'signal': crossover_signals(fast_ma, slow_ma)}
+    if frame is not None:
+        result = {name: pd.DataFrame(array, index=frame.index, columns=frame.columns) for name, array in result.items()}
+    return result
+
+
+def moving_average_state(close: np.ndarray, fast_period: int, slow_period: int):
+    """crossover_state() for a price series, plus both moving averages."""
+    # The strategy takes the fast MA from its slow_period window, so it can never span more bars
+    fast_ma = rolling_mean(close, min(fast_period, slow_period))
+    slow_ma = rolling_mean(close, slow_period)
+    # Before the slow window fills the strategy does not look at the fast MA at all
+    fast_ma[:slow_period - 1] = np.nan
+    return crossover_state(fast_ma, slow_ma), fast_ma, slow_ma
+
+
+def simulate_positions(close: np.ndarray, state: np.ndarray, initial_capital: float = 100000.0) -> dict:
+    """
+    PortfolioManager + SimulatedExecutionHandler over whole arrays: turns the
+    strategy state into holdings, fills at the bar's close, commissions, cash
+    and the equity curve.
+    """
+    # The portfolio only ever holds 0 or ORDER_QUANTITY shares: long on LONG, flat on SHORT
+    holdings = np.where(state == 1, ORDER_QUANTITY, 0)
+    previous = np.r_[0, holdings[:-1]]
+    traded = holdings - previous
+
+    # Cash moves exactly as in PortfolioManager.update_fill, one fill at a time
+    fills = np.flatnonzero(traded)
+    quantity = np.abs(traded[fills])
+    cost = quantity * close[fills]
+    commission = np.maximum(MIN_COMMISSION, quantity * COMMISSION_PER_SHARE)
+    delta = np.where(traded[fills] > 0, -(cost + commission), cost - commission)
+    cash_after_fill = np.cumsum(np.r_[initial_capital, delta])[1:]
+
+    # Cash in hand at the end of each bar
+    cash = np.full(len(close), float(initial_capital))
+    if len(fills):
+        fill_number = np.searchsorted(fills, np.arange(len(close)), side='right') - 1
+        has_filled = fill_number >= 0
+        cash[has_filled] = cash_after_fill[fill_number[has_filled]]
+
+    # Equity is recorded on the MarketEvent, i.e. before that bar's own fill
+    cash_before = np.r_[float(initial_capital), cash[:-1]]
+    equity = cash_before + previous * close
+    return {'holdings': holdings, 'cash': cash, 'equity': equity}
+
+
+def backtest_moving_average(data, fast_period: int = 10, slow_period: int = 30,
+                            initial_capital: float = 100000.0) -> pd.DataFrame:
+    """
+    Whole-array backtest of MovingAverageStrategy + PortfolioManager +
+    SimulatedExecutionHandler: signals, positions, fills at the bar's close,
+    commissions and the equity curve, without a per-bar Python loop.
+
+    Returns one row per bar with 'datetime', 'close', 'signal' (the strategy's
+    state), 'holdings' (shares held after the bar), 'cash' (after the bar's fill)
+    and 'equity' (as PortfolioManager.record_equity sees it: before the bar's fill).
+    """
+    bars = data if isinstance(data, ColumnarBars) else ColumnarBars.from_frame(data)
+    close = bars.close
+    state, _, _ = moving_average_state(close, fast_period, slow_period)
+    result = simulate_positions(close, state, initial_capital)
+
+    return pd.DataFrame({
+        'datetime': bars['datetime'],
+        'close': close,
+        'signal': state,
+        **result,
+    })
+
+
+def run_event_driven(data, symbol: str = 'AAPL', fast_period: int = 10, slow_period: int = 30,
+                     initial_capital: float = 100000.0, verbose: bool = False):
+    """Runs the same setup through TradingEngine; returns the PortfolioManager."""
+    # Imported here: the event-driven stack pulls in ib_insync & friends
+    from systems import HistoricPandasDataHandler, TradingEngine
+    from strategy import MovingAverageStrategy
+    from portfolio_manager import PortfolioManager
+    from execution import SimulatedExecutionHandler
+
+    events_queue = EventQueue()
+    data_handler = HistoricPandasDataHandler(events_queue, data, symbol)
+    strategy = MovingAverageStrategy(events_queue, data_handler, symbol, fast_period=fast_period, slow_period=slow_period)
+    portfolio = PortfolioManager(events_queue, data_handler, initial_capital=initial_capital)
+    execution = SimulatedExecutionHandler(events_queue, data_handler)
+    engine = TradingEngine(data_handler, strategy, portfolio, execution, events_queue)
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        engine.run()
+    return portfolio
+
+
+def verify_against_engine(data, symbol: str = 'AAPL', fast_period: int = 10, slow_period: int = 30,
+                          initial_capital: float = 100000.0) -> pd.DataFrame:
+    """
+    Parity check: asserts the vectorized equity curve is bit-for-bit identical
+    to the event-driven engine's. Returns the vectorized result.
+    """
+    result = backtest_moving_average(data, fast_period, slow_period, initial_capital)
+    portfolio = run_event_driven(data, symbol, fast_period, slow_period, initial_capital)
+
+    engine_equity = np.array([point['equity'] for point in portfolio.equity_curve], dtype=np.float64)
+    vector_equity = result['equity'].to_numpy()
+    if len(engine_equity) != len(vector_equity):
+        raise AssertionError(f"Equity curve length differs: engine {len(engine_equity)}, vectorized {len(vector_equity)}")
+    mismatch = np.flatnonzero(engine_equity != vector_equity)
+    if len(mismatch):
+        i = mismatch[0]
+        raise AssertionError(f"Equity differs from bar {i} ({result['datetime'].iloc[i]}): "
+                             f"engine {engine_equity[i]!r}, vectorized {vector_equity[i]!r}")
+    if portfolio.current_cash != result['cash'].iloc[-1]:
+        raise AssertionError(f"Final cash differs: engine {portfolio.current_cash!r}, "
+                             f"vectorized {result['cash'].iloc[-1]!r}")
+    return result
@@ -0,0 +1,169 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bars import ColumnarBars
+from sweep import SharedArray, SharedBars, parameter_grid, equity_metrics
+from vectorized import rolling_mean, crossover_state, simulate_positions, run_event_driven
+
+# Metrics from QuantitativeEvaluator that can be maximised directly (the others are formatted strings)
+OBJECTIVES = ('Sharpe Ratio', 'Sortino Ratio', 'Ending Equity')
+
+# Set once per worker process by _attach()
+_WORKER_SHM = ()
+_WORKER_BARS = None
+_WORKER_MA = None
+_WORKER_PERIODS = None
+
+
+def walk_forward_windows(n_bars: int, train_size: int, test_size: int) -> list:
+    """
+    Rolling (train_start, train_end, test_end) index triples: each fold optimizes on
+    [train_start, train_end) and is evaluated on the following [train_end, test_end).
+    Folds advance by test_size, so the out-of-sample windows tile the history.
+    """
+    folds = []
+    train_start = 0
+    while train_start + train_size < n_bars:
+        train_end = train_start + train_size
+        folds.append((train_start, train_end, min(train_end + test_size, n_bars)))
+        train_start += test_size
+    return folds
+
+
+def _attach(bars_spec, ma_spec, periods):
+    """Worker initializer: maps the shared prices and moving-average table once per process."""
+    global _WORKER_SHM, _WORKER_BARS, _WORKER_MA, _WORKER_PERIODS
+    bars_shm, _WORKER_BARS = SharedBars.attach(*bars_spec)
+    ma_shm, _WORKER_MA = SharedArray.attach(*ma_spec)
+    _WORKER_SHM = (bars_shm, ma_shm)
+    _WORKER_PERIODS = {period: row for row, period in enumerate(periods)}
+
+
+def _window_ma(period: int, start: int, end: int, warmup: int) -> np.ndarray:
+    """
+    Moving average over bars [start, end) taken from the precomputed full-history table.
+    A trailing mean only looks back, so this is what a run on the window alone computes
+    (up to the last bits: the running sums carry rounding from earlier bars), except for
+    the first `warmup` bars, which such a run has not got data for yet.
+    """
+    ma = _WORKER_MA[_WORKER_PERIODS[period], start:end].copy()
+    ma[:warmup] = np.nan
+    return ma
+
+
+def _in_sample_score(params: dict, start: int, end: int, objective: str, initial_capital: float) -> float:
+    slow_period = params['slow_period']
+    # Same warm-up as MovingAverageStrategy: nothing happens until slow_period bars are in
+    # (and takes the fast MA from that window, so it can never span more than slow_period bars)
+    fast_ma = _window_ma(min(params['fast_period'], slow_period), start, end, slow_period - 1)
+    slow_ma = _window_ma(slow_period, start, end, slow_period - 1)
+    equity = simulate_positions(_WORKER_BARS.close[start:end], crossover_state(fast_ma, slow_ma),
+                                initial_capital)['equity']
+    if objective == 'Ending Equity':
+        return equity[-1]
+    return equity_metrics(equity, initial_capital)[objective]
+
+
+def _run_fold(fold: int, train_start: int, train_end: int, test_end: int,
+              combinations: list, objective: str, initial_capital: float) -> dict:
+    """Optimizes on the in-sample window (vectorized), then runs the winner through TradingEngine out of sample."""
+    bars = _WORKER_BARS
+    scores = [_in_sample_score(params, train_start, train_end, objective, initial_capital)
+              for params in combinations]
+    best = int(np.nanargmax(scores))
+    params = combinations[best]
+
+    # Start the replay slow_period-1 bars early so the MAs are ready on the first test bar,
+    # as they would be live; the warm-up bars can't trade and are dropped from the equity
+    replay_start = max(0, train_end - params['slow_period'] + 1)
+    portfolio = run_event_driven(bars.slice(replay_start, test_end), initial_capital=initial_capital, **params)
+    equity = np.array([point['equity'] for point in portfolio.equity_curve], dtype=np.float64)
+    equity = equity[train_end - replay_start:]
+    timestamps = bars.timestamps[train_end:test_end]
+
+    row = {
+        'fold': fold,
+        'train_start': bars.datetime_at(train_start),
+        'test_start': bars.datetime_at(train_end),
+        'test_end': bars.datetime_at(test_end - 1),
+        **params,
+        f'In-Sample {objective}': scores[best],
+    }
+    row.update(equity_metrics(equity, initial_capital))
+    row['Ending Equity'] = equity[-1]
+    return {'row': row, 'timestamps': timestamps, 'equity': equity}
+
+
+def walk_forward(data, grid: dict, train_size: int, test_size: int, objective: str = 'Sharpe Ratio',
+                 initial_capital: float = 100000.0, max_workers: int = None) -> dict:
+    """
+    Walk-forward optimization of MovingAverageStrategy. `data` is a DataFrame or
+    ColumnarBars; `grid` a parameter grid like sweep()'s; window sizes are in bars.
+
+    Every moving average the grid needs is computed once over the whole history and
+    shared with the workers, so overlapping in-sample windows never recompute them.
+    Folds run in parallel: each picks the combination with the best in-sample
+    `objective` (vectorized) and replays it out of sample through HistoricPandasDataHandler,
+    MovingAverageStrategy and TradingEngine, warmed up on the bars just before the test window.
+
+    Returns {'folds': per-fold DataFrame, 'equity': stitched out-of-sample equity curve,
+    'metrics': QuantitativeEvaluator metrics of the stitched curve}.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {OBJECTIVES}, not {objective!r}")
+    bars = data if isinstance(data, ColumnarBars) else ColumnarBars.from_frame(data)
+    combinations = parameter_grid(grid)
+    folds = walk_forward_windows(len(bars), train_size, test_size)
+    if not folds:
+        raise ValueError(f"Need more than train_size={train_size} bars, got {len(bars)}")
+
+    periods = sorted({p for params in combinations
+                      for p in (min(params['fast_period'], params['slow_period']), params['slow_period'])})
+    ma_table = np.vstack([rolling_mean(bars.close, period) for period in periods])
+
+    max_workers = min(max_workers or os.cpu_count(), len(folds))
+    print(f"[WALK-FORWARD] {len(folds)} folds x {len(combinations)} combinations on {max_workers} workers...")
+    with SharedBars(bars) as shared_bars, SharedArray(ma_table) as shared_ma:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach,
+                                 initargs=(shared_bars.spec, shared_ma.spec, periods)) as pool:
+            futures = [pool.submit(_run_fold, i, *fold, combinations, objective, initial_capital)
+                       for i, fold in enumerate(folds)]
+            results = [f.result() for f in futures]
+
+    # Orders are a fixed size, so P&L (not returns) is what carries from one fold into the next
+    stitched = []
+    carry = 0.0
+    for result in results:
+        stitched.append(result['equity'] + carry)
+        carry += result['equity'][-1] - initial_capital
+    equity = pd.DataFrame({
+        'datetime': bars._datetimes(np.concatenate([r['timestamps'] for r in results])),
+        'equity': np.concatenate(stitched),
+    })
+    if bars.is_datetime and bars.tz is not None:
+        equity['datetime'] = equity['datetime'].dt.tz_localize('UTC').dt.tz_convert(bars.tz)
+
+    return {
+        'folds': pd.DataFrame([r['row'] for r in results]),
+        'equity': equity,
+        'metrics': equity_metrics(equity['equity'].to_numpy(), initial_capital),
+    }
+
+
+if __name__ == "__main__":
+    import time
+
+    n = 2520 * 4
+    prices = 150 + np.cumsum(np.random.default_rng(0).normal(0, 1, n))
+    data = pd.DataFrame({'open': prices, 'high': prices + 1, 'low': prices - 1, 'close': prices},
+                        index=pd.date_range('1990-01-01', periods=n, freq='B'))
+
+    start = time.perf_counter()
+    report = walk_forward(data, {'fast_period': range(5, 50, 5), 'slow_period': range(50, 250, 10)},
+                          train_size=756, test_size=252)
+    print(f"Walk-forward done in {time.perf_counter() - start:.2f}s")
+    print(report['folds'].to_string(index=False))
+    print(report['metrics'])